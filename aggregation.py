@@ -0,0 +1,289 @@
+import numpy as np
+
+from noaa_records import NoaaRecord
+
+
+class RecordColumns:
+    def __init__(self, datatype, value, date, station, datatypes, stations):
+        '''The purpose of this function is to hold NOAA records as columns instead of a list of dictionaries. Each
+        page of a CDO answer, each cached day and each archive slice is turned into columns as soon as it is read, and
+        the columns are handed to every summary and plot of the fetch; indexing or looping over them still gives one
+        record at a time, as a NoaaRecord.
+        :param values: self = current instance of RecordColumns, datatype = int8 array of datatype codes, value =
+        float64 array of values, date = datetime64[D] array of dates, station = int32 array of station codes,
+        datatypes = list of datatype ids indexed by code, stations = list of station ids indexed by code
+        :return: none
+        '''
+        self.datatype = datatype
+        self.value = value
+        self.date = date
+        self.station = station
+        self.datatypes = list(datatypes)
+        self.stations = list(stations)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        return NoaaRecord(f"{self.date[index]}T00:00:00", self.datatypes[self.datatype[index]],
+                          self.stations[self.station[index]], "", float(self.value[index]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __add__(self, other):
+        return RecordColumns.concat([self, as_columns(other)])
+
+    def __radd__(self, other):
+        return RecordColumns.concat([as_columns(other), self])
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.float64), np.zeros(0, dtype="datetime64[D]"),
+                   np.zeros(0, dtype=np.int32), [], [])
+
+    @classmethod
+    def from_records(cls, records):
+        '''The purpose of this function is to convert NOAA weather data dictionaries into columns.
+        :param values: cls = RecordColumns, records = list of weather data dictionaries
+        :return: RecordColumns
+        '''
+        count = len(records)
+        value = np.fromiter((record["value"] for record in records), dtype=np.float64, count=count)
+
+        # Codes are handed out in order of first appearance. Dates repeat across stations and datatypes, so each
+        # distinct one is parsed once
+        date_codes = {}
+        date = np.fromiter((date_codes.setdefault(record["date"], len(date_codes)) for record in records),
+                           dtype=np.int32, count=count)
+        date = np.array([text[:10] for text in date_codes], dtype="datetime64[D]")[date]
+        datatype_codes = {}
+        datatype = np.fromiter((datatype_codes.setdefault(record["datatype"], len(datatype_codes))
+                                for record in records), dtype=np.int8, count=count)
+        station_codes = {}
+        station = np.fromiter((station_codes.setdefault(record["station"], len(station_codes))
+                               for record in records), dtype=np.int32, count=count)
+        return cls(datatype, value, date, station, datatype_codes, station_codes)
+
+    @classmethod
+    def concat(cls, parts):
+        '''The purpose of this function is to join several sets of columns, like the years of a streamed fetch, into
+        one. The datatype and station codes of each part are mapped onto the joined lists of ids.
+        :param values: cls = RecordColumns, parts = list of RecordColumns
+        :return: RecordColumns
+        '''
+        parts = [part for part in parts if len(part)]
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return cls.empty()
+        datatype_codes, station_codes = {}, {}
+        datatypes, stations = [], []
+        for part in parts:
+            datatype_map = np.array([datatype_codes.setdefault(datatype_id, len(datatype_codes))
+                                     for datatype_id in part.datatypes], dtype=np.int8)
+            station_map = np.array([station_codes.setdefault(station_id, len(station_codes))
+                                    for station_id in part.stations], dtype=np.int32)
+            datatypes.append(datatype_map[part.datatype])
+            stations.append(station_map[part.station])
+        return cls(np.concatenate(datatypes), np.concatenate([part.value for part in parts]),
+                   np.concatenate([part.date for part in parts]), np.concatenate(stations), datatype_codes,
+                   station_codes)
+
+    def to_dicts(self):
+        '''The purpose of this function is to turn the columns back into weather data dictionaries in the CDO
+        format, like for the day cache. The CDO measurement flags are not kept in the columns, so attributes is empty.
+        :param values: self = current instance of RecordColumns
+        :return: list of weather data dictionaries
+        '''
+        dates = np.datetime_as_string(self.date).tolist()
+        return [{"date": f"{date}T00:00:00", "datatype": self.datatypes[datatype], "station": self.stations[station],
+                 "attributes": "", "value": value}
+                for date, datatype, station, value in zip(dates, self.datatype.tolist(), self.station.tolist(),
+                                                          self.value.tolist())]
+
+    def select(self, rows):
+        '''The purpose of this function is to keep some of the records, with the same datatype and station lists.
+        :param values: self = current instance of RecordColumns, rows = boolean mask or array of row positions
+        :return: RecordColumns
+        '''
+        return RecordColumns(self.datatype[rows], self.value[rows], self.date[rows], self.station[rows],
+                             self.datatypes, self.stations)
+
+    def of_datatype(self, datatype_id):
+        if datatype_id not in self.datatypes:
+            return self.select(np.zeros(len(self), dtype=bool))
+        return self.select(self.datatype == self.datatypes.index(datatype_id))
+
+    def datatype_ids(self):
+        return [self.datatypes[code] for code in np.unique(self.datatype)]
+
+    def sorted_by_date(self):
+        # A stable sort keeps the order of the records of each day
+        return self.select(np.argsort(self.date, kind="stable"))
+
+    def years(self):
+        return self.date.astype("datetime64[Y]").astype(np.int32) + 1970
+
+    def month_days(self):
+        '''The purpose of this function is to number each record's day of the year as month * 100 + day, like 1225
+        for 12-25, which orders the days like their MM-DD.
+        :param values: self = current instance of RecordColumns
+        :return: int32 array
+        '''
+        months = self.date.astype("datetime64[M]")
+        days = (self.date - months).astype(np.int32) + 1
+        return (months.astype(np.int32) % 12 + 1) * 100 + days
+
+    def range_years(self, date_range):
+        '''The purpose of this function is to find which year's range each record belongs to, like
+        DateRange.range_year does for one date.
+        :param values: self = current instance of RecordColumns, date_range = date_ranges.DateRange
+        :return: int32 array of the years the ranges end in
+        '''
+        years = self.years()
+        if date_range.wraps:
+            years = years + (self.month_days() >= date_range.start[0] * 100 + date_range.start[1])
+        return years
+
+
+def as_columns(records):
+    # Records fetched by the app are already columns; lists of dictionaries, like recorded fixtures, are converted
+    if isinstance(records, RecordColumns):
+        return records
+    return RecordColumns.from_records(records)
+
+
+class Aggregates:
+    def __init__(self, datatypes, years, stations, count, total, positive, minimum, maximum):
+        '''The purpose of this function is to hold the grouped sums of a set of records. count, total and positive
+        are arrays shaped (datatype, year, station); minimum and maximum are per datatype.
+        :param values: self = current instance of Aggregates, datatypes = list of datatype ids, years = array of
+        years, stations = list of station ids, count = array of record counts, total = array of value sums,
+        positive = array of counts of values above zero, minimum = array of smallest values, maximum = array of
+        largest values
+        :return: none
+        '''
+        self.datatypes = datatypes
+        self.years = years
+        self.stations = stations
+        self.count = count
+        self.total = total
+        self.positive = positive
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def _index(self, datatype):
+        return self.datatypes.index(datatype) if datatype in self.datatypes else None
+
+    def record_count(self, datatype):
+        index = self._index(datatype)
+        return 0 if index is None else int(self.count[index].sum())
+
+    def mean(self, datatype, default=0.0):
+        '''The purpose of this function is to get the average value of a datatype over every year and station.
+        :param values: self = current instance of Aggregates, datatype = string of datatype id, default = value
+        returned when there are no records
+        :return: float of the average
+        '''
+        index = self._index(datatype)
+        if index is None or self.count[index].sum() == 0:
+            return default
+        return float(self.total[index].sum() / self.count[index].sum())
+
+    def positive_fraction(self, datatype):
+        '''The purpose of this function is to get the share of records of a datatype with a value above zero, like
+        the share of days with snow.
+        :param values: self = current instance of Aggregates, datatype = string of datatype id
+        :return: float between 0 and 1
+        '''
+        index = self._index(datatype)
+        if index is None or self.count[index].sum() == 0:
+            return 0.0
+        return float(self.positive[index].sum() / self.count[index].sum())
+
+    def value_range(self, datatype):
+        index = self._index(datatype)
+        if index is None or self.count[index].sum() == 0:
+            return None
+        return float(self.minimum[index]), float(self.maximum[index])
+
+    def year_means(self, datatype):
+        '''The purpose of this function is to get the average value of a datatype for each year that has records.
+        :param values: self = current instance of Aggregates, datatype = string of datatype id
+        :return: tuple of a list of years and a list of averages
+        '''
+        index = self._index(datatype)
+        if index is None:
+            return [], []
+        counts = self.count[index].sum(axis=1)
+        totals = self.total[index].sum(axis=1)
+        present = counts > 0
+        return self.years[present].tolist(), (totals[present] / counts[present]).tolist()
+
+    def station_means(self, datatype):
+        '''The purpose of this function is to get the average value of a datatype for each station that has records.
+        :param values: self = current instance of Aggregates, datatype = string of datatype id
+        :return: dictionary of station id to average
+        '''
+        index = self._index(datatype)
+        if index is None:
+            return {}
+        counts = self.count[index].sum(axis=0)
+        totals = self.total[index].sum(axis=0)
+        return {self.stations[station]: float(totals[station] / counts[station])
+                for station in np.flatnonzero(counts)}
+
+
+def aggregate(columns):
+    '''The purpose of this function is to compute per-datatype, per-year and per-station counts and sums in one
+    vectorised pass. Every record is given a single group number for its (datatype, year, station) and the groups
+    are summed with bincount, so the narrower totals are just sums over the resulting array.
+    :param values: columns = RecordColumns
+    :return: Aggregates
+    '''
+    datatype_count = len(columns.datatypes)
+    station_count = len(columns.stations)
+    if len(columns) == 0:
+        empty = np.zeros((datatype_count, 0, station_count))
+        return Aggregates(columns.datatypes, np.zeros(0, dtype=np.int32), columns.stations, empty, empty, empty,
+                          np.zeros(datatype_count), np.zeros(datatype_count))
+
+    years = columns.years()
+    first_year = int(years.min())
+    year_count = int(years.max()) - first_year + 1
+    shape = (datatype_count, year_count, station_count)
+
+    group = (columns.datatype.astype(np.int64) * year_count + (years - first_year)) * station_count \
+        + columns.station
+    size = datatype_count * year_count * station_count
+    values = columns.value
+    count = np.bincount(group, minlength=size).reshape(shape)
+    total = np.bincount(group, weights=values, minlength=size).reshape(shape)
+    positive = np.bincount(group, weights=values > 0, minlength=size).reshape(shape)
+
+    minimum = np.full(datatype_count, np.inf)
+    maximum = np.full(datatype_count, -np.inf)
+    np.minimum.at(minimum, columns.datatype, values)
+    np.maximum.at(maximum, columns.datatype, values)
+
+    return Aggregates(columns.datatypes, np.arange(first_year, first_year + year_count), columns.stations, count,
+                      total, positive, minimum, maximum)
+
+
+def aggregate_records(records):
+    return aggregate(as_columns(records))
+
+
+def range_year_means(columns, datatype, date_range):
+    '''The purpose of this function is to average a datatype over each year's range of days, so a winter from
+    December to February counts as one value.
+    :param values: columns = RecordColumns, datatype = string of datatype id, date_range = date_ranges.DateRange
+    :return: tuple of a list of years the ranges end in and a list of averages
+    '''
+    columns = columns.of_datatype(datatype)
+    years, positions = np.unique(columns.range_years(date_range), return_inverse=True)
+    totals = np.bincount(positions, weights=columns.value, minlength=len(years))
+    counts = np.bincount(positions, minlength=len(years))
+    return years.tolist(), (totals / counts).tolist()
@@ -0,0 +1,137 @@
+'''Canvas animations of the main menu, all driven by one shared Tk timer.
+
+The timer runs at most DEFAULT_FPS frames per second (set WEATHER_WRANGLER_FPS to change it, or to 0 to turn the
+animations off) and stops completely while the app window is minimised or another window has the focus, so an idle
+app does not keep redrawing.
+'''
+import math
+import os
+import time
+from tkinter import EventType, PhotoImage, TclError
+
+
+DEFAULT_FPS = 30
+FPS_ENV = "WEATHER_WRANGLER_FPS"
+
+# Longest step an animation takes in one frame, so a late frame does not jump items across the canvas
+MAX_FRAME_SECONDS = 0.25
+
+
+def configured_fps():
+    try:
+        return max(0, int(os.environ.get(FPS_ENV, DEFAULT_FPS)))
+    except ValueError:
+        return DEFAULT_FPS
+
+
+def load_scaled_image(path, max_width):
+    '''The purpose of this function is to load an image once and shrink it to fit a width, so the canvas never has
+    to scale it while animating. Tk only shrinks by whole factors, so the result can be narrower than max_width.
+    :param values: path = string of PNG or GIF file path, max_width = integer of widest allowed size in pixels
+    :return: PhotoImage, or None if the file is missing or cannot be read
+    '''
+    try:
+        image = PhotoImage(file=path)
+    except TclError as e:
+        print(f"Error: Unable to load image {path}: {e}")
+        return None
+    factor = math.ceil(image.width() / max_width)
+    return image.subsample(factor) if factor > 1 else image
+
+
+class DriftAnimation:
+    def __init__(self, canvas, item, speed, start_x, end_x, y):
+        '''The purpose of this function is to move a canvas item across at a steady speed, starting over when it
+        leaves the canvas.
+        :param values: self = current instance of DriftAnimation, canvas = Tk Canvas, item = canvas item id, speed =
+        float of pixels per second, start_x = float of x where it starts, end_x = float of x where it starts over,
+        y = float of y of the item
+        :return: none
+        '''
+        self.canvas = canvas
+        self.item = item
+        self.speed = speed
+        self.start_x = start_x
+        self.end_x = end_x
+        self.y = y
+        # The position is kept here, so a frame is one coords call instead of reading it back from Tk
+        self.x = start_x
+
+    def step(self, elapsed):
+        self.x += self.speed * elapsed
+        if self.x >= self.end_x:
+            self.x = self.start_x
+        self.canvas.coords(self.item, self.x, self.y)
+
+
+class Animator:
+    def __init__(self, root, fps=None):
+        '''The purpose of this function is to set up the shared timer that steps every animation of a window.
+        :param values: self = current instance of Animator, root = Tk root window, fps = integer of most frames per
+        second (defaults to WEATHER_WRANGLER_FPS or DEFAULT_FPS, 0 turns animations off)
+        :return: none
+        '''
+        self.root = root
+        self.animations = []
+        self.after_id = None
+        self.last_frame = None
+        self.mapped = True
+        self.focused = True
+        self.set_fps(configured_fps() if fps is None else fps)
+
+        root.bind("<Map>", self._on_map, add="+")
+        root.bind("<Unmap>", self._on_map, add="+")
+        # Focus events of every widget of the window reach the root; the check runs once they have settled
+        root.bind("<FocusIn>", lambda event: root.after_idle(self._check_focus), add="+")
+        root.bind("<FocusOut>", lambda event: root.after_idle(self._check_focus), add="+")
+
+    def set_fps(self, fps):
+        self.interval_ms = round(1000 / fps) if fps > 0 else None
+        self._update()
+
+    def add(self, animation):
+        self.animations.append(animation)
+        self._update()
+
+    def remove(self, animation):
+        if animation in self.animations:
+            self.animations.remove(animation)
+        self._update()
+
+    @property
+    def running(self):
+        return bool(self.animations) and self.interval_ms is not None and self.mapped and self.focused
+
+    def _on_map(self, event):
+        # Child widgets being shown or hidden send these events too; only the window itself counts
+        if event.widget is self.root:
+            self.mapped = event.type == EventType.Map
+            self._update()
+
+    def _check_focus(self):
+        try:
+            widget = self.root.focus_get()
+        except (KeyError, TclError):
+            # Some ttk popups have no Tkinter widget; they never belong to the main window
+            widget = None
+        self.focused = widget is not None and widget.winfo_toplevel() is self.root
+        self._update()
+
+    def _update(self):
+        # Start the timer when there is something to draw, stop it when there is not
+        if self.running and self.after_id is None:
+            self.last_frame = None
+            self.after_id = self.root.after(self.interval_ms, self._frame)
+        elif not self.running and self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _frame(self):
+        self.after_id = None
+        now = time.monotonic()
+        elapsed = self.interval_ms / 1000 if self.last_frame is None else min(now - self.last_frame, MAX_FRAME_SECONDS)
+        self.last_frame = now
+        for animation in list(self.animations):
+            animation.step(elapsed)
+        if self.running:
+            self.after_id = self.root.after(self.interval_ms, self._frame)
@@ -0,0 +1,241 @@
+'''Compare the historical weather of one date across many cities.
+
+Run from the project folder:
+    python batch.py 12-25 London Paris "New York"
+    python batch.py 12-25 --csv cities.csv --output comparison.csv
+    python batch.py 12-25 --csv cities.csv --pattern TMAX --plot comparison.png
+    python batch.py 12-25 London Paris --start-year 1994 --end-year 2023
+
+Cities are looked up and fetched in parallel. The NOAA requests of every city share the per-token concurrency bound
+and rate limit, so a long list only queues behind the quota instead of exceeding it. Setting the cancel event of a
+comparison stops the requests in flight and skips the cities that have not started.
+'''
+import argparse
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import weather_core
+
+
+# Cities worked on at once; their NOAA requests are bounded separately by the token quota
+BATCH_WORKERS = 8
+
+# Columns of the comparison table, in order
+TABLE_COLUMNS = ["city", "avg_temp_max_f", "avg_temp_min_f", "avg_precipitation_mm", "snow_probability",
+                 "record_count", "error"]
+COLUMN_TITLES = {
+    "city": "City",
+    "avg_temp_max_f": "Avg Max (°F)",
+    "avg_temp_min_f": "Avg Min (°F)",
+    "avg_precipitation_mm": "Avg Precip (mm)",
+    "snow_probability": "Snow (%)",
+    "record_count": "Records",
+    "error": "Error",
+}
+
+
+def read_cities(path):
+    '''The purpose of this function is to read a list of cities from a CSV file. The cities are taken from a column
+    named "city" when there is one, and from the first column otherwise.
+    :param values: path = string of CSV file path
+    :return: list of city names
+    '''
+    with open(path, newline="", encoding="utf-8") as source:
+        rows = [row for row in csv.reader(source) if row and row[0].strip()]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "city" in header:
+        column = header.index("city")
+        return [row[column].strip() for row in rows[1:] if len(row) > column and row[column].strip()]
+    return [row[0].strip() for row in rows]
+
+
+def parse_cities(text):
+    # One city per line, or separated by semicolons; commas are kept since names like "Paris, FR" use them
+    return [city.strip() for line in text.splitlines() for city in line.split(";") if city.strip()]
+
+
+def fetch_city(city, month, day, data_types, start_year=None, end_year=None, cancel=None):
+    '''The purpose of this function is to look up one city and get its NOAA records for a date.
+    :param values: city = string of city name, month = integer of month, day = integer of day, data_types = string
+    of comma separated NOAA datatype ids, start_year = integer of first year, end_year = integer of last year,
+    cancel = threading.Event that aborts the remaining requests when set
+    :return: tuple of the location and aggregation.RecordColumns of its records
+    '''
+    location = weather_core.lookup_location_id(city)
+    if not location:
+        raise LookupError(weather_core.location_not_found_message(city))
+    lat, lon = location
+    return location, weather_core.fetch_noaa_historical_data(lat, lon, month, day, data_types, start_year, end_year,
+                                                             cancel)
+
+
+def city_row(city, month, day, start_year=None, end_year=None, cancel=None):
+    '''The purpose of this function is to compute the historical prediction of one city as a row of the comparison
+    table. Errors are reported in the row so one bad city does not stop the batch.
+    :param values: city = string of city name, month = integer of month, day = integer of day, start_year =
+    integer of first year, end_year = integer of last year, cancel = threading.Event that aborts the remaining
+    requests when set
+    :return: dictionary with the city, its location and the values of summarize_historical_data, or an error
+    '''
+    try:
+        location = weather_core.lookup_location_id(city)
+        if not location:
+            raise LookupError(weather_core.location_not_found_message(city))
+        lat, lon = location
+        prediction = weather_core.historical_prediction(lat, lon, month, day, start_year, end_year, cancel)
+    except Exception as e:
+        return {"city": city, "error": str(e)}
+    if prediction is None:
+        return {"city": city, "lat": lat, "lon": lon, "error": "No historical data available"}
+    return dict(prediction, city=city, lat=lat, lon=lon)
+
+
+def cancelled(cancel):
+    return cancel is not None and cancel.is_set()
+
+
+def compare_cities(cities, month, day, workers=BATCH_WORKERS, on_row=None, start_year=None, end_year=None,
+                   cancel=None):
+    '''The purpose of this function is to compute the historical prediction of many cities for the same date, with
+    the cities fetched in parallel.
+    :param values: cities = list of city names, month = integer of month, day = integer of day, workers = integer
+    of cities fetched at once, on_row = function called with each row as soon as it is ready, start_year = integer
+    of first year, end_year = integer of last year, cancel = threading.Event that stops the comparison when set
+    :return: list of row dictionaries in the order of the cities, without the cities stopped by cancel
+    '''
+    def run(city):
+        if cancelled(cancel):
+            return None
+        row = city_row(city, month, day, start_year, end_year, cancel)
+        # A city cut short by cancel has an incomplete prediction, so it is dropped rather than shown
+        if cancelled(cancel):
+            return None
+        if on_row is not None:
+            on_row(row)
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(cities)))) as pool:
+        return [row for row in pool.map(run, cities) if row is not None]
+
+
+def compare_patterns(cities, month, day, pattern, workers=BATCH_WORKERS, start_year=None, end_year=None,
+                     cancel=None):
+    '''The purpose of this function is to get the yearly series of one pattern for many cities, for a multi-line
+    plot. Cities without records for the pattern, or stopped by cancel, are left out.
+    :param values: cities = list of city names, month = integer of month, day = integer of day, pattern = string of
+    NOAA pattern code, workers = integer of cities fetched at once, start_year = integer of first year, end_year =
+    integer of last year, cancel = threading.Event that stops the comparison when set
+    :return: dictionary of city name to a tuple of a list of years and a list of averages
+    '''
+    def run(city):
+        if cancelled(cancel):
+            return city, ([], [])
+        try:
+            _, data = fetch_city(city, month, day, pattern, start_year, end_year, cancel)
+        except Exception as e:
+            print(f"Error: {city}: {e}")
+            return city, ([], [])
+        if cancelled(cancel):
+            return city, ([], [])
+        return city, weather_core.weather_pattern_series(data, pattern)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(cities)))) as pool:
+        return {city: series for city, series in pool.map(run, cities) if series[0]}
+
+
+def comparison_figure(series, pattern, month, day):
+    '''The purpose of this function is to draw the yearly series of several cities as one line each.
+    :param values: series = dictionary of city name to a tuple of years and averages, pattern = string of NOAA
+    pattern code, month = integer of month, day = integer of day
+    :return: matplotlib Figure
+    '''
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    draw_comparison(fig, series, pattern, month, day)
+    return fig
+
+
+def draw_comparison(fig, series, pattern, month, day):
+    '''The purpose of this function is to (re)draw the multi-city plot on an existing Figure, so the GUI can reuse
+    the figure of its comparison window.
+    :param values: fig = matplotlib Figure, series = dictionary of city name to a tuple of years and averages,
+    pattern = string of NOAA pattern code, month = integer of month, day = integer of day
+    :return: none
+    '''
+    fig.clear()
+    ax = fig.add_subplot()
+    for city, (years, values) in series.items():
+        ax.plot(years, values, marker="o", linestyle="-", label=city)
+
+    label = weather_core.PATTERN_LABELS.get(pattern, "Value")
+    ax.set_title(f"{label} on {month:02d}-{day:02d}", fontsize=15)
+    ax.set_xlabel("Year", fontsize=12)
+    ax.set_ylabel(label, fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    if series:
+        ax.legend(fontsize=9)
+    fig.tight_layout()
+
+
+def format_table(rows):
+    '''The purpose of this function is to lay out comparison rows as a plain text table.
+    :param values: rows = list of row dictionaries
+    :return: string of the table
+    '''
+    columns = [column for column in TABLE_COLUMNS if column != "error" or any("error" in row for row in rows)]
+    lines = [[COLUMN_TITLES[column] for column in columns]]
+    lines += [[str(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max(len(line[index]) for line in lines) for index in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in lines)
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.DictWriter(output, fieldnames=["city", "lat", "lon"] + TABLE_COLUMNS[1:], extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the historical weather of a date across cities")
+    parser.add_argument("date", help="date in MM-DD format")
+    parser.add_argument("cities", nargs="*", help="city names")
+    parser.add_argument("--csv", help="CSV file with a 'city' column (or cities in the first column)")
+    parser.add_argument("--output", help="write the comparison table to this CSV file")
+    parser.add_argument("--pattern", help="NOAA pattern code to plot, like TMAX")
+    parser.add_argument("--plot", help="PNG file for the multi-city plot of --pattern")
+    parser.add_argument("--start-year", type=int, default=weather_core.HISTORY_START_YEAR)
+    parser.add_argument("--end-year", type=int, default=weather_core.HISTORY_END_YEAR)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    args = parser.parse_args()
+
+    try:
+        month, day = weather_core.parse_month_day(args.date)
+        weather_core.history_years(args.start_year, args.end_year)
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(1)
+    cities = list(args.cities) + (read_cities(args.csv) if args.csv else [])
+    if not cities:
+        print("Error: No cities given.")
+        sys.exit(1)
+
+    rows = compare_cities(cities, month, day, args.workers, start_year=args.start_year, end_year=args.end_year)
+    print(format_table(rows))
+    if args.output:
+        write_csv(rows, args.output)
+
+    if args.pattern:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        pattern = args.pattern.upper()
+        if pattern not in weather_core.PATTERN_LABELS:
+            print(f"Error: Pattern '{pattern}' is not available.")
+            sys.exit(1)
+        series = compare_patterns(cities, month, day, pattern, args.workers, args.start_year, args.end_year)
+        fig = comparison_figure(series, pattern, month, day)
+        FigureCanvasAgg(fig).print_png(args.plot or f"comparison_{pattern}.png")
@@ -0,0 +1,95 @@
+'''Compares the original per-record loop of process_historical_data with the vectorised aggregation module.
+
+Run from the project folder:
+    python -m benchmarks.bench_aggregation --records 200000
+'''
+import argparse
+import random
+import time
+
+from aggregation import RecordColumns, aggregate
+
+
+def synthetic_records(count, seed=7):
+    '''The purpose of this function is to build CDO style records spread over thirty years and fifty stations.
+    :param values: count = integer of records, seed = integer random seed
+    :return: list of weather data dictionaries
+    '''
+    generator = random.Random(seed)
+    data_types = ["TMAX", "TMIN", "PRCP", "SNOW", "TAVG"]
+    records = []
+    for _ in range(count):
+        records.append({
+            "date": f"{generator.randint(1994, 2023)}-12-25T00:00:00",
+            "datatype": generator.choice(data_types),
+            "station": f"GHCND:US{generator.randint(0, 49):09d}",
+            "attributes": ",,W,",
+            "value": round(generator.uniform(-20, 30), 1),
+        })
+    return records
+
+
+def loop_aggregate(data):
+    # The loop process_historical_data used before the aggregation module, plus the per-year pass of the plot
+    avg_temp_max = avg_temp_min = total_precipitation = 0
+    count_temp_max = count_temp_min = count_precipitation = count_snow = 0
+    snow_days = 0
+    for record in data:
+        if record["datatype"] == "TMAX":
+            avg_temp_max += record["value"]
+            count_temp_max += 1
+        elif record["datatype"] == "TMIN":
+            avg_temp_min += record["value"]
+            count_temp_min += 1
+        elif record["datatype"] == "PRCP":
+            total_precipitation += record["value"]
+            count_precipitation += 1
+        elif record["datatype"] == "SNOW":
+            count_snow += 1
+            if record["value"] > 0:
+                snow_days += 1
+
+    year_values = {}
+    for record in data:
+        if record["datatype"] == "TMAX":
+            year_values.setdefault(int(record["date"][:4]), []).append(record["value"])
+    year_means = {year: sum(values) / len(values) for year, values in year_values.items()}
+
+    return (avg_temp_max / count_temp_max, avg_temp_min / count_temp_min, total_precipitation / count_precipitation,
+            snow_days / count_snow, year_means)
+
+
+def best_of(repeats, function, *args):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark historical data aggregation")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records)
+
+    loop_time, loop_result = best_of(args.repeats, loop_aggregate, records)
+    decode_time, columns = best_of(args.repeats, RecordColumns.from_records, records)
+    aggregate_time, stats = best_of(args.repeats, aggregate, columns)
+
+    years, means = stats.year_means("TMAX")
+    if abs(stats.mean("TMAX") - loop_result[0]) > 1e-3 or abs(means[0] - loop_result[4][years[0]]) > 1e-3:
+        print("Warning: vectorised results do not match the loop")
+
+    print(f"records:                 {args.records}")
+    print(f"python loop:             {loop_time * 1000:.1f} ms")
+    print(f"decode to columns:       {decode_time * 1000:.1f} ms (once per fetch)")
+    print(f"vectorised aggregation:  {aggregate_time * 1000:.1f} ms "
+          f"(per-datatype, per-year and per-station statistics)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+'''Compares the old one-after-another NOAA year loop with the pooled fetch in noaa_client.
+
+Run from the project folder:
+    python -m benchmarks.bench_noaa_concurrency --rtt 1.0
+
+The pool sends at most five requests per token at once and at most five per second, so the ten yearly requests go
+out in two waves. With an RTT of one second or more that is about 2 x RTT against about 10 x RTT for the old loop.
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import requests
+
+from benchmarks.stub_server import run_stub_server
+from noaa_cache import NoaaDayCache
+from noaa_client import fetch_noaa_years
+
+
+def fetch_serially(endpoint, years, month, day):
+    '''The purpose of this function is to repeat the original loop from fetch_noaa_historical_data as the baseline.
+    :param values: endpoint = string of stub data endpoint, years = list of integer years, month = integer of month,
+    day = integer of day
+    :return: list of weather data dictionaries
+    '''
+    results = []
+    for year in years:
+        date = f"{year}-{month:02d}-{day:02d}"
+        params = {"datasetid": "GHCND", "datatypeid": "TMAX,TMIN,PRCP,SNOW", "startdate": date, "enddate": date,
+                  "limit": 1000, "units": "metric", "latitude": 40.7, "longitude": -74.0}
+        response = requests.get(endpoint, headers={"token": "bench"}, params=params)
+        results.extend(response.json().get("results", []))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial and pooled NOAA year fetches")
+    parser.add_argument("--rtt", type=float, default=1.0, help="injected round-trip time in seconds")
+    args = parser.parse_args()
+
+    years = list(range(2014, 2024))
+    with run_stub_server(latency=args.rtt) as server:
+        endpoint = f"{server.base_url}/cdo-web/api/v2/data"
+
+        start = time.perf_counter()
+        serial = fetch_serially(endpoint, years, 12, 25)
+        serial_time = time.perf_counter() - start
+
+        # A fresh cache file so earlier runs cannot answer from disk
+        with tempfile.TemporaryDirectory() as folder:
+            cache = NoaaDayCache(os.path.join(folder, "bench.sqlite3"))
+            start = time.perf_counter()
+            pooled = fetch_noaa_years(40.7, -74.0, 12, 25, "bench", years, endpoint=endpoint, cache=cache)
+            pooled_time = time.perf_counter() - start
+            cache.close()
+
+    # The pooled fetch gives columns, which do not keep the CDO measurement flags
+    if [(record["date"], record["datatype"], record["station"], record["value"]) for record in serial] != \
+            [(record["date"], record["datatype"], record["station"], record["value"]) for record in pooled]:
+        print("Warning: pooled results do not match the serial results")
+    print(f"serial: {serial_time:.2f}s ({serial_time / args.rtt:.1f} x RTT)")
+    print(f"pooled: {pooled_time:.2f}s ({pooled_time / args.rtt:.1f} x RTT)")
+
+
+if __name__ == "__main__":
+    main()
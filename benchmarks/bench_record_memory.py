@@ -0,0 +1,110 @@
+'''Measures the memory and decode time of NOAA records kept as JSON dictionaries and as RecordColumns.
+
+Run from the project folder:
+    python -m benchmarks.bench_record_memory --records 1000000
+
+The records are encoded as CDO /data pages of 1000 results, like the API sends them, and every variant decodes all
+the pages and keeps the records, as a multi-year, multi-station fetch does. The dictionaries were turned into columns
+once the fetch was done, so that step is timed with them; the app now turns each page into columns as soon as it is
+decoded. Memory is what tracemalloc sees still allocated once the pages are decoded, so it covers the records and
+what holds them, not the page bytes. The time is taken in a separate run without tracemalloc, which slows allocation
+down.
+'''
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+import noaa_records
+from aggregation import RecordColumns
+from noaa_client import PAGE_LIMIT
+from noaa_records import decode_page
+
+
+def synthetic_pages(count, seed=7):
+    '''The purpose of this function is to encode CDO style records of thirty years and fifty stations as pages.
+    :param values: count = integer of records, seed = integer random seed
+    :return: list of bytes, one CDO /data answer per page
+    '''
+    generator = random.Random(seed)
+    data_types = ["TMAX", "TMIN", "PRCP", "SNOW", "TAVG"]
+    pages = []
+    for offset in range(0, count, PAGE_LIMIT):
+        results = [{
+            "date": f"{generator.randint(1994, 2023)}-{generator.randint(1, 12):02d}-{generator.randint(1, 28):02d}"
+                    "T00:00:00",
+            "datatype": generator.choice(data_types),
+            "station": f"GHCND:US{generator.randint(0, 49):09d}",
+            "attributes": ",,W,",
+            "value": round(generator.uniform(-20, 30), 1),
+        } for _ in range(min(PAGE_LIMIT, count - offset))]
+        pages.append(json.dumps({"metadata": {"resultset": {"offset": offset + 1, "count": count,
+                                                            "limit": PAGE_LIMIT}},
+                                 "results": results}).encode("utf-8"))
+    return pages
+
+
+def decode_dicts(pages):
+    # How request_page decoded the pages before the columns, keeping every dictionary until the fetch was done
+    records = []
+    for page in pages:
+        records.extend(json.loads(page).get("results", []))
+    return records
+
+
+def decode_columns(pages):
+    # How fetch_span decodes the pages now
+    return RecordColumns.concat([RecordColumns.from_records(decode_page(page).get("results", [])) for page in pages])
+
+
+def decode_columns_json(pages):
+    # The standard json path, measured even when orjson is installed
+    return RecordColumns.concat([RecordColumns.from_records(json.loads(page).get("results", [])) for page in pages])
+
+
+def measure(decode, pages):
+    '''The purpose of this function is to time the decoding of every page, then decode them again while tracing the
+    allocations.
+    :param values: decode = function turning the pages into records, pages = list of bytes
+    :return: tuple of the records, the bytes still allocated, the peak bytes and the seconds taken
+    '''
+    gc.collect()
+    start = time.perf_counter()
+    decode(pages)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    records = decode(pages)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, current, peak, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory of decoded NOAA records")
+    parser.add_argument("--records", type=int, default=1000000)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.records)
+    print(f"records: {args.records}, pages: {len(pages)}, orjson: {'yes' if noaa_records.orjson else 'no'}")
+
+    records, baseline, peak, seconds = measure(decode_dicts, pages)
+    _, _, _, columns_seconds = measure(RecordColumns.from_records, records)
+    print(f"{'JSON dictionaries (before)':30} {baseline / 2 ** 20:8.1f} MiB ({baseline / len(records):5.1f} "
+          f"bytes/record), peak {peak / 2 ** 20:7.1f} MiB, decode {seconds:6.2f} s + columns {columns_seconds:.2f} s")
+    del records
+
+    variants = [("RecordColumns per page, json", decode_columns_json)]
+    if noaa_records.orjson is not None:
+        variants.append(("RecordColumns per page, orjson", decode_columns))
+    for name, decode in variants:
+        records, current, peak, seconds = measure(decode, pages)
+        print(f"{name:30} {current / 2 ** 20:8.1f} MiB ({current / len(records):5.1f} bytes/record, "
+              f"{current / baseline:4.0%} of before), peak {peak / 2 ** 20:7.1f} MiB, decode {seconds:6.2f} s")
+        del records
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+'''Runs the app's main user paths against the local stub server and reports throughput and latency percentiles.
+
+Run from the project folder:
+    python -m benchmarks.bench_scenarios
+    python -m benchmarks.bench_scenarios historical pattern --iterations 20 --latency 0.2 --page-size 250 \
+        --json results.json
+
+Scenarios:
+    current_weather   OpenWeatherMap lookup of one city, with the answer cache emptied first
+    historical        historical prediction of one MM-DD over the history window
+    pattern           available datatypes, one month of a pattern over the history window, and its PNG plot
+    batch             historical prediction of every city for one MM-DD
+
+Each iteration asks for a day, month or window that was not fetched before, so the NOAA requests are really sent
+(add --warm to repeat the first query and measure the cached path instead). The app runs with a fresh data folder,
+no GHCND archive or climatology, and its NOAA and OpenWeatherMap API addresses pointed at the stub, which emulates
+the paging, the per-token quota and the round-trip time of the real APIs. No API keys are needed.
+
+The report has, per scenario, the latency percentiles of one iteration, the operations per second, the requests the
+stub answered (and throttled), and the HTTP latency and cache hit ratios traced inside the app. --json writes it as
+JSON ("-" for stdout).
+'''
+import argparse
+import datetime
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_server import run_stub_server, STUB_CITIES
+
+
+SCENARIOS = ["current_weather", "historical", "pattern", "batch"]
+
+# Environment variables of the API addresses the app uses, and the path of each API on the stub
+API_PATHS = {
+    "WEATHER_WRANGLER_NOAA_API": "/cdo-web/api/v2",
+    "WEATHER_WRANGLER_GHCND_FILES": "/pub/data/ghcn/daily",
+    "WEATHER_WRANGLER_OPENWEATHER_API": "/data/2.5",
+}
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def percentile(values, percent):
+    '''The purpose of this function is to read a percentile from sorted values, interpolating between neighbours.
+    :param values: values = sorted list of numbers, percent = float between 0 and 100
+    :return: float of the percentile
+    '''
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def latency_summary(seconds):
+    values = sorted(second * 1000 for second in seconds)
+    summary = {"min": values[0], "mean": statistics.fmean(values), "max": values[-1]}
+    summary.update({f"p{percent}": percentile(values, percent) for percent in PERCENTILES})
+    return {name: round(value, 3) for name, value in summary.items()}
+
+
+def load_app(data_dir, stub_url):
+    '''The purpose of this function is to import the app against a fresh data folder and the stub server, with
+    benchmark API keys.
+    :param values: data_dir = string of empty data folder, stub_url = string of the stub server's base url
+    :return: tuple of the weather_core, batch, http_transport and tracing modules
+    '''
+    # The data folder and API addresses are read when the app modules are imported, so they are set before any is
+    os.environ["WEATHER_WRANGLER_DATA"] = data_dir
+    for env, path in API_PATHS.items():
+        os.environ[env] = stub_url + path
+    os.environ["WEATHER_WRANGLER_BACKEND"] = "api"
+    os.environ["WEATHER_WRANGLER_OPENWEATHER_KEY"] = os.environ["WEATHER_WRANGLER_NOAA_TOKEN"] = "bench"
+
+    import batch
+    import http_transport
+    import tracing
+    import weather_core
+    return weather_core, batch, http_transport, tracing
+
+
+def day_of_iteration(iteration, warm):
+    # A different day of the (leap) year for every iteration, unless the cached path is measured
+    date = datetime.date(2024, 1, 1) + datetime.timedelta(days=0 if warm else iteration % 366)
+    return date.month, date.day
+
+
+def make_scenarios(weather_core, batch, cities, warm):
+    '''The purpose of this function is to build one function per scenario that runs a single iteration.
+    :param values: weather_core = app module, batch = app module, cities = list of city names, warm = True to repeat
+    the same query every iteration
+    :return: dictionary of scenario name to a function of the iteration number returning the operations it did
+    '''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from date_ranges import MONTH_NAMES
+    from owm_client import current_weather_cache
+
+    def location(city):
+        lat, lon = weather_core.lookup_location_id(city)
+        return lat, lon
+
+    def current_weather(iteration):
+        if not warm:
+            current_weather_cache.clear()
+        city = cities[0 if warm else iteration % len(cities)]
+        weather_core.current_weather_summary(weather_core.fetch_openweather_data(city))
+        return 1
+
+    def historical(iteration):
+        month, day = day_of_iteration(iteration, warm)
+        if weather_core.historical_prediction(*location(cities[0]), month, day) is None:
+            raise RuntimeError("no historical prediction")
+        return 1
+
+    def pattern(iteration):
+        # A new month for each iteration, then an older history window once all twelve were fetched
+        step = 0 if warm else iteration
+        month = step % 12 + 1
+        end_year = weather_core.HISTORY_END_YEAR - 10 * (step // 12)
+        start_year = end_year - (weather_core.HISTORY_END_YEAR - weather_core.HISTORY_START_YEAR)
+        date_range = weather_core.parse_date_range(MONTH_NAMES[month - 1])
+        lat, lon = location(cities[0])
+        weather_core.available_pattern_types(lat, lon, start_year, end_year)
+        data = weather_core.fetch_noaa_range_data(lat, lon, date_range, "TMAX", start_year, end_year)
+        years, values = weather_core.range_pattern_series(data, "TMAX", date_range)
+        fig = weather_core.weather_pattern_figure(years, values, "TMAX", cities[0], month, 1, date_range.label())
+        FigureCanvasAgg(fig).print_png(io.BytesIO())
+        return 1
+
+    def batch_query(iteration):
+        month, day = day_of_iteration(iteration, warm)
+        rows = batch.compare_cities(cities, month, day)
+        failed = [row["city"] for row in rows if "error" in row]
+        if failed:
+            raise RuntimeError(f"no prediction for {', '.join(failed)}")
+        return len(rows)
+
+    return {"current_weather": current_weather, "historical": historical, "pattern": pattern, "batch": batch_query}
+
+
+def run_scenario(run, iterations, server, tracing):
+    '''The purpose of this function is to time the iterations of one scenario after one untimed warm-up iteration.
+    :param values: run = function running one iteration, iterations = integer of timed iterations, server = running
+    stub server, tracing = app tracing module
+    :return: dictionary of the scenario results
+    '''
+    # The warm-up loads matplotlib, the station index and the connections; it uses the last iteration's query so the
+    # timed ones are still cold
+    run(iterations)
+    tracing.metrics.clear()
+    requests_before, throttled_before = server.request_count, server.throttled_count
+
+    latencies, operations = [], 0
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        iteration_start = time.perf_counter()
+        operations += run(iteration)
+        latencies.append(time.perf_counter() - iteration_start)
+    wall = time.perf_counter() - start
+
+    traced = tracing.snapshot()
+    http = {}
+    for histogram in traced["histograms"]:
+        if histogram["name"] == "http_request_seconds":
+            http[histogram["labels"]["endpoint"]] = {"requests": histogram["count"],
+                                                     "mean_ms": round(histogram["sum"] / histogram["count"] * 1000, 3)}
+    return {
+        "iterations": iterations,
+        "operations": operations,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(operations / wall, 3),
+        "latency_ms": latency_summary(latencies),
+        "stub_requests": server.request_count - requests_before,
+        "stub_throttled": server.throttled_count - throttled_before,
+        "http": http,
+        "cache_hit_ratios": {cache: round(ratio, 3) for cache, ratio in traced["cache_hit_ratios"].items()},
+    }
+
+
+def print_report(report):
+    settings = report["settings"]
+    print(f"stub latency {settings['latency']}s, page size {settings['page_size']}, "
+          f"{settings['rate_limit']} requests/s per token, {'warm' if settings['warm'] else 'cold'} queries")
+    for name, result in report["scenarios"].items():
+        latency = result["latency_ms"]
+        print(f"{name}: {result['throughput_per_second']:.2f} ops/s, p50 {latency['p50']:.1f} ms, "
+              f"p90 {latency['p90']:.1f} ms, p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms, "
+              f"{result['stub_requests']} requests ({result['stub_throttled']} throttled)")
+        if result["cache_hit_ratios"]:
+            ratios = ", ".join(f"{cache} {ratio:.0%}" for cache, ratio in result["cache_hit_ratios"].items())
+            print(f"    cache hits: {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's user paths against a local API stub")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, from: {', '.join(SCENARIOS)} (all by default)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub round-trip time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="most random seconds added to the latency")
+    parser.add_argument("--rate-limit", type=int, default=5, help="CDO requests per second per token")
+    parser.add_argument("--page-size", type=int, default=1000, help="most records per CDO page")
+    parser.add_argument("--cities", default="London;New York;Paris;Chicago;Tokyo",
+                        help=f"cities separated by semicolons, from: {', '.join(STUB_CITIES)}")
+    parser.add_argument("--warm", action="store_true", help="repeat the same query to measure the cached path")
+    parser.add_argument("--json", help="write the report as JSON to this file, or - for stdout")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    cities = [city.strip() for city in args.cities.split(";") if city.strip()]
+    report = {"settings": {"latency": args.latency, "jitter": args.jitter, "rate_limit": args.rate_limit,
+                           "page_size": args.page_size, "iterations": args.iterations, "warm": args.warm,
+                           "cities": cities},
+              "scenarios": {}}
+
+    with tempfile.TemporaryDirectory() as data_dir, \
+            run_stub_server(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                            max_page=args.page_size) as server:
+        weather_core, batch, http_transport, tracing = load_app(data_dir, server.base_url)
+        # The app loads the station index in the background; the benchmark waits for it so every run uses it
+        from stations import load_station_index
+        load_station_index()
+        tracing.enable()
+
+        scenarios = make_scenarios(weather_core, batch, cities, args.warm)
+        for name in args.scenarios or SCENARIOS:
+            report["scenarios"][name] = run_scenario(scenarios[name], args.iterations, server, tracing)
+        http_transport.close_sessions()
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as output:
+                json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
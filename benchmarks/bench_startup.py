@@ -0,0 +1,87 @@
+'''Measures how long the app modules take to import, using python -X importtime, to catch startup regressions.
+
+Run from the project folder:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup gui updatedgui weather_core --repeats 7 --max-ms 300
+
+Every run is a fresh interpreter, so nothing is shared between runs except the compiled .pyc files (the first run is
+not counted). The report lists the median import time of each module, the modules that cost the most, and any heavy
+module (matplotlib, NumPy, Pillow, Basemap, requests) that was imported eagerly when it should load on first use.
+The exit status is 1 when a heavy module is imported or a module is slower than --max-ms.
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Modules that must not be imported just to open the main window
+HEAVY_MODULES = ["matplotlib", "numpy", "PIL", "mpl_toolkits", "requests"]
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    '''The purpose of this function is to import a module in a fresh interpreter and read its -X importtime report.
+    :param values: module = string of module name
+    :return: dictionary of module name to a tuple of self and cumulative import time in microseconds
+    '''
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=PROJECT_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def heavy_imports(times):
+    return sorted({name.split(".")[0] for name in times if name.split(".")[0] in HEAVY_MODULES})
+
+
+def measure(module, repeats):
+    '''The purpose of this function is to import a module several times and keep the median of its import time.
+    :param values: module = string of module name, repeats = integer of counted runs
+    :return: tuple of the median cumulative milliseconds and the import times of the last run
+    '''
+    import_times(module)
+    runs = [import_times(module) for _ in range(repeats)]
+    return statistics.median(run[module][1] for run in runs) / 1000, runs[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup import time of the app")
+    parser.add_argument("modules", nargs="*", default=["gui"], help="modules to import, like gui or service")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to list")
+    parser.add_argument("--max-ms", type=float, help="fail when a module takes longer than this to import")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        median_ms, times = measure(module, args.repeats)
+        print(f"{module}: {median_ms:.1f} ms (median of {args.repeats})")
+
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"    {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+        heavy = heavy_imports(times)
+        if heavy:
+            print(f"    eagerly imported: {', '.join(heavy)}")
+            failed = True
+        if args.max_ms is not None and median_ms > args.max_ms:
+            print(f"    slower than {args.max_ms:.0f} ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
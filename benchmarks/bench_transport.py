@@ -0,0 +1,72 @@
+'''Compares bare requests.get calls with the pooled sessions from http_transport over HTTPS.
+
+Run from the project folder:
+    python -m benchmarks.bench_transport --connect-delay 0.1
+
+A throwaway self-signed certificate is made with the openssl command line tool. The ten NOAA year requests are
+sent one after another both ways, so the difference is the TCP and TLS setup that keep-alive saves.
+'''
+import argparse
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+
+import requests
+
+from benchmarks.stub_server import run_stub_server
+from http_transport import http_get, close_sessions
+
+
+def make_certificate(folder):
+    '''The purpose of this function is to create a self-signed certificate for 127.0.0.1.
+    :param values: folder = string of folder to write the key and certificate to
+    :return: tuple of certificate path and key path
+    '''
+    cert_path = os.path.join(folder, "stub.pem")
+    key_path = os.path.join(folder, "stub.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", key_path, "-out", cert_path, "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1"],
+                   check=True, capture_output=True)
+    return cert_path, key_path
+
+
+def run_loop(get, endpoint, cert_path):
+    params = {"datasetid": "GHCND", "datatypeid": "TMAX,TMIN,PRCP,SNOW", "limit": 1000, "units": "metric"}
+    start = time.perf_counter()
+    for year in range(2014, 2024):
+        date = f"{year}-12-25"
+        get(endpoint, params=dict(params, startdate=date, enddate=date), headers={"token": "bench"},
+            verify=cert_path).json()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bare requests against pooled keep-alive sessions")
+    parser.add_argument("--connect-delay", type=float, default=0.1,
+                        help="extra seconds charged to every new connection to emulate handshake round-trips")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        cert_path, key_path = make_certificate(folder)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+
+        with run_stub_server(ssl_context=context, connect_delay=args.connect_delay) as server:
+            endpoint = f"{server.base_url}/cdo-web/api/v2/data"
+
+            bare_time = run_loop(requests.get, endpoint, cert_path)
+            bare_connections = server.connection_count
+
+            pooled_time = run_loop(http_get, endpoint, cert_path)
+            pooled_connections = server.connection_count - bare_connections
+            close_sessions()
+
+    print(f"bare requests.get: {bare_time:.3f}s, {bare_connections} TLS handshakes")
+    print(f"pooled session:    {pooled_time:.3f}s, {pooled_connections} TLS handshakes")
+
+
+if __name__ == "__main__":
+    main()
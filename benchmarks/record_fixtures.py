@@ -0,0 +1,60 @@
+'''Records real OpenWeatherMap and NOAA CDO answers into benchmarks/fixtures for the stub server to replay.
+
+Run from the project folder, with the API keys in api.py:
+    python -m benchmarks.record_fixtures --date "12-20 to 12-31"
+
+The current weather of every city is kept under its lower case name, and the CDO records of the date or range over
+the history window are kept for the first city. The stub serves these records for any station it is asked about,
+and replays them for the days that were not recorded. Recording again replaces the set committed in
+benchmarks/fixtures.
+'''
+import argparse
+import json
+import os
+
+from benchmarks.stub_server import city_key, FIXTURES_DIR, STUB_CITIES
+
+
+def write_fixture(name, payload, folder=FIXTURES_DIR):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, "w", encoding="utf-8") as fixture_file:
+        json.dump(payload, fixture_file)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record API answers for the benchmark stub server")
+    parser.add_argument("--cities", default=";".join(city.title() for city in STUB_CITIES),
+                        help="cities separated by semicolons (every stub city by default)")
+    parser.add_argument("--date", default="12-20 to 12-31", help="MM-DD, range of days, month or season")
+    parser.add_argument("--years", default=None, help="history window as YYYY-YYYY")
+    args = parser.parse_args()
+
+    # The live APIs need the keys, so the app is only imported once the arguments are valid
+    import weather_core
+
+    cities = [city.strip() for city in args.cities.split(";") if city.strip()]
+    weather = {}
+    for city in cities:
+        weather_data = weather_core.fetch_openweather_data(city)
+        if weather_data:
+            weather[city_key(city)] = weather_data
+        else:
+            print(f"Error: no current weather for {city}")
+    print(f"Wrote {len(weather)} cities to {write_fixture('owm_weather.json', weather)}")
+
+    location = weather_core.lookup_location_id(cities[0])
+    if not location:
+        print(f"Error: unable to find {cities[0]}")
+        return
+    years = weather_core.parse_year_window(args.years or "")
+    date_range = weather_core.parse_date_range(args.date)
+    records = weather_core.fetch_noaa_range_data(*location, date_range, weather_core.ALL_DATA_TYPES, years[0],
+                                                 years[-1])
+    # The fetch gives the records as columns; the stub serves them as the API's dictionaries
+    print(f"Wrote {len(records)} records to {write_fixture('cdo_data.json', records.to_dicts())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+'''Local stand-in for the NOAA CDO and OpenWeatherMap APIs, used by the benchmarks.
+
+It answers the CDO /data endpoint with the real paging (offset, limit and metadata.resultset), the /stations and
+/datatypes metadata endpoints, the GHCND station list and inventory files, and the OpenWeatherMap /weather endpoint.
+Every response can be delayed by a fixed latency plus random jitter, pages can be capped below the 1000 records of
+the real API, and a per-token quota answers 429 with Retry-After like CDO does when a client goes over it.
+
+Answers come from the responses kept in benchmarks/fixtures (see benchmarks.record_fixtures): the current weather of
+every stub city and the CDO records of one date range. A CDO query for other days replays the kept days under the
+dates asked for. Only a city or datatypes missing from the fixtures, or an empty fixtures folder, get answers
+generated, with the same shape, from the query itself.
+'''
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+# Stations reported by the stub for every query by coordinates
+STUB_STATIONS = ["GHCND:USW00014732", "GHCND:USW00094728", "GHCND:USC00305801"]
+
+# Cities the stub knows, with the coordinates OpenWeatherMap answers for them
+STUB_CITIES = {
+    "london": (51.5085, -0.1257),
+    "new york": (40.7143, -74.006),
+    "paris": (48.8534, 2.3488),
+    "chicago": (41.85, -87.65),
+    "tokyo": (35.6895, 139.6917),
+    "sydney": (-33.8679, 151.2073),
+    "denver": (39.7392, -104.9847),
+    "seattle": (47.6062, -122.3321),
+}
+
+# Every station of the stub station list has these elements for these years
+STUB_ELEMENTS = ["TMAX", "TMIN", "PRCP", "SNOW", "TAVG"]
+STUB_YEARS = (1950, 2024)
+
+# Recorded responses written by benchmarks.record_fixtures
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# The real CDO API never returns more than this many records per page
+CDO_MAX_PAGE = 1000
+
+
+def load_fixtures(folder=FIXTURES_DIR):
+    '''The purpose of this function is to read the recorded API responses the stub answers with.
+    :param values: folder = string of fixtures folder
+    :return: dictionary with "weather" (city to OpenWeatherMap answer) and "records" (list of CDO records), empty
+    when nothing was recorded
+    '''
+    fixtures = {"weather": {}, "records": []}
+    for name, key in (("owm_weather.json", "weather"), ("cdo_data.json", "records")):
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fixture_file:
+                fixtures[key] = json.load(fixture_file)
+    return fixtures
+
+
+def stub_station_ids(lat, lon):
+    # Three stations a few kilometres around every city, named after the city's position so they stay stable
+    code = zlib.crc32(f"{lat:.2f},{lon:.2f}".encode()) % 100000
+    return [(f"USW{code:05d}{index:03d}", lat + 0.02 * index, lon - 0.02 * index) for index in range(3)]
+
+
+def station_files():
+    '''The purpose of this function is to write ghcnd-stations.txt and ghcnd-inventory.txt for the stub cities in
+    the fixed width format of the real files.
+    :param values: none
+    :return: tuple of station list text and inventory text
+    '''
+    stations, inventory = [], []
+    for city, (lat, lon) in STUB_CITIES.items():
+        for station_id, station_lat, station_lon in stub_station_ids(lat, lon):
+            stations.append(f"{station_id:<11} {station_lat:8.4f} {station_lon:9.4f} {10.0:6.1f}    "
+                            f"{city.upper() + ' STUB':<30}")
+            for element in STUB_ELEMENTS:
+                inventory.append(f"{station_id:<11} {station_lat:8.4f} {station_lon:9.4f} {element:<4} "
+                                 f"{STUB_YEARS[0]} {STUB_YEARS[1]}")
+    return "\n".join(stations) + "\n", "\n".join(inventory) + "\n"
+
+
+def city_key(city):
+    # "New  York, US" and "new york" are the same stub city
+    return " ".join(city.split(",")[0].lower().split())
+
+
+def synthetic_weather(city):
+    '''The purpose of this function is to build an OpenWeatherMap /weather answer for a stub city.
+    :param values: city = string of city name as typed
+    :return: dictionary shaped like an OpenWeatherMap answer, or None for an unknown city
+    '''
+    name = city_key(city)
+    if name not in STUB_CITIES:
+        return None
+    lat, lon = STUB_CITIES[name]
+    seed = zlib.crc32(name.encode())
+    return {
+        "coord": {"lon": lon, "lat": lat},
+        "weather": [{"id": 803, "main": "Clouds", "description": "broken clouds", "icon": "04d"}],
+        "main": {"temp": 5.0 + seed % 20, "feels_like": 3.0 + seed % 20, "pressure": 1012, "humidity": 40 + seed % 50},
+        "wind": {"speed": 1.0 + seed % 7, "deg": seed % 360},
+        "name": name.title(),
+        "cod": 200,
+    }
+
+
+def synthetic_cdo_results(query):
+    '''The purpose of this function is to build CDO style records for every day, datatype and station in a query so
+    the stub answers the same shape of JSON as the real /data endpoint.
+    :param values: query = dictionary of parsed query string lists
+    :return: list of weather data dictionaries
+    '''
+    start = datetime.date.fromisoformat(query["startdate"][0][:10])
+    end = datetime.date.fromisoformat(query["enddate"][0][:10])
+    data_types = query.get("datatypeid", ["TMAX,TMIN,PRCP,SNOW"])[0].split(",")
+    stations = query.get("stationid") or STUB_STATIONS
+
+    results = []
+    day = start
+    while day <= end:
+        for station in stations:
+            for data_type in data_types:
+                results.append({
+                    "date": f"{day.isoformat()}T00:00:00",
+                    "datatype": data_type,
+                    "station": station,
+                    "attributes": ",,W,2400",
+                    "value": float((day.toordinal() + len(data_type)) % 30),
+                })
+        day += datetime.timedelta(days=1)
+    return results
+
+
+def recorded_cdo_results(records, query):
+    '''The purpose of this function is to answer a query from the recorded records of its datatypes. A recorded day
+    is answered with its values, and any other day replays one of the recorded days, so every query gets the values
+    and attributes of the real API. The records are given the dates and stations the query asks for, as the app
+    caches them by station.
+    :param values: records = list of recorded weather data dictionaries, query = dictionary of parsed query string
+    lists
+    :return: list of weather data dictionaries, empty when none of the datatypes were recorded
+    '''
+    start = datetime.date.fromisoformat(query["startdate"][0][:10])
+    end = datetime.date.fromisoformat(query["enddate"][0][:10])
+    data_types = set(query.get("datatypeid", ["TMAX,TMIN,PRCP,SNOW"])[0].split(","))
+    stations = query.get("stationid") or STUB_STATIONS
+    # One recorded record per day and datatype, whichever station it came from
+    recorded = {}
+    for record in records:
+        if record["datatype"] in data_types:
+            recorded.setdefault(record["date"][:10], {}).setdefault(record["datatype"], record)
+    if not recorded:
+        return []
+
+    recorded_days = sorted(recorded)
+    results = []
+    day = start
+    while day <= end:
+        date = day.isoformat()
+        replayed = recorded.get(date) or recorded[recorded_days[day.toordinal() % len(recorded_days)]]
+        for station in stations:
+            results.extend(dict(record, date=f"{date}T00:00:00", station=station) for record in replayed.values())
+        day += datetime.timedelta(days=1)
+    return results
+
+
+def stub_stations(query):
+    south, west, north, east = map(float, query["extent"][0].split(","))
+    return [{"id": f"GHCND:{station_id}", "name": f"{city.upper()} STUB", "latitude": station_lat,
+             "longitude": station_lon, "mindate": f"{STUB_YEARS[0]}-01-01", "maxdate": f"{STUB_YEARS[1]}-12-31",
+             "datacoverage": 1}
+            for city, (lat, lon) in STUB_CITIES.items()
+            for station_id, station_lat, station_lon in stub_station_ids(lat, lon)
+            if south <= station_lat <= north and west <= station_lon <= east]
+
+
+def stub_data_types():
+    return [{"id": element, "name": element, "mindate": f"{STUB_YEARS[0]}-01-01",
+             "maxdate": f"{STUB_YEARS[1]}-12-31", "datacoverage": 1} for element in STUB_ELEMENTS]
+
+
+def paginate(results, query, max_page=CDO_MAX_PAGE):
+    '''The purpose of this function is to cut one page out of the results the way the CDO API does, with the
+    resultset metadata a client needs to ask for the next page.
+    :param values: results = list of weather data dictionaries, query = dictionary of parsed query string lists
+    :return: dictionary shaped like a CDO /data answer
+    '''
+    offset = int(query.get("offset", ["1"])[0])
+    limit = min(int(query.get("limit", ["25"])[0]), max_page)
+    if not results:
+        return {}
+    return {
+        "metadata": {"resultset": {"offset": offset, "count": len(results), "limit": limit}},
+        "results": results[offset - 1:offset - 1 + limit],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        '''The purpose of this function is to answer a GET request after the configured latency, emulating one
+        round-trip to the real API.
+        :param values: self = current instance of StubHandler
+        :return: none
+        '''
+        server = self.server
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        # The quota counts requests as they arrive; the latency then stands for the rest of the round-trip
+        throttled = parsed.path.startswith("/cdo-web/") and server.over_quota(self.headers.get("token", ""))
+        time.sleep(server.latency + (random.uniform(0, server.jitter) if server.jitter else 0))
+        with server.count_lock:
+            server.request_count += 1
+
+        if throttled:
+            self.send_json(429, {"status": "429", "message": "This token has exceeded its limit of requests per "
+                                 "second."}, {"Retry-After": "1"})
+        elif parsed.path.endswith("/data"):
+            records = server.fixtures["records"]
+            results = recorded_cdo_results(records, query) if records else []
+            self.send_json(200, paginate(results or synthetic_cdo_results(query), query, server.max_page))
+        elif parsed.path.endswith("/stations"):
+            self.send_json(200, paginate(stub_stations(query), query, server.max_page))
+        elif parsed.path.endswith("/datatypes"):
+            self.send_json(200, paginate(stub_data_types(), query, server.max_page))
+        elif parsed.path.endswith("/weather"):
+            city = query.get("q", [""])[0]
+            weather = server.fixtures["weather"].get(city_key(city)) or synthetic_weather(city)
+            if weather is None:
+                self.send_json(404, {"cod": "404", "message": "city not found"})
+            else:
+                self.send_json(200, weather)
+        elif parsed.path.endswith("/ghcnd-stations.txt"):
+            self.send_text(200, station_files()[0])
+        elif parsed.path.endswith("/ghcnd-inventory.txt"):
+            self.send_text(200, station_files()[1])
+        else:
+            self.send_json(404, {"message": "not found"})
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def send_text(self, status, text):
+        self.send_body(status, text.encode("utf-8"), "text/plain")
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # Count accepted connections so benchmarks can tell how many handshakes were made, and charge the
+        # configured setup delay to every new connection
+        request = super().get_request()
+        with self.count_lock:
+            self.connection_count += 1
+        time.sleep(self.connect_delay)
+        return request
+
+    def over_quota(self, token):
+        '''The purpose of this function is to apply the per-token requests per second quota of the CDO API.
+        :param values: self = current instance of StubServer, token = string of token header
+        :return: True if the request has to be answered with 429
+        '''
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        with self.count_lock:
+            sent = self.token_requests.setdefault(token, deque())
+            while sent and now - sent[0] >= 1.0:
+                sent.popleft()
+            if len(sent) >= self.rate_limit:
+                self.throttled_count += 1
+                return True
+            sent.append(now)
+            return False
+
+
+@contextmanager
+def run_stub_server(latency=0.0, handler=StubHandler, ssl_context=None, connect_delay=0.0, jitter=0.0,
+                    rate_limit=None, max_page=CDO_MAX_PAGE, fixtures=None):
+    '''The purpose of this function is to run the stub server on a free local port for the length of a with block.
+    :param values: latency = float of seconds to wait before every response, handler = request handler class,
+    ssl_context = ssl.SSLContext to serve HTTPS with (plain HTTP when None), connect_delay = float of seconds added
+    to every new connection to emulate TCP and TLS setup round-trips, jitter = float of most random seconds added to
+    the latency, rate_limit = integer of CDO requests per second allowed per token (None for no quota), max_page =
+    integer of most records per CDO page, fixtures = dictionary from load_fixtures (defaults to the recorded ones)
+    :return: the running server, with its base url stored in server.base_url
+    '''
+    server = StubServer(("127.0.0.1", 0), handler)
+    server.latency = latency
+    server.jitter = jitter
+    server.connect_delay = connect_delay
+    server.rate_limit = rate_limit
+    server.max_page = max_page
+    server.fixtures = fixtures if fixtures is not None else load_fixtures()
+    server.request_count = 0
+    server.connection_count = 0
+    server.throttled_count = 0
+    server.token_requests = {}
+    server.count_lock = threading.Lock()
+    scheme = "http"
+    if ssl_context is not None:
+        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    server.base_url = f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,282 @@
+'''Day-of-year climatology precomputed from the local GHCND archive, so historical predictions are a table lookup.
+
+Build it once after ingesting the archive (see ghcnd_archive.py):
+    python climatology.py build
+    python climatology.py build --start-year 1991 --end-year 2020 --smooth-days 7
+
+The table is written to the data folder. To keep it somewhere else, set WEATHER_WRANGLER_CLIMATOLOGY to that folder
+for both the build and the app, or pass --store to the build and set the variable for the app.
+
+The table has one row per archive station and one column per day of the leap-year calendar. Each cell holds the
+mean, lowest and highest TMAX and TMIN, the mean PRCP, the share of days with snow, and how many values each of
+those is based on. With --smooth-days N every cell also includes the N days on either side, which steadies the
+figures of sparse stations and of 02-29. Predictions only use the table when it was built for the requested years.
+The station coordinates are copied from the archive, so finding the nearest stations needs no network.
+'''
+import argparse
+import os
+import sys
+import threading
+
+import numpy as np
+
+from data_paths import data_path
+from date_ranges import history_years, HISTORY_START_YEAR, HISTORY_END_YEAR
+from ghcnd_archive import load_archive, day_of_year, nearest_positions, BACKEND_ENV, DAYS_IN_CALENDAR
+from stations import load_station_index, NEAREST_STATION_COUNT
+
+
+CLIMATOLOGY_DTYPE = np.dtype([
+    ("tmax_mean", "<f4"), ("tmax_min", "<f4"), ("tmax_max", "<f4"), ("tmax_count", "<u2"),
+    ("tmin_mean", "<f4"), ("tmin_min", "<f4"), ("tmin_max", "<f4"), ("tmin_count", "<u2"),
+    ("prcp_mean", "<f4"), ("prcp_count", "<u2"),
+    ("snow_frequency", "<f4"), ("snow_count", "<u2"),
+])
+
+# Counts are stored in 16 bits
+MAX_COUNT = np.iinfo(np.uint16).max
+
+# Set WEATHER_WRANGLER_CLIMATOLOGY to a folder to build and read the table there instead of the data folder
+STORE_ENV = "WEATHER_WRANGLER_CLIMATOLOGY"
+
+
+def default_store_dir():
+    return os.environ.get(STORE_ENV) or os.path.dirname(data_path("climatology", "index.npz"))
+
+
+def smooth(values, days, reduce):
+    '''The purpose of this function is to combine every day of the year with the days around it. The calendar wraps,
+    so 12-31 is next to 01-01.
+    :param values: values = array with one value per day of the year, days = integer of days on either side,
+    reduce = numpy function combining the shifted copies, like np.sum or np.max
+    :return: array with one value per day of the year
+    '''
+    if days == 0:
+        return values
+    return reduce(np.stack([np.roll(values, shift) for shift in range(-days, days + 1)]), axis=0)
+
+
+def temperature_columns(rows, smooth_days):
+    # Per day of year: count, mean, lowest and highest value
+    doy = rows["doy"].astype(np.intp)
+    values = rows["value"].astype(np.float64)
+    count = np.bincount(doy, minlength=DAYS_IN_CALENDAR)
+    total = np.bincount(doy, weights=values, minlength=DAYS_IN_CALENDAR)
+    low = np.full(DAYS_IN_CALENDAR, np.inf)
+    high = np.full(DAYS_IN_CALENDAR, -np.inf)
+    np.minimum.at(low, doy, values)
+    np.maximum.at(high, doy, values)
+
+    count = smooth(count, smooth_days, np.sum)
+    total = smooth(total, smooth_days, np.sum)
+    low = smooth(low, smooth_days, np.min)
+    high = smooth(high, smooth_days, np.max)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+    return count, mean, np.where(count > 0, low, np.nan), np.where(count > 0, high, np.nan)
+
+
+def station_table(rows, elements, years, smooth_days=0):
+    '''The purpose of this function is to compute the climatology of one station from its archive rows.
+    :param values: rows = array of ghcnd_archive.RECORD_DTYPE rows of the station, elements = list of element ids
+    of the archive, years = range of years to use, smooth_days = integer of days on either side to include
+    :return: array of CLIMATOLOGY_DTYPE with one cell per day of the year
+    '''
+    rows = rows[(rows["year"] >= years[0]) & (rows["year"] <= years[-1])]
+    table = np.zeros(DAYS_IN_CALENDAR, dtype=CLIMATOLOGY_DTYPE)
+
+    def element_rows(element):
+        if element not in elements:
+            return rows[0:0]
+        return rows[rows["element"] == elements.index(element)]
+
+    for element, prefix in (("TMAX", "tmax"), ("TMIN", "tmin")):
+        count, mean, low, high = temperature_columns(element_rows(element), smooth_days)
+        table[f"{prefix}_count"] = np.minimum(count, MAX_COUNT)
+        table[f"{prefix}_mean"] = mean
+        table[f"{prefix}_min"] = low
+        table[f"{prefix}_max"] = high
+
+    prcp = element_rows("PRCP")
+    count = smooth(np.bincount(prcp["doy"], minlength=DAYS_IN_CALENDAR), smooth_days, np.sum)
+    total = smooth(np.bincount(prcp["doy"], weights=prcp["value"], minlength=DAYS_IN_CALENDAR), smooth_days, np.sum)
+    table["prcp_count"] = np.minimum(count, MAX_COUNT)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["prcp_mean"] = np.where(count > 0, total / count, np.nan)
+
+    snow = element_rows("SNOW")
+    count = smooth(np.bincount(snow["doy"], minlength=DAYS_IN_CALENDAR), smooth_days, np.sum)
+    snowy = smooth(np.bincount(snow["doy"], weights=snow["value"] > 0, minlength=DAYS_IN_CALENDAR), smooth_days,
+                   np.sum)
+    table["snow_count"] = np.minimum(count, MAX_COUNT)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["snow_frequency"] = np.where(count > 0, snowy / count, np.nan)
+    return table
+
+
+def build(archive, years, smooth_days=0, store_dir=None):
+    '''The purpose of this function is to precompute the climatology of every archive station, one station at a
+    time so memory use stays at the size of one station.
+    :param values: archive = GhcndArchive, years = range of years to use, smooth_days = integer of days on either
+    side to include, store_dir = string of folder to write the table to
+    :return: integer of stations written
+    '''
+    store_dir = store_dir or default_store_dir()
+    os.makedirs(store_dir, exist_ok=True)
+    station_count = len(archive.station_ids)
+
+    table = np.lib.format.open_memmap(os.path.join(store_dir, "climatology.npy"), mode="w+", dtype=CLIMATOLOGY_DTYPE,
+                                      shape=(station_count, DAYS_IN_CALENDAR))
+    for position in range(station_count):
+        rows = archive.records[archive.offsets[position, 0]:archive.offsets[position, DAYS_IN_CALENDAR]]
+        table[position] = station_table(rows, archive.elements, years, smooth_days)
+        if (position + 1) % 1000 == 0:
+            print(f"Computed {position + 1} of {station_count} stations")
+    table.flush()
+    del table
+
+    np.savez(os.path.join(store_dir, "index.npz"), station_ids=np.array(archive.station_ids),
+             start_year=years[0], end_year=years[-1], smooth_days=smooth_days, points=archive.points)
+    return station_count
+
+
+class Climatology:
+    def __init__(self, store_dir):
+        '''The purpose of this function is to open a built climatology, memory-mapping the table.
+        :param values: self = current instance of Climatology, store_dir = string of climatology folder
+        :return: none
+        '''
+        with np.load(os.path.join(store_dir, "index.npz")) as index:
+            self.station_ids = index["station_ids"].tolist()
+            self.years = range(int(index["start_year"]), int(index["end_year"]) + 1)
+            self.smooth_days = int(index["smooth_days"])
+            self.points = index["points"] if "points" in index else None
+        self.station_positions = {station_id: position for position, station_id in enumerate(self.station_ids)}
+        self.table = np.load(os.path.join(store_dir, "climatology.npy"), mmap_mode="r")
+
+    def day(self, station_id, month, day):
+        '''The purpose of this function is to read the climatology of one station for one MM-DD.
+        :param values: self = current instance of Climatology, station_id = string of GHCND station id without the
+        "GHCND:" prefix, month = integer of month, day = integer of day
+        :return: CLIMATOLOGY_DTYPE cell, or None if the station is not in the table
+        '''
+        position = self.station_positions.get(station_id)
+        if position is None:
+            return None
+        return self.table[position, day_of_year(month, day)]
+
+    def nearest_stations(self, lat, lon, k=NEAREST_STATION_COUNT):
+        if self.points is not None:
+            return [self.station_ids[position] for position in nearest_positions(self.points, lat, lon, k)]
+        index = load_station_index()
+        if index is None:
+            return []
+        found = index.nearest(lat, lon, k, lambda station: index.stations[station][0] in self.station_positions)
+        return [station_id for station_id, _, _ in found]
+
+    def summary(self, lat, lon, month, day):
+        '''The purpose of this function is to combine the climatology of the nearest stations for one MM-DD, the same
+        way the raw records of those stations would be averaged together.
+        :param values: self = current instance of Climatology, lat = float of latitude of city, lon = float of
+        longitude of city, month = integer of month, day = integer of day
+        :return: dictionary of metric means, extremes, snow frequency and counts, or None without any records
+        '''
+        cells = [self.day(station_id, month, day) for station_id in self.nearest_stations(lat, lon)]
+        cells = [cell for cell in cells if cell is not None]
+        if not cells:
+            return None
+        return pool(np.array(cells, dtype=CLIMATOLOGY_DTYPE))
+
+    def range_summary(self, lat, lon, date_range):
+        '''The purpose of this function is to combine the climatology of the nearest stations over a range of days,
+        as a whole and for each day. The cells of a range are one block of the table, read in a single lookup.
+        :param values: self = current instance of Climatology, lat = float of latitude of city, lon = float of
+        longitude of city, date_range = date_ranges.DateRange
+        :return: tuple of the summary of the whole range (None without any records) and a dictionary of
+        (month, day) to the summary of that day
+        '''
+        positions = [self.station_positions[station_id] for station_id in self.nearest_stations(lat, lon)]
+        if not positions:
+            return None, {}
+        days = date_range.days()
+        cells = self.table[np.ix_(positions, [day_of_year(month, day) for month, day in days])]
+
+        by_day = {}
+        for column, month_day in enumerate(days):
+            summary = pool(cells[:, column])
+            if summary is not None:
+                by_day[month_day] = summary
+        return pool(cells.ravel()), by_day
+
+
+def pool(cells):
+    '''The purpose of this function is to combine climatology cells, of several stations or several days, the same
+    way their raw records would be averaged together.
+    :param values: cells = array of CLIMATOLOGY_DTYPE cells
+    :return: dictionary of metric means, extremes, snow frequency and counts, or None without any records
+    '''
+    def pooled(mean, count):
+        counts = cells[count].astype(np.float64)
+        if counts.sum() == 0:
+            return 0.0, 0
+        return float(np.nansum(cells[mean] * counts) / counts.sum()), int(counts.sum())
+
+    def extreme(field, reduce):
+        values = cells[field][~np.isnan(cells[field])]
+        return float(reduce(values)) if len(values) else None
+
+    summary = {}
+    for prefix in ("tmax", "tmin"):
+        summary[f"{prefix}_mean"], summary[f"{prefix}_count"] = pooled(f"{prefix}_mean", f"{prefix}_count")
+        summary[f"{prefix}_min"] = extreme(f"{prefix}_min", np.min)
+        summary[f"{prefix}_max"] = extreme(f"{prefix}_max", np.max)
+    summary["prcp_mean"], summary["prcp_count"] = pooled("prcp_mean", "prcp_count")
+    summary["snow_frequency"], summary["snow_count"] = pooled("snow_frequency", "snow_count")
+    summary["record_count"] = (summary["tmax_count"] + summary["tmin_count"] + summary["prcp_count"]
+                               + summary["snow_count"])
+    if summary["record_count"] == 0:
+        return None
+    return summary
+
+
+_climatology = None
+_climatology_lock = threading.Lock()
+
+
+def load_climatology():
+    '''The purpose of this function is to open the climatology once for the whole app, if one has been built.
+    :param values: none
+    :return: Climatology, or None if it has not been built or the API backend has been forced
+    '''
+    global _climatology
+    if os.environ.get(BACKEND_ENV, "auto") == "api":
+        return None
+    with _climatology_lock:
+        if _climatology is None and os.path.exists(os.path.join(default_store_dir(), "index.npz")):
+            _climatology = Climatology(default_store_dir())
+        return _climatology
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the day-of-year climatology from the GHCND archive")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--start-year", type=int, default=HISTORY_START_YEAR)
+    parser.add_argument("--end-year", type=int, default=HISTORY_END_YEAR)
+    parser.add_argument("--smooth-days", type=int, default=0, help="days on either side to include, like 7")
+    parser.add_argument("--store", help=f"folder to write the climatology to, read by the app when {STORE_ENV} "
+                        "is set to it")
+    args = parser.parse_args()
+
+    archive = load_archive()
+    if archive is None:
+        print("Error: No GHCND archive found. Build one first with: python ghcnd_archive.py ingest path/to/ghcnd_all")
+        sys.exit(1)
+    try:
+        years = history_years(args.start_year, args.end_year)
+    except ValueError as ve:
+        print(f"Error: {ve}")
+        sys.exit(1)
+    count = build(archive, years, args.smooth_days, args.store)
+    print(f"Wrote the {years[0]}-{years[-1]} climatology of {count} stations to {args.store or default_store_dir()}")
+    if args.store and os.path.abspath(args.store) != os.path.abspath(default_store_dir()):
+        print(f"Set {STORE_ENV}={args.store} so the app reads it")
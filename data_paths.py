@@ -0,0 +1,16 @@
+import os
+
+
+# Folder holding downloaded data and caches, next to the app unless WEATHER_WRANGLER_DATA says otherwise
+DATA_DIR = os.environ.get("WEATHER_WRANGLER_DATA",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+
+def data_path(*parts):
+    '''The purpose of this function is to build a path inside the data folder, creating the folder if needed.
+    :param values: parts = strings of path parts below the data folder
+    :return: string of the full path
+    '''
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,168 @@
+'''Day ranges like 12-20 to 01-05, whole months and seasons, on the leap-year calendar used by the archive.
+
+A range that runs over the new year belongs to the year it ends in, so winter 2015 is 2014-12-01 to 2015-02-28.
+History windows (the years a prediction looks back over) are checked here too, so the command line tools can use
+them without importing weather_core.
+'''
+import datetime
+
+
+# Days in each month on a leap-year calendar, so 02-29 is a valid day of the range
+MONTH_DAYS = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+MONTH_NAMES = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+               "november", "december"]
+
+# Meteorological seasons of the northern hemisphere
+SEASONS = {
+    "winter": ((12, 1), (2, 29)),
+    "spring": ((3, 1), (5, 31)),
+    "summer": ((6, 1), (8, 31)),
+    "autumn": ((9, 1), (11, 30)),
+    "fall": ((9, 1), (11, 30)),
+    "djf": ((12, 1), (2, 29)),
+    "mam": ((3, 1), (5, 31)),
+    "jja": ((6, 1), (8, 31)),
+    "son": ((9, 1), (11, 30)),
+}
+
+RANGE_SEPARATORS = [" to ", ".."]
+
+# Retrieve data for multiple years (e.g., last 10 years); every query can ask for its own window instead
+HISTORY_START_YEAR = 2014
+HISTORY_END_YEAR = 2023
+
+# The oldest GHCND daily records are from 1763
+EARLIEST_HISTORY_YEAR = 1763
+
+
+def parse_month_day(date):
+    '''The purpose of this function is to check a date typed as MM-DD and split it into numbers.
+    :param values: date = string of date in MM-DD format
+    :return: tuple of integer month and integer day
+    '''
+    if len(date) != 5 or date[2] != '-':
+        raise ValueError("Date must be in MM-DD format")
+    month, day = map(int, date.split('-'))
+
+    if month < 1 or month > 12 or day < 1 or day > 31:
+        raise ValueError("Invalid month or day value.")
+    return month, day
+
+
+def history_years(start_year=None, end_year=None):
+    '''The purpose of this function is to check a history window, like 1994 to 2023 for 30-year climate normals.
+    :param values: start_year = first year (defaults to HISTORY_START_YEAR), end_year = last year (defaults to
+    HISTORY_END_YEAR), as integers or strings
+    :return: range of integer years
+    '''
+    try:
+        start_year = HISTORY_START_YEAR if start_year is None else int(start_year)
+        end_year = HISTORY_END_YEAR if end_year is None else int(end_year)
+    except ValueError:
+        raise ValueError("Years must be whole numbers.")
+
+    if start_year > end_year:
+        raise ValueError("Start year must not be after end year.")
+    if start_year < EARLIEST_HISTORY_YEAR or end_year > datetime.date.today().year:
+        raise ValueError(f"Years must be between {EARLIEST_HISTORY_YEAR} and {datetime.date.today().year}.")
+    return range(start_year, end_year + 1)
+
+
+def month_number(name):
+    name = name.strip().lower()
+    for number, month in enumerate(MONTH_NAMES, start=1):
+        if len(name) >= 3 and month.startswith(name):
+            return number
+    return None
+
+
+class DateRange:
+    def __init__(self, start, end):
+        '''The purpose of this function is to hold a range of days of the year, which may run over the new year.
+        :param values: self = current instance of DateRange, start = tuple of first month and day, end = tuple of
+        last month and day
+        :return: none
+        '''
+        for month, day in (start, end):
+            if day > MONTH_DAYS[month - 1]:
+                raise ValueError(f"{month:02d}-{day:02d} is not a day of the year.")
+        self.start = start
+        self.end = end
+
+    @property
+    def wraps(self):
+        return self.end < self.start
+
+    @property
+    def single_day(self):
+        return self.start == self.end
+
+    def label(self):
+        start = f"{self.start[0]:02d}-{self.start[1]:02d}"
+        return start if self.single_day else f"{start} to {self.end[0]:02d}-{self.end[1]:02d}"
+
+    def days(self):
+        '''The purpose of this function is to list the days of the range in order.
+        :param values: self = current instance of DateRange
+        :return: list of tuples of month and day
+        '''
+        days = []
+        month, day = self.start
+        while True:
+            days.append((month, day))
+            if (month, day) == self.end:
+                return days
+            day += 1
+            if day > MONTH_DAYS[month - 1]:
+                month, day = month % 12 + 1, 1
+
+    def dates(self, year):
+        '''The purpose of this function is to list the real dates of the range that ends in a year. Days that do not
+        exist in that year, like 02-29 outside leap years, are left out.
+        :param values: self = current instance of DateRange, year = integer of the year the range ends in
+        :return: list of datetime.date
+        '''
+        dates = []
+        for month, day in self.days():
+            in_year = year - 1 if self.wraps and (month, day) >= self.start else year
+            try:
+                dates.append(datetime.date(in_year, month, day))
+            except ValueError:
+                continue
+        return dates
+
+    def range_year(self, date):
+        '''The purpose of this function is to find which year's range a record date belongs to.
+        :param values: self = current instance of DateRange, date = string of date starting with YYYY-MM-DD
+        :return: integer of the year the range ends in
+        '''
+        year = int(date[:4])
+        if self.wraps and (int(date[5:7]), int(date[8:10])) >= self.start:
+            return year + 1
+        return year
+
+
+def parse_date_range(text):
+    '''The purpose of this function is to read a day or a range of days typed by the user: MM-DD, "MM-DD to MM-DD"
+    (or MM-DD..MM-DD), a month name like "December" or "Dec", or a season like "winter" or "JJA".
+    :param values: text = string typed by the user
+    :return: DateRange
+    '''
+    text = text.strip()
+    for separator in RANGE_SEPARATORS:
+        if separator in text.lower():
+            index = text.lower().index(separator)
+            start = parse_month_day(text[:index].strip())
+            return DateRange(start, parse_month_day(text[index + len(separator):].strip()))
+
+    season = SEASONS.get(text.lower())
+    if season:
+        return DateRange(*season)
+
+    month = month_number(text)
+    if month:
+        return DateRange((month, 1), (month, MONTH_DAYS[month - 1]))
+
+    month_day = parse_month_day(text)
+    return DateRange(month_day, month_day)
@@ -0,0 +1,252 @@
+'''Offline city gazetteer used to turn a city name into coordinates without calling OpenWeatherMap.
+
+Build the gazetteer once from the GeoNames cities15000.txt dump (https://download.geonames.org/export/dump/):
+    python geocoder.py build cities15000.txt
+
+The output is a single binary file in the data folder that is memory-mapped at run time. Records are sorted by
+normalised name, so exact and prefix lookups are a binary search over the mapped file.
+'''
+import mmap
+import os
+import struct
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from data_paths import data_path
+
+
+GAZETTEER_MAGIC = b"WWGZ1\0\0\0"
+HEADER = struct.Struct("<8sI")
+# lat, lon, population, name offset, name length, country code
+RECORD = struct.Struct("<ffIIH2s")
+
+# Names below this trigram similarity are not offered as "did you mean" suggestions
+SUGGESTION_THRESHOLD = 0.4
+SUGGESTION_COUNT = 3
+
+
+def default_gazetteer_path():
+    return data_path("gazetteer.bin")
+
+
+def normalize_name(name):
+    '''The purpose of this function is to turn a city name into the form used as the gazetteer key: accents removed,
+    lower case and single spaces.
+    :param values: name = string of city name
+    :return: string of normalised city name
+    '''
+    decomposed = unicodedata.normalize("NFKD", name)
+    ascii_name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(ascii_name.lower().split())
+
+
+def split_country(city):
+    '''The purpose of this function is to split an OpenWeatherMap style "City,CC" query into the name and the
+    optional two letter country code.
+    :param values: city = string of city query
+    :return: tuple of normalised name and upper case country code (or None)
+    '''
+    name, _, country = city.rpartition(",")
+    if name and len(country.strip()) == 2:
+        return normalize_name(name), country.strip().upper()
+    return normalize_name(city), None
+
+
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def build_gazetteer(source_path, output_path=None):
+    '''The purpose of this function is to convert a GeoNames cities dump into the compact binary gazetteer.
+    :param values: source_path = string of GeoNames tab separated file, output_path = string of gazetteer file
+    :return: integer of cities written
+    '''
+    output_path = output_path or default_gazetteer_path()
+    entries = []
+    with open(source_path, encoding="utf-8") as source:
+        for line in source:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15:
+                continue
+            population = int(fields[14] or 0)
+            # Index both the local and the ASCII spelling of the name
+            for name in {normalize_name(fields[1]), normalize_name(fields[2])}:
+                if name:
+                    entries.append((name, -population, float(fields[4]), float(fields[5]), fields[8][:2]))
+
+    # Sorted by name, biggest city first, so the first match of a name is the one people usually mean
+    entries.sort()
+
+    names = bytearray()
+    records = bytearray()
+    for name, negative_population, lat, lon, country in entries:
+        encoded = name.encode("utf-8")
+        records += RECORD.pack(lat, lon, -negative_population, len(names), len(encoded),
+                               country.encode("ascii", "replace").ljust(2))
+        names += encoded
+
+    with open(output_path, "wb") as output:
+        output.write(HEADER.pack(GAZETTEER_MAGIC, len(entries)))
+        output.write(records)
+        output.write(names)
+    return len(entries)
+
+
+class Gazetteer:
+    def __init__(self, path):
+        '''The purpose of this function is to memory-map a gazetteer file built by build_gazetteer.
+        :param values: self = current instance of Gazetteer, path = string of gazetteer file
+        :return: none
+        '''
+        with open(path, "rb") as gazetteer_file:
+            self.buffer = mmap.mmap(gazetteer_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != GAZETTEER_MAGIC:
+            raise ValueError(f"{path} is not a gazetteer file")
+        self.names_start = HEADER.size + self.count * RECORD.size
+        self.trigram_index = None
+        self.trigram_lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.name_at(index)
+
+    def record_at(self, index):
+        lat, lon, population, name_offset, name_length, country = RECORD.unpack_from(
+            self.buffer, HEADER.size + index * RECORD.size)
+        return lat, lon, population, country.decode("ascii").strip()
+
+    def name_at(self, index):
+        _, _, _, name_offset, name_length, _ = RECORD.unpack_from(self.buffer, HEADER.size + index * RECORD.size)
+        start = self.names_start + name_offset
+        return self.buffer[start:start + name_length].decode("utf-8")
+
+    def _matches(self, name, country):
+        # Records of the same name are next to each other, biggest city first
+        index = bisect_left(self, name)
+        while index < self.count and self.name_at(index) == name:
+            lat, lon, population, record_country = self.record_at(index)
+            if country is None or record_country == country:
+                yield lat, lon
+            index += 1
+
+    def lookup(self, city):
+        '''The purpose of this function is to find the coordinates of a city by exact name, honouring an optional
+        ",CC" country suffix.
+        :param values: self = current instance of Gazetteer, city = string of city query
+        :return: tuple of latitude and longitude, or None if the name is not in the gazetteer
+        '''
+        name, country = split_country(city)
+        for location in self._matches(name, country):
+            return location
+        return None
+
+    def complete(self, prefix, limit=10):
+        '''The purpose of this function is to list city names starting with a prefix, for type-ahead.
+        :param values: self = current instance of Gazetteer, prefix = string typed so far, limit = integer of names
+        :return: list of distinct city names
+        '''
+        prefix = normalize_name(prefix)
+        names = []
+        index = bisect_left(self, prefix)
+        while index < self.count and len(names) < limit:
+            name = self.name_at(index)
+            if not name.startswith(prefix):
+                break
+            if not names or names[-1] != name:
+                names.append(name)
+            index += 1
+        return names
+
+    def _build_trigram_index(self):
+        index = defaultdict(list)
+        previous = None
+        for position in range(self.count):
+            name = self.name_at(position)
+            if name == previous:
+                continue
+            previous = name
+            for gram in trigrams(name):
+                index[gram].append(position)
+        return index
+
+    def suggest(self, city, limit=SUGGESTION_COUNT):
+        '''The purpose of this function is to find the city names closest to a query by trigram similarity, to offer
+        when a city is not found. They are never used as the answer themselves, since a town missing from the
+        gazetteer is often close to a bigger one (New York Mills and New York). The trigram index is built on first
+        use.
+        :param values: self = current instance of Gazetteer, city = string of city query, limit = integer of names
+        :return: list of city names, most similar first
+        '''
+        name, country = split_country(city)
+        with self.trigram_lock:
+            if self.trigram_index is None:
+                self.trigram_index = self._build_trigram_index()
+
+        query_grams = trigrams(name)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for position in self.trigram_index.get(gram, ()):
+                shared[position] += 1
+
+        scored = []
+        for position, count in shared.items():
+            candidate = self.name_at(position)
+            score = count / len(query_grams | trigrams(candidate))
+            if score >= SUGGESTION_THRESHOLD and candidate != name:
+                scored.append((-score, candidate))
+        scored.sort()
+        return [candidate for _, candidate in scored
+                if country is None or next(self._matches(candidate, country), None)][:limit]
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def load_gazetteer():
+    '''The purpose of this function is to open the gazetteer once for the whole app.
+    :param values: none
+    :return: Gazetteer, or None if the gazetteer file has not been built
+    '''
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None and os.path.exists(default_gazetteer_path()):
+            _gazetteer = Gazetteer(default_gazetteer_path())
+        return _gazetteer
+
+
+def resolve_city(city):
+    '''The purpose of this function is to turn a city name into coordinates using only the local gazetteer. Only
+    an exact name answers, anything else is looked up online.
+    :param values: city = string of city name
+    :return: tuple of latitude and longitude, or None if the city has to be looked up online
+    '''
+    gazetteer = load_gazetteer()
+    if gazetteer is None or not city.strip():
+        return None
+    return gazetteer.lookup(city)
+
+
+def suggest_cities(city, limit=SUGGESTION_COUNT):
+    '''The purpose of this function is to list gazetteer names similar to a city that could not be found.
+    :param values: city = string of city name, limit = integer of names
+    :return: list of city names, empty without a gazetteer
+    '''
+    gazetteer = load_gazetteer()
+    if gazetteer is None or not city.strip():
+        return []
+    return gazetteer.suggest(city, limit)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "build":
+        print("Usage: python geocoder.py build cities15000.txt")
+        sys.exit(1)
+    print(f"Wrote {build_gazetteer(sys.argv[2])} names to {default_gazetteer_path()}")
@@ -0,0 +1,366 @@
+'''Local GHCND archive built from NOAA's bulk by-station files, used instead of the CDO web API for history.
+
+Download and unpack ghcnd_all.tar.gz (https://www.ncei.noaa.gov/pub/data/ghcn/daily/) and ingest it once:
+    python ghcnd_archive.py ingest path/to/ghcnd_all
+
+records.bin holds every kept value as a packed (day of year, year, element, value) row, sorted by station and then
+day of year. offsets.npy holds, for every station, the row where each day of year starts, and station_ids.npy,
+latitudes.npy, longitudes.npy and elements.npy describe the stations and elements. Day of year is counted on a
+leap-year calendar, so 03-01 is the same slot in every year. Every file is memory-mapped, so opening the archive
+reads almost nothing, and looking up one station and MM-DD is a slice of the rows, with no parsing and no network.
+An ingest writes every file under a temporary name and moves them into place only once all are complete, offsets.npy
+last, so an interrupted ingest leaves the previous archive as it was.
+
+The coordinates come from ghcnd-stations.txt, read from the source folder or the folder above it when it is there
+and downloaded once otherwise. They are kept in the store, so finding the nearest stations needs no network either.
+'''
+import glob
+import gzip
+import os
+import sys
+import threading
+
+import numpy as np
+
+from aggregation import RecordColumns
+from data_paths import data_path
+from stations import (parse_stations, download_station_file, chord_to_km, MAX_STATION_DISTANCE_KM,
+                      NEAREST_STATION_COUNT, STATIONS_URL)
+
+
+# Elements kept in the archive, with the factor that turns the stored GHCND units into CDO metric units
+ELEMENT_SCALES = {
+    "TMAX": 0.1,  # tenths of degrees C
+    "TMIN": 0.1,
+    "TAVG": 0.1,
+    "TOBS": 0.1,
+    "PRCP": 0.1,  # tenths of mm
+    "SNOW": 1.0,  # mm
+    "SNWD": 1.0,
+    "WESD": 0.1,
+    "AWND": 0.1,  # tenths of meters per second
+    "WSF5": 0.1,
+    "WDF5": 1.0,  # degrees
+}
+ELEMENTS = list(ELEMENT_SCALES)
+
+RECORD_DTYPE = np.dtype([("doy", "<u2"), ("year", "<i2"), ("element", "i1"), ("value", "<f4")])
+
+# Day of year (counting from 0) of the first day of each month on a leap-year calendar
+MONTH_START = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+DAYS_IN_CALENDAR = 366
+
+# One line of a .dly file: station, year, month, element and 31 days of value plus three flags
+DLY_LINE = np.dtype([("id", "S11"), ("year", "S4"), ("month", "S2"), ("element", "S4")]
+                    + [(f"{field}{day}", f"S{width}") for day in range(31)
+                       for field, width in (("value", 5), ("mflag", 1), ("qflag", 1), ("sflag", 1))])
+
+# Set WEATHER_WRANGLER_BACKEND=api to ignore a built archive
+BACKEND_ENV = "WEATHER_WRANGLER_BACKEND"
+
+# Files of the store, in the order an ingest moves them into place; offsets.npy ties the others together, so it is last
+STORE_FILES = ["records.bin", "station_ids.npy", "latitudes.npy", "longitudes.npy", "elements.npy", "offsets.npy"]
+INDEX_FILE = STORE_FILES[-1]
+
+
+def day_of_year(month, day):
+    return int(MONTH_START[month - 1]) + day - 1
+
+
+def default_store_dir():
+    return os.path.dirname(data_path("ghcnd_store", INDEX_FILE))
+
+
+def parse_dly(data):
+    '''The purpose of this function is to turn the contents of one .dly file into archive rows. Missing values and
+    values that failed NOAA quality control are dropped, and values are converted to metric units.
+    :param values: data = bytes of a .dly file
+    :return: array of RECORD_DTYPE rows sorted by day of year, year and element
+    '''
+    lines = [line.ljust(DLY_LINE.itemsize)[:DLY_LINE.itemsize] for line in data.splitlines() if line.strip()]
+    if not lines:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    table = np.frombuffer(b"".join(lines), dtype=DLY_LINE)
+
+    element_codes = {element.encode("ascii"): code for code, element in enumerate(ELEMENTS)}
+    element = np.array([element_codes.get(name, -1) for name in table["element"]], dtype=np.int8)
+    table = table[element >= 0]
+    element = element[element >= 0]
+
+    values = np.stack([table[f"value{day}"].astype(np.int32) for day in range(31)], axis=1)
+    quality = np.stack([table[f"qflag{day}"] for day in range(31)], axis=1)
+    keep = (values != -9999) & (quality == b" ")
+
+    rows, days = np.nonzero(keep)
+    months = table["month"].astype(np.int16)[rows]
+    records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+    records["doy"] = MONTH_START[months - 1] + days
+    records["year"] = table["year"].astype(np.int16)[rows]
+    records["element"] = element[rows]
+    scales = np.array(list(ELEMENT_SCALES.values()), dtype=np.float32)
+    records["value"] = values[rows, days] * scales[element[rows]]
+
+    order = np.lexsort((records["element"], records["year"], records["doy"]))
+    return records[order]
+
+
+def station_list_path(source_dir):
+    '''The purpose of this function is to find ghcnd-stations.txt next to the by-station files, downloading it
+    when it is not there.
+    :param values: source_dir = string of folder holding the by-station files
+    :return: string of station list path
+    '''
+    name = STATIONS_URL.rsplit("/", 1)[1]
+    for folder in (source_dir, os.path.dirname(os.path.abspath(source_dir))):
+        if os.path.exists(os.path.join(folder, name)):
+            return os.path.join(folder, name)
+    return download_station_file(STATIONS_URL)
+
+
+def station_points(latitudes, longitudes):
+    # Unit vectors of the stations, as in stations.to_unit_vector
+    lat, lon = np.radians(np.asarray(latitudes, dtype=np.float64)), np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+
+def nearest_positions(points, lat, lon, k=NEAREST_STATION_COUNT, max_distance_km=MAX_STATION_DISTANCE_KM):
+    '''The purpose of this function is to find the closest of the stations kept in a store, comparing the distance
+    to all of them at once, which takes a few milliseconds for the whole GHCND network.
+    :param values: points = array of station unit vectors from station_points, lat = float of latitude, lon = float
+    of longitude, k = integer of stations wanted, max_distance_km = float of the largest distance allowed
+    :return: list of integer station positions in the store, closest first
+    '''
+    if len(points) == 0:
+        return []
+    chords = np.linalg.norm(points - station_points([lat], [lon])[0], axis=1)
+    chords[np.isnan(chords)] = np.inf
+    closest = np.argpartition(chords, k)[:k] if len(chords) > k else np.arange(len(chords))
+    closest = closest[np.argsort(chords[closest])]
+    return [int(position) for position in closest
+            if np.isfinite(chords[position]) and chord_to_km(chords[position]) <= max_distance_km]
+
+
+def ingest(source_dir, store_dir=None):
+    '''The purpose of this function is to build the archive from a folder of .dly (or .dly.gz) files, one station
+    at a time, so memory use stays at the size of one station.
+    :param values: source_dir = string of folder holding the by-station files, store_dir = string of folder to write
+    the archive to
+    :return: integer of stations written
+    '''
+    coordinates = {station_id: (lat, lon) for station_id, lat, lon, _ in parse_stations(station_list_path(source_dir))}
+    store_dir = store_dir or default_store_dir()
+    os.makedirs(store_dir, exist_ok=True)
+    # Sorted by station id, so a station is found in the memory-mapped ids with a binary search
+    paths = sorted(glob.glob(os.path.join(source_dir, "*.dly")) + glob.glob(os.path.join(source_dir, "*.dly.gz")),
+                   key=os.path.basename)
+
+    def temporary(name):
+        return os.path.join(store_dir, f"{name}.tmp")
+
+    try:
+        station_ids = []
+        written = 0
+        # The offsets of every station are streamed to disk as well, rather than held until the end
+        with open(temporary("records.bin"), "wb") as output, open(temporary("offsets.bin"), "wb") as offsets:
+            for number, path in enumerate(paths, start=1):
+                opener = gzip.open if path.endswith(".gz") else open
+                with opener(path, "rb") as source:
+                    records = parse_dly(source.read())
+                if len(records) == 0:
+                    continue
+                station_ids.append(os.path.basename(path).split(".")[0])
+                # Row where each day of year starts, plus the end of the station
+                starts = written + np.searchsorted(records["doy"], np.arange(DAYS_IN_CALENDAR + 1))
+                offsets.write(starts.astype(np.int64).tobytes())
+                output.write(records.tobytes())
+                written += len(records)
+                if number % 1000 == 0:
+                    print(f"Ingested {number} of {len(paths)} stations")
+
+        shape = (len(station_ids), DAYS_IN_CALENDAR + 1)
+        index = np.lib.format.open_memmap(temporary("offsets.npy"), mode="w+", dtype=np.int64, shape=shape)
+        if len(station_ids):
+            index[:] = np.memmap(temporary("offsets.bin"), dtype=np.int64, mode="r", shape=shape)
+        index.flush()
+        del index
+        os.remove(temporary("offsets.bin"))
+
+        # Stations missing from the station list get NaN coordinates and are never found as nearest
+        positions = np.array([coordinates.get(station_id, (np.nan, np.nan)) for station_id in station_ids],
+                             dtype=np.float64).reshape(len(station_ids), 2)
+        for name, values in (("station_ids.npy", np.array(station_ids, dtype="U11")),
+                             ("latitudes.npy", positions[:, 0]), ("longitudes.npy", positions[:, 1]),
+                             ("elements.npy", np.array(ELEMENTS))):
+            with open(temporary(name), "wb") as output:
+                np.save(output, values)
+    except BaseException:
+        for name in STORE_FILES + ["offsets.bin"]:
+            if os.path.exists(temporary(name)):
+                os.remove(temporary(name))
+        raise
+
+    for name in STORE_FILES:
+        os.replace(temporary(name), os.path.join(store_dir, name))
+    return len(station_ids)
+
+
+class GhcndArchive:
+    def __init__(self, store_dir):
+        '''The purpose of this function is to open a built archive, memory-mapping the rows and the index.
+        :param values: self = current instance of GhcndArchive, store_dir = string of archive folder
+        :return: none, but raises ValueError when the files do not belong together
+        '''
+        def load(name):
+            return np.load(os.path.join(store_dir, name), mmap_mode="r")
+
+        self.station_ids = load("station_ids.npy")
+        self.offsets = load(INDEX_FILE)
+        self.elements = load("elements.npy").tolist()
+        self.points = station_points(load("latitudes.npy"), load("longitudes.npy"))
+        records_path = os.path.join(store_dir, "records.bin")
+        if os.path.getsize(records_path):
+            self.records = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r")
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+        # The last offset of the last station is where records.bin ends
+        if len(self.offsets) != len(self.station_ids) or \
+                (len(self.offsets) and self.offsets[-1, DAYS_IN_CALENDAR] != len(self.records)):
+            raise ValueError(f"The GHCND archive in {store_dir} is incomplete. Please ingest it again.")
+
+    def station_position(self, station_id):
+        # Binary search of the sorted, memory-mapped station ids
+        position = int(np.searchsorted(self.station_ids, station_id))
+        if position < len(self.station_ids) and self.station_ids[position] == station_id:
+            return position
+        return None
+
+    def day_rows(self, station_id, month, day):
+        '''The purpose of this function is to get every row of one station for one MM-DD across all years.
+        :param values: self = current instance of GhcndArchive, station_id = string of GHCND station id without the
+        "GHCND:" prefix, month = integer of month, day = integer of day
+        :return: array of RECORD_DTYPE rows
+        '''
+        position = self.station_position(station_id)
+        if position is None:
+            return self.records[0:0]
+        doy = day_of_year(month, day)
+        return self.records[self.offsets[position, doy]:self.offsets[position, doy + 1]]
+
+    def range_rows(self, station_id, first_doy, last_doy):
+        '''The purpose of this function is to get every row of one station for a range of days across all years. The
+        rows of a station are sorted by day of year, so a range is one slice, or two when it runs over the new year.
+        :param values: self = current instance of GhcndArchive, station_id = string of GHCND station id without the
+        "GHCND:" prefix, first_doy = integer of first day of year, last_doy = integer of last day of year
+        :return: array of RECORD_DTYPE rows
+        '''
+        position = self.station_position(station_id)
+        if position is None:
+            return self.records[0:0]
+        offsets = self.offsets[position]
+        if first_doy <= last_doy:
+            return self.records[offsets[first_doy]:offsets[last_doy + 1]]
+        return np.concatenate((self.records[offsets[first_doy]:offsets[DAYS_IN_CALENDAR]],
+                               self.records[offsets[0]:offsets[last_doy + 1]]))
+
+    def nearest_stations(self, lat, lon, k=NEAREST_STATION_COUNT):
+        '''The purpose of this function is to find the closest stations that are in the archive.
+        :param values: self = current instance of GhcndArchive, lat = float of latitude, lon = float of longitude,
+        k = integer of stations wanted
+        :return: list of GHCND station ids without the "GHCND:" prefix
+        '''
+        return [str(self.station_ids[position]) for position in nearest_positions(self.points, lat, lon, k)]
+
+    def columns(self, station_rows):
+        '''The purpose of this function is to turn the rows of several stations straight into record columns, the
+        form the aggregation and plots use, without building a record at a time.
+        :param values: self = current instance of GhcndArchive, station_rows = dictionary of station id to its array
+        of RECORD_DTYPE rows
+        :return: aggregation.RecordColumns ordered by date
+        '''
+        parts = list(station_rows.values())
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+        station = np.repeat(np.arange(len(parts), dtype=np.int32), [len(part) for part in parts])
+        months = np.searchsorted(MONTH_START, rows["doy"], side="right")
+        month_starts = (rows["year"].astype(np.int64) - 1970).astype("datetime64[Y]").astype("datetime64[M]") \
+            + (months - 1)
+        date = month_starts.astype("datetime64[D]") + (rows["doy"] - MONTH_START[months - 1])
+        # The stored float32 values are rounded to the tenths the CDO API answers with
+        value = np.round(rows["value"].astype(np.float64), 1)
+        columns = RecordColumns(rows["element"].astype(np.int8), value, date, station, self.elements,
+                                [f"GHCND:{station_id}" for station_id in station_rows])
+        return columns.sorted_by_date()
+
+    def fetch_years(self, lat, lon, month, day, years, data_types):
+        '''The purpose of this function is to answer the same question as noaa_client.fetch_noaa_years from the
+        archive.
+        :param values: self = current instance of GhcndArchive, lat = float of latitude of city, lon = float of
+        longitude of city, month = integer of month, day = integer of day, years = iterable of integer years,
+        data_types = string of comma separated datatype ids
+        :return: aggregation.RecordColumns ordered by year
+        '''
+        years = np.array(list(years), dtype=np.int16)
+        wanted = [self.elements.index(code) for code in data_types.split(",") if code in self.elements]
+        station_rows = {}
+        for station_id in self.nearest_stations(lat, lon):
+            rows = self.day_rows(station_id, month, day)
+            station_rows[station_id] = rows[np.isin(rows["year"], years) & np.isin(rows["element"], wanted)]
+        return self.columns(station_rows)
+
+    def fetch_range(self, lat, lon, date_range, years, data_types):
+        '''The purpose of this function is to get the records of a range of days across several years from the
+        archive. Days before the new year of a range like 12-20 to 01-05 count towards the range of the next year.
+        :param values: self = current instance of GhcndArchive, lat = float of latitude of city, lon = float of
+        longitude of city, date_range = date_ranges.DateRange, years = iterable of integer years the ranges end in,
+        data_types = string of comma separated datatype ids
+        :return: aggregation.RecordColumns ordered by date
+        '''
+        first_doy = day_of_year(*date_range.start)
+        last_doy = day_of_year(*date_range.end)
+        years = np.array(list(years), dtype=np.int32)
+        wanted = [self.elements.index(code) for code in data_types.split(",") if code in self.elements]
+        station_rows = {}
+        for station_id in self.nearest_stations(lat, lon):
+            rows = self.range_rows(station_id, first_doy, last_doy)
+            range_years = rows["year"].astype(np.int32) + (date_range.wraps & (rows["doy"] >= first_doy))
+            station_rows[station_id] = rows[np.isin(range_years, years) & np.isin(rows["element"], wanted)]
+        return self.columns(station_rows)
+
+
+_archive = None
+_archive_error = None
+_archive_lock = threading.Lock()
+
+
+def load_archive():
+    '''The purpose of this function is to open the archive once for the whole app, if one has been built and the
+    API backend has not been forced.
+    :param values: none
+    :return: GhcndArchive, or None to use the CDO web API
+    '''
+    global _archive, _archive_error
+    if os.environ.get(BACKEND_ENV, "auto") == "api":
+        return None
+    with _archive_lock:
+        store_dir = default_store_dir()
+        if _archive is None and _archive_error is None:
+            if os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+                try:
+                    _archive = GhcndArchive(store_dir)
+                except (OSError, ValueError) as e:
+                    _archive_error = str(e)
+            elif os.path.exists(os.path.join(store_dir, "index.npz")):
+                _archive_error = f"The GHCND archive in {store_dir} is in an older format. Please ingest it again."
+            # A broken archive is reported once and the web API is used instead
+            if _archive_error is not None:
+                print(f"Error: {_archive_error}")
+        return _archive
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "ingest":
+        print("Usage: python ghcnd_archive.py ingest path/to/ghcnd_all [store folder]")
+        print("ghcnd-stations.txt is read from ghcnd_all or the folder above it, or downloaded once")
+        sys.exit(1)
+    count = ingest(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+    print(f"Wrote {count} stations to {sys.argv[3] if len(sys.argv) == 4 else default_store_dir()}")
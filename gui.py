@@ -1,21 +1,25 @@
-import threading
 from tkinter.ttk import Combobox
 
-import numpy as np
-import requests
+import os
 from tkinter import *
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from api import API_KEY1, API_KEY2
-from PIL import Image, ImageTk
+from tkinter import ttk, messagebox, filedialog
+import batch
+import tracing
+import weather_core
+from animation import Animator, DriftAnimation, load_scaled_image
+from plot_manager import PlotManager
+from task_scheduler import TaskScheduler, check_cancelled, current_token, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 from tkinter import Toplevel, Label, Canvas, Frame, Scrollbar, Button
 
+# matplotlib and NumPy are loaded this long after the main menu appears, unless a plot or prediction needs them first
+WARM_UP_DELAY_MS = 500
+
+# The cloud of the main menu is read from next to this file and shrunk once to at most CLOUD_MAX_WIDTH pixels;
+# CLOUD_SPEED is in pixels per second
+CLOUD_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "newcloud.png")
+CLOUD_MAX_WIDTH = 200
+CLOUD_SPEED = 100
 
-# API keys for OpenWeatherMap and NOAA
-OPENWEATHER_API_KEY = API_KEY1
-NOAA_API_TOKEN = API_KEY2
 
 class WeatherWranglerApp:
     def __init__(self, root):
@@ -28,8 +32,29 @@ class WeatherWranglerApp:
         self.root.title("Weather Wrangler App")
         self.root.geometry("800x600")
 
+        # Every fetch runs on one bounded worker pool and posts its results back with root.after
+        self.scheduler = TaskScheduler(root)
+
+        # Query number of the city comparison on screen, so rows of a replaced comparison are dropped
+        self.batch_query = 0
+
+        # One frame-rate capped timer draws every animation, and pauses while the window is hidden or not focused
+        self.animator = Animator(root)
+
+        # Plot windows and their figures are reused between queries and released when the user closes them
+        self.plots = PlotManager(root, bg="#ADD8E6")
+
         # Main Menu
         self.create_main_menu()
+        self.root.after(WARM_UP_DELAY_MS, self.start_warm_up)
+
+    def start_warm_up(self):
+        '''The purpose of this function is to import the plotting and NumPy modules on a background worker once the
+        main menu is showing, so the first plot or prediction does not have to wait for them.
+        :param values: self = current instance of Weather wrangler class
+        :return: none
+        '''
+        self.scheduler.submit(warm_up_imports, priority=PRIORITY_BACKGROUND)
 
     def create_main_menu(self):
         '''Akhil worked on this function. The purpose of this function is to create and design the main menu window
@@ -45,22 +70,13 @@ class WeatherWranglerApp:
         self.canvas = Canvas(menu_frame, width=800, height=200, bg="#87CEEB", bd=0, highlightthickness=0)
         self.canvas.pack(fill="both", expand=True)
 
-        # Load and add the cloud image with Pillow
-        cloud_image = Image.open(r"C:\Users\mvvsg\PycharmProjects\CapstoneProject\newcloud.png")
-        self.cloud_image = ImageTk.PhotoImage(cloud_image)
-        self.cloud = self.canvas.create_image(-100, 50, image=self.cloud_image, anchor="nw")
-
-        # Animate the cloud
-        def animate_cloud():
-            current_x = self.canvas.coords(self.cloud)[0]
-            if current_x < 800:
-                new_x = current_x + 2
-                self.canvas.coords(self.cloud, new_x, 50)
-            else:
-                self.canvas.coords(self.cloud, -100, 50)
-            self.canvas.after(20, animate_cloud)
+        # Load and add the cloud image; Tk reads PNG files itself, so the menu does not need Pillow
+        self.cloud_image = load_scaled_image(CLOUD_IMAGE_PATH, CLOUD_MAX_WIDTH)
+        if self.cloud_image is not None:
+            self.cloud = self.canvas.create_image(-100, 50, image=self.cloud_image, anchor="nw")
 
-        animate_cloud()
+            # Animate the cloud
+            self.animator.add(DriftAnimation(self.canvas, self.cloud, CLOUD_SPEED, -100, 800, 50))
 
         # Adjust the vertical padding for the label to move everything up
         Label(menu_frame, text="Welcome to the Weather Wrangler App!", font=("Arial", 16, 'bold'),
@@ -70,6 +86,7 @@ class WeatherWranglerApp:
         self.styled_button(menu_frame, "Find Current Weather", self.current_weather)
         self.styled_button(menu_frame, "Historical Predictions", self.weather_probabilities)
         self.styled_button(menu_frame, "Weather Visualization", self.weather_pattern_visualization)
+        self.styled_button(menu_frame, "Compare Cities", self.city_comparison)
 
     # Button styling function
     def styled_button(self, parent, text, command):
@@ -112,20 +129,19 @@ class WeatherWranglerApp:
         :return: none
         '''
         city = self.city_entry.get()
-        weather_data = self.fetch_openweather_data(city)
+        self.scheduler.submit(self.fetch_openweather_data, city, priority=PRIORITY_INTERACTIVE, channel="current",
+                              on_done=self.show_current_weather)
+
+    def show_current_weather(self, weather_data):
+        '''The purpose of this function is to show the current weather once the worker pool has fetched it. It runs
+        on the GUI thread.
+        :param values: self = current instance of Weather wrangler class, weather_data = dictionary containing weather
+        data from API, or None on error
+        :return: none
+        '''
         if weather_data:
-            city_name = weather_data['name']
-            temperature = weather_data['main']['temp']
-            description = weather_data['weather'][0]['description']
-            humidity = weather_data['main']['humidity']
-            weather_summary = (
-                f"\nWeather Summary:\n"
-                f"City: {city_name}\n"
-                f"Temperature: {round((temperature * 9 / 5) + 32)}°F\n"
-                f"Description: {description.capitalize()}\n"
-                f"Humidity: {humidity}%"
-            )
-            self.show_weather_summary(weather_summary)
+            summary = weather_core.current_weather_summary(weather_data)
+            self.show_weather_summary(weather_core.format_current_weather(summary))
         else:
             print("Error: Unable to fetch weather data. Please check the city name or try again.")
 
@@ -135,20 +151,22 @@ class WeatherWranglerApp:
         :param values: self = current instance of Weather wrangler class, city = string of user inputted city name
         :return: dictionary containing weather data from API
         '''
-        api_url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
+        return weather_core.fetch_openweather_data(city)
 
-    def show_weather_summary(self, summary):
+    def show_weather_summary(self, summary, view=None):
         '''Akhil worked on this function. This formats all the result windows so that they would have a dark blue
         background, yellow font, and a close button.
-        :param values: self = current instance of Weather wrangler class, summary = string summarizing weather information
+        :param values: self = current instance of Weather wrangler class, summary = string summarizing weather information,
+        view = dictionary remembering the window of a summary that is still loading, so later updates replace its text
         :return: none
         '''
+        # A summary that is still loading updates its window instead of opening another one; if the user closed it,
+        # the later updates are dropped
+        if view is not None and "label" in view:
+            if view["label"].winfo_exists():
+                view["label"].config(text=summary)
+            return
+
         # Create the new window
         summary_window = Toplevel(self.root)
         summary_window.title("Weather Summary")
@@ -182,6 +200,8 @@ class WeatherWranglerApp:
             justify="center"
         )
         summary_label.pack(pady=10)
+        if view is not None:
+            view["label"] = summary_label
 
         # Add the close button, centered below the summary data
         self.styled_button(content_frame, "Close", summary_window.destroy)
@@ -195,17 +215,24 @@ class WeatherWranglerApp:
         '''
         prob_frame = Toplevel(self.root,  bg="#ADD8E6")  # Light blue background
         prob_frame.title("Historical Weather Predictions")
-        prob_frame.geometry("600x400")
+        prob_frame.geometry("600x500")
 
         Label(prob_frame, text="Enter City Name:", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
         self.region_entry = Entry(prob_frame, font=("Arial", 12))
         self.region_entry.pack(pady=5)
 
-        Label(prob_frame, text="Enter Date (MM-DD):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        Label(prob_frame, text="Enter Date (MM-DD, MM-DD to MM-DD, month or season):", font=("Arial", 12, "bold"),
+              bg="#ADD8E6").pack(pady=5)
         self.date_entry = Entry(prob_frame, font=("Arial", 12))
         self.date_entry.pack(pady=5)
 
+        Label(prob_frame, text="Enter Years (YYYY-YYYY):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        self.years_entry = Entry(prob_frame, font=("Arial", 12))
+        self.years_entry.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.years_entry.pack(pady=5)
+
         self.styled_button(prob_frame, "Show Historical Weather Predictions", self.start_thread)
+        self.styled_button(prob_frame, "Cancel", lambda: self.scheduler.cancel("historical"))
 
     def start_thread(self):
         '''Nihitha worked on this function. The purpose of this function is to use threading so that the GUI
@@ -213,8 +240,8 @@ class WeatherWranglerApp:
         :param values: self = current instance of Weather wrangler class
         :return: none
         '''
-        # Start a new thread for fetching NOAA data to avoid blocking the GUI
-        threading.Thread(target=self.display_weather_probabilities, daemon=True).start()
+        # Queue the NOAA fetch on the worker pool to avoid blocking the GUI; a newer query cancels this one
+        self.scheduler.submit(self.display_weather_probabilities, channel="historical")
 
     def display_weather_probabilities(self):
         '''Nihitha worked on this function. This function interprets the date entered so that the date can be
@@ -227,12 +254,8 @@ class WeatherWranglerApp:
 
         # Improved date parsing with error handling
         try:
-            if len(date) != 5 or date[2] != '-':
-                raise ValueError("Date must be in MM-DD format")
-            month, day = map(int, date.split('-'))
-
-            if month < 1 or month > 12 or day < 1 or day > 31:
-                raise ValueError("Invalid month or day value.")
+            date_range = weather_core.parse_date_range(date)
+            years = weather_core.parse_year_window(self.years_entry.get())
         except ValueError as ve:
             print(f"Error: {ve}")
             return
@@ -240,45 +263,58 @@ class WeatherWranglerApp:
         # Lookup latitude and longitude for the given city
         location = self.lookup_location_id(city)
         if not location:
-            print("Error: Unable to find location for the given city. Please check the city name or try again.")
+            print(f"Error: {weather_core.location_not_found_message(city)}")
             return
 
         lat, lon = location
 
-        # Start a thread to fetch NOAA historical data
-        threading.Thread(target=self.fetch_and_process_historical_data, args=(lat, lon, city, month, day),
-                         daemon=True).start()
+        # Ranges of days, like 12-20 to 01-05 or a season, are fetched a year's range per request
+        if not date_range.single_day:
+            self.fetch_and_process_range_data(lat, lon, city, date_range, years)
+            return
+        month, day = date_range.start
+
+        # A precomputed climatology answers at once, without any download or aggregation
+        prediction = weather_core.climatology_prediction(lat, lon, month, day, years[0], years[-1])
+        if prediction is not None:
+            prediction_summary = weather_core.format_historical_prediction(city, month, day, prediction, years=years)
+            self.root.after(0, lambda: self.show_weather_summary(prediction_summary))
+            return
+
+        # Fetch NOAA historical data on this worker, unless a newer query has already replaced this one
+        check_cancelled()
+        self.fetch_and_process_historical_data(lat, lon, city, month, day, years)
 
     def lookup_location_id(self, city):
         '''Nihitha worked on this function. This function looks up the latitude and longitude coordinates of the city
-        using the OpenWeatherMap API entered so that we can fetch the NOAA data from the API since it requires
-        coordinates for the location.
+        entered so that we can fetch the NOAA data from the API since it requires coordinates for the location. The
+        local gazetteer is checked first and the OpenWeatherMap API is only used when the city is not in it.
         :param values: self = current instance of Weather wrangler class, city = string of city name
         :return: tuple of latitude and longitude if the city is found
         '''
-        # Use OpenWeatherMap to get latitude and longitude of the city
-        weather_data = self.fetch_openweather_data(city)
-        if not weather_data:
-            return None
-
-        lat = weather_data['coord']['lat']
-        lon = weather_data['coord']['lon']
-
-        return lat, lon
+        return weather_core.lookup_location_id(city)
 
-    def fetch_and_process_historical_data(self, lat, lon, city, month, day):
+    @tracing.traced("gui.fetch_and_process_historical_data")
+    def fetch_and_process_historical_data(self, lat, lon, city, month, day, years=None):
         '''Nihitha worked on this function. The purpose of this function is to call the function that fetches NOAA
         data to apply to the user inputted city and date.
         :param values: self = current instance of Weather wrangler class, lat = float of latitude of city, 
         lon = float of longitude of city, city = string of city name, month = integer of month part of date, 
-        day = integer of day part of the date
+        day = integer of day part of the date, years = range of years to use (defaults to the standard window)
         :return: none
         '''
-        # Fetch NOAA historical data
-        data = self.fetch_noaa_historical_data(lat, lon, month, day)
-        if data:
-            self.process_historical_data(data, city, month, day)
-        else:
+        # Stream NOAA historical data a year at a time and refresh one summary window as each year arrives
+        data = []
+        summary_view = {}
+        years_loaded = 0
+        for _, records in self.stream_noaa_historical_data(lat, lon, month, day, years):
+            check_cancelled()
+            years_loaded += 1
+            # Each year comes as columns; adding them gives new columns, so earlier summaries keep their data
+            data = data + records
+            if data:
+                self.process_historical_data(data, city, month, day, summary_view, years_loaded, years)
+        if not data:
             print("No data available or error fetching data.")
 
     def fetch_noaa_historical_data(self, lat, lon, month, day):
@@ -286,47 +322,90 @@ class WeatherWranglerApp:
         past ten years so that we can perform calculations on it
         :param values: self = current instance of Weather wrangler class, lat = float of latitude of city, 
         lon = float of longitude of city, month = integer of month part of date, day = integer of day part of the date 
-        :return: list of historical weather data dictionaries
+        :return: aggregation.RecordColumns of the historical weather data
         '''
-        # NOAA API endpoint
-        endpoint = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
-        headers = {"token": NOAA_API_TOKEN}
-
-        # Retrieve data for multiple years (e.g., last 10 years)
-        start_year = 2014
-        end_year = 2023
-        results = []
-
-        for year in range(start_year, end_year + 1):
-            startdate = f"{year}-{month:02d}-{day:02d}"
-            enddate = f"{year}-{month:02d}-{day:02d}"
-
-            params = {
-                "datasetid": "GHCND",  # Global Historical Climatology Network Daily
-                "datatypeid": "TMAX,TMIN,PRCP,SNOW",  # Collect relevant data types
-                "startdate": startdate,
-                "enddate": enddate,
-                "limit": 1000,  # Maximum results
-                "units": "metric",
-                "latitude": lat,
-                "longitude": lon,
-            }
-
-            response = requests.get(endpoint, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if "results" in data:
-                    results.extend(data["results"])
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-
-        return results
-
-    def process_historical_data(self, data, city, month, day):
+        return weather_core.fetch_noaa_historical_data(lat, lon, month, day)
+
+    def stream_noaa_historical_data(self, lat, lon, month, day, years=None,
+                                    data_types=weather_core.HISTORICAL_DATA_TYPES):
+        '''The purpose of this function is to get the same data as fetch_noaa_historical_data one year at a time,
+        stopping the remaining requests when the running task is cancelled.
+        :param values: self = current instance of Weather wrangler class, lat = float of latitude of city,
+        lon = float of longitude of city, month = integer of month part of date, day = integer of day part of the date,
+        years = range of years to use (defaults to the standard window), data_types = string of comma separated NOAA
+        datatype ids to download
+        :return: generator of years and their aggregation.RecordColumns
+        '''
+        years = years or weather_core.history_years()
+        return weather_core.stream_noaa_historical_data(lat, lon, month, day, data_types, cancel=current_token(),
+                                                        start_year=years[0], end_year=years[-1])
+
+    def stream_noaa_range_data(self, lat, lon, date_range, years=None, data_types=weather_core.HISTORICAL_DATA_TYPES):
+        '''The purpose of this function is to get the data of a range of days a batch at a time, stopping the
+        remaining requests when the running task is cancelled.
+        :param values: self = current instance of Weather wrangler class, lat = float of latitude of city,
+        lon = float of longitude of city, date_range = range of days typed by the user, years = range of years to use,
+        data_types = string of comma separated NOAA datatype ids to download
+        :return: generator of aggregation.RecordColumns
+        '''
+        years = years or weather_core.history_years()
+        return weather_core.stream_noaa_range_data(lat, lon, date_range, data_types, cancel=current_token(),
+                                                   start_year=years[0], end_year=years[-1])
+
+    @tracing.traced("gui.fetch_and_process_range_data")
+    def fetch_and_process_range_data(self, lat, lon, city, date_range, years):
+        '''The purpose of this function is to show the historical prediction of a range of days. The summary is
+        refreshed as each batch of years arrives, and the stats of every day are shown once all of them are in.
+        :param values: self = current instance of Weather wrangler class, lat = float of latitude of city,
+        lon = float of longitude of city, city = string of city name, date_range = range of days typed by the user,
+        years = range of years to use
+        :return: none
+        '''
+        summary_view = {}
+        prediction = weather_core.climatology_range_prediction(lat, lon, date_range, years[0], years[-1])
+        if prediction is None:
+            data = []
+            for records in self.stream_noaa_range_data(lat, lon, date_range, years):
+                check_cancelled()
+                data = data + records
+                if data:
+                    partial = weather_core.summarize_range_data(data, date_range)
+                    partial_summary = weather_core.format_range_prediction(city, date_range, partial, years, True)
+                    self.root.after(0, lambda summary=partial_summary: self.show_weather_summary(summary, summary_view))
+            if not data:
+                print("No historical data available for the selected dates.")
+                return
+            prediction = weather_core.summarize_range_data(data, date_range)
+
+        prediction_summary = weather_core.format_range_prediction(city, date_range, prediction, years)
+        self.root.after(0, lambda: self.show_weather_summary(prediction_summary, summary_view))
+        self.root.after(0, lambda: self.show_range_days(city, date_range, prediction["days"]))
+
+    def show_range_days(self, city, date_range, days):
+        '''The purpose of this function is to show the historical averages of every day of a range in a table.
+        :param values: self = current instance of Weather wrangler class, city = string of city name, date_range =
+        range of days typed by the user, days = dictionary of MM-DD to the averages of that day
+        :return: none
+        '''
+        columns = ["date"] + batch.TABLE_COLUMNS[1:-1]
+        days_window = Toplevel(self.root, bg="#ADD8E6")
+        days_window.title(f"{city} from {date_range.label()}")
+        days_window.geometry("800x500")
+
+        days_table = ttk.Treeview(days_window, columns=columns, show="headings")
+        for column in columns:
+            days_table.heading(column, text=batch.COLUMN_TITLES.get(column, "Date"))
+            days_table.column(column, width=120, anchor="center")
+        for day, prediction in days.items():
+            days_table.insert("", END, values=[day] + [prediction[column] for column in columns[1:]])
+        days_table.pack(pady=10, padx=10, fill="both", expand=True)
+
+    @tracing.traced("gui.process_historical_data")
+    def process_historical_data(self, data, city, month, day, view=None, years_loaded=None, years=None):
         '''Nihitha worked on this function. The purpose of this function is to perform calculations on the data we fetched
         from the API so that we can get the average of different temperatures/weather types so the user can see what the
         weather is approximately like in a city during that time of year.
-        :param values: self = current instance of Weather wrangler class, data = list of NOAA weather data dictionaries, city = string of city name, month = integer of month part of date, day = integer of day part of date
+        :param values: self = current instance of Weather wrangler class, data = aggregation.RecordColumns of NOAA weather data, city = string of city name, month = integer of month part of date, day = integer of day part of date, view = dictionary holding the summary window to update, years_loaded = integer of years fetched so far, years = range of years of the query
         :return: none
         '''
         # Initialize counters and sums for each data type
@@ -335,48 +414,12 @@ class WeatherWranglerApp:
             print("No historical data available for the selected date.")
             return
 
-        avg_temp_max = avg_temp_min = total_precipitation = 0
-        count_temp_max = count_temp_min = count_precipitation = count_snow = 0
-        snow_days = 0
-
-        # Loop through the data to aggregate information
-        for record in data:
-            if record["datatype"] == "TMAX":
-                avg_temp_max += record["value"]
-                count_temp_max += 1
-            elif record["datatype"] == "TMIN":
-                avg_temp_min += record["value"]
-                count_temp_min += 1
-            elif record["datatype"] == "PRCP":
-                total_precipitation += record["value"]
-                count_precipitation += 1
-            elif record["datatype"] == "SNOW":
-                count_snow += 1
-                if record["value"] > 0:
-                    snow_days += 1
-
-        # Safely calculate averages if there is data available
-        if count_temp_max > 0:
-            avg_temp_max /= count_temp_max
-        if count_temp_min > 0:
-            avg_temp_min /= count_temp_min
-        if count_precipitation > 0:
-            avg_precipitation = total_precipitation / count_precipitation
-        else:
-            avg_precipitation = 0
-
-        snow_probability = (snow_days / count_snow) * 100 if count_snow > 0 else 0
-
         # Create prediction summary
-        prediction_summary = (
-            f"\nHistorical Weather Prediction for {city} on {month:02d}-{day:02d}:\n"
-            f"Average Maximum Temperature: {round((avg_temp_max * 9 / 5) + 32)}°F\n"
-            f"Average Minimum Temperature: {round((avg_temp_min * 9 / 5) + 32)}°F\n"
-            f"Average Precipitation: {avg_precipitation:.2f} mm\n"
-            f"Probability of Snow: {snow_probability:.2f}%"
-        )
+        prediction = weather_core.summarize_historical_data(data)
+        prediction_summary = weather_core.format_historical_prediction(city, month, day, prediction, years_loaded,
+                                                                       years)
         # Use the main thread to show the weather summary in the GUI
-        self.root.after(0, lambda: self.show_weather_summary(prediction_summary))
+        self.root.after(0, lambda: self.show_weather_summary(prediction_summary, view))
 
     # ============= Weather Pattern Visualization ============= #
 
@@ -388,27 +431,32 @@ class WeatherWranglerApp:
         '''
         pattern_frame = Toplevel(self.root, bg="#ADD8E6")  # Light blue background
         pattern_frame.title("Weather Pattern Visualization")
-        pattern_frame.geometry("600x500")
+        pattern_frame.geometry("600x600")
 
         # Dropdown for weather pattern
         Label(pattern_frame, text="Select Weather Pattern:", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=10)
 
         # Only store the user-friendly names in the combobox
-        self.pattern_combobox = Combobox(pattern_frame, values=[
-            "Max Temperature", "Min Temperature", "Precipitation", "Snowfall", "Average Temperature"
-        ], font=("Arial", 12))
+        self.pattern_combobox = Combobox(pattern_frame, values=list(weather_core.PATTERN_CODES), font=("Arial", 12))
         self.pattern_combobox.pack(pady=5)
 
         # Date and City entries
-        Label(pattern_frame, text="Enter Date (MM-DD):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=10)
+        Label(pattern_frame, text="Enter Date (MM-DD, MM-DD to MM-DD, month or season):", font=("Arial", 12, "bold"),
+              bg="#ADD8E6").pack(pady=10)
         self.date_entry_pattern = Entry(pattern_frame, font=("Arial", 12))
         self.date_entry_pattern.pack(pady=5)
 
+        Label(pattern_frame, text="Enter Years (YYYY-YYYY):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=10)
+        self.years_entry_pattern = Entry(pattern_frame, font=("Arial", 12))
+        self.years_entry_pattern.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.years_entry_pattern.pack(pady=5)
+
         Label(pattern_frame, text="Enter City:", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=10)
         self.city_entry_pattern = Entry(pattern_frame, font=("Arial", 12))
         self.city_entry_pattern.pack(pady=5)
 
         self.styled_button(pattern_frame, "Show Weather Pattern", self.start_pattern_thread)
+        self.styled_button(pattern_frame, "Cancel", lambda: self.scheduler.cancel("pattern"))
 
     def start_pattern_thread(self):
         '''Angel worked on this function. This starts a thread so that the GUI won't stop responding due to the data
@@ -416,9 +464,10 @@ class WeatherWranglerApp:
         :param values: self = current instance of Weather wrangler class
         :return: none
         '''
-        # Start a new thread for fetching NOAA data to avoid blocking the GUI
-        threading.Thread(target=self.fetch_weather_pattern_data, daemon=True).start()
+        # Queue the NOAA fetch on the worker pool to avoid blocking the GUI; a newer query cancels this one
+        self.scheduler.submit(self.fetch_weather_pattern_data, channel="pattern")
 
+    @tracing.traced("gui.fetch_weather_pattern_data")
     def fetch_weather_pattern_data(self):
         '''Angel worked on this function. The purpose of this function is to fetch and process the weather data obtained
         from the NOAA API for the inputted city, date, and weather pattern. It ensures that all the information inputted
@@ -432,17 +481,8 @@ class WeatherWranglerApp:
         # Get the selected pattern name from the combobox
         selected_pattern_name = self.pattern_combobox.get().strip()
 
-        # Map user-friendly names to their respective NOAA pattern codes
-        pattern_map = {
-            "Max Temperature": "TMAX",
-            "Min Temperature": "TMIN",
-            "Precipitation": "PRCP",
-            "Snowfall": "SNOW",
-            "Average Temperature": "TAVG"
-        }
-
         # Get the corresponding pattern code based on the selected name
-        selected_pattern_code = pattern_map.get(selected_pattern_name)
+        selected_pattern_code = weather_core.PATTERN_CODES.get(selected_pattern_name)
 
         # Debugging: Print the selected pattern code
         print(f"Selected pattern from combobox (code): {selected_pattern_code}")
@@ -453,60 +493,82 @@ class WeatherWranglerApp:
 
         # Input validation for date
         try:
-            if len(date) != 5 or date[2] != '-':
-                raise ValueError("Date must be in MM-DD format")
-            month, day = map(int, date.split('-'))
-
-            if month < 1 or month > 12 or day < 1 or day > 31:
-                raise ValueError("Invalid month or day value.")
+            date_range = weather_core.parse_date_range(date)
         except ValueError as ve:
             messagebox.showerror("Invalid Date", f"Error: {ve}")
             return
+        try:
+            years = weather_core.parse_year_window(self.years_entry_pattern.get())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Years", f"Error: {ve}")
+            return
 
         # Fetch data from NOAA API for this city and date
         location = self.lookup_location_id(city)
         if location:
             lat, lon = location
-            data = self.fetch_noaa_historical_data(lat, lon, month, day)
-            if data:
-                # Get all unique data types from the fetched data
-                available_types = list(set(record["datatype"] for record in data))
-
-                # If the specific pattern is not found, show available types
-                if selected_pattern_code not in available_types:
-                    available_types_str = ", ".join(sorted(available_types))
 
-                    # Create a popup to inform the user about available data types
-                    pattern_window = Toplevel(self.root, bg="#ADD8E6")
-                    pattern_window.title("Available Weather Data Types")
-                    pattern_window.geometry("400x300")
+            # Stream only the selected datatype in and redraw one plot window whenever a batch adds points
+            data = []
+            plot_view = {}
+            if date_range.single_day:
+                month, day = date_range.start
+                batches = (records for _, records in self.stream_noaa_historical_data(lat, lon, month, day, years,
+                                                                                      selected_pattern_code))
+            else:
+                batches = self.stream_noaa_range_data(lat, lon, date_range, years, selected_pattern_code)
+            for records in batches:
+                check_cancelled()
+                data = data + records
+                if records:
+                    # The columns are never changed in place, so the plot can read them while the next batch loads
+                    self.root.after(0, lambda data=data: self.plot_weather_pattern(
+                        data, selected_pattern_code, plot_view, date_range, years))
+
+            if not data:
+                # Only when nothing was found is the station metadata asked which datatypes were recorded here, so
+                # the normal path costs no extra requests and a datatype is never refused before it is fetched
+                available_types = weather_core.available_pattern_types(lat, lon, years[0], years[-1])
+                if available_types and selected_pattern_code not in available_types:
+                    self.root.after(0, lambda: self.show_available_types(selected_pattern_name, available_types))
+                else:
+                    messagebox.showerror("Data Error", "No data available for the selected date and location.")
+        else:
+            messagebox.showerror("Location Error", weather_core.location_not_found_message(city))
 
-                    label = Label(pattern_window,
-                                  text=f"'{selected_pattern_name}' not found.\n\nAvailable Data Types:\n{available_types_str}",
-                                  font=("Arial", 12), bg="#ADD8E6", wraplength=350, justify=LEFT)
-                    label.pack(pady=20)
+    def show_available_types(self, pattern_name, available_types):
+        '''The purpose of this function is to tell the user that the selected pattern was not recorded near the city,
+        and which datatypes were.
+        :param values: self = current instance of Weather wrangler class, pattern_name = string of selected pattern
+        name, available_types = dictionary of NOAA datatype id to its name
+        :return: none
+        '''
+        available_types_str = ", ".join(sorted(available_types))
 
-                    # Create a listbox to show available types
-                    listbox = Listbox(pattern_window, width=50, font=("Arial", 12))
-                    for data_type in sorted(available_types):
-                        listbox.insert(END, data_type)
-                    listbox.pack(pady=10)
+        # Create a popup to inform the user about available data types
+        pattern_window = Toplevel(self.root, bg="#ADD8E6")
+        pattern_window.title("Available Weather Data Types")
+        pattern_window.geometry("400x300")
 
-                    # Add a close button
-                    self.styled_button(pattern_window, "Close", pattern_window.destroy)
+        label = Label(pattern_window,
+                      text=f"'{pattern_name}' not found.\n\nAvailable Data Types:\n{available_types_str}",
+                      font=("Arial", 12), bg="#ADD8E6", wraplength=350, justify=LEFT)
+        label.pack(pady=20)
 
-                    return
+        # Create a listbox to show available types
+        listbox = Listbox(pattern_window, width=50, font=("Arial", 12))
+        for data_type in sorted(available_types):
+            listbox.insert(END, f"{data_type} - {available_types[data_type]}")
+        listbox.pack(pady=10)
 
-                self.root.after(0, lambda: self.plot_weather_pattern(data, selected_pattern_code))
-            else:
-                messagebox.showerror("Data Error", "No data available for the selected date and location.")
-        else:
-            messagebox.showerror("Location Error", "Unable to find city location. Please check the city name.")
+        # Add a close button
+        self.styled_button(pattern_window, "Close", pattern_window.destroy)
 
-    def plot_weather_pattern(self, data, pattern):
+    @tracing.traced("gui.plot_weather_pattern")
+    def plot_weather_pattern(self, data, pattern, view=None, date_range=None, years_window=None):
         '''Angel worked on this function. The purpose of this function is to plot the data for the user specified
         information.
-        :param values: self = current instance of Weather wrangler class, data = list of NOAA weather data dictionaries, pattern = string of selected weather pattern code
+        :param values: self = current instance of Weather wrangler class, data = aggregation.RecordColumns of NOAA weather data, pattern = string of selected weather pattern code, view = dictionary remembering the plot of a query that is still loading, so later updates redraw it, date_range = range of days typed by the user (None for one MM-DD), years_window = range of years of the query, which the x-axis spans
         :return: none
         '''
         # Check if data is available
@@ -515,7 +577,7 @@ class WeatherWranglerApp:
             return
 
         # Get unique data types from the NOAA dataset
-        available_data_types = set(record["datatype"] for record in data)
+        available_data_types = set(data.datatype_ids())
 
         # If the specified pattern is not in the dataset, show available types
         if pattern not in available_data_types:
@@ -525,88 +587,197 @@ class WeatherWranglerApp:
             return
 
         # Filter data for the selected pattern
-        pattern_data = [record for record in data if record["datatype"] == pattern]
+        pattern_data = data.of_datatype(pattern)
 
         # Ensure there is enough data to plot
         if not pattern_data:
             messagebox.showerror("Data Error", f"No records found for pattern '{pattern}'.")
             return
 
-        # Convert dates and improve data handling
-        import datetime
-
-        # Group values by year
-        year_values = {}
-        for record in pattern_data:
-            date = datetime.datetime.fromisoformat(record["date"].replace('Z', '+00:00'))
-            year = date.year
-            if year not in year_values:
-                year_values[year] = []
-            year_values[year].append(record["value"])
+        # Average the values of each year, in °F for temperatures; a range that runs over the new year counts once
+        if date_range is None or date_range.single_day:
+            years, avg_values = weather_core.weather_pattern_series(pattern_data, pattern)
+            date_label = None
+        else:
+            years, avg_values = weather_core.range_pattern_series(pattern_data, pattern, date_range)
+            date_label = date_range.label()
 
-        # Prepare data for plotting
-        years = sorted(year_values.keys())
-        avg_values = [np.mean(year_values[year]) for year in years]
+        # Plotting with improved data handling
+        try:
+            # Title with the weather pattern and city, annotated with the specific date
+            city = self.city_entry_pattern.get().strip()
+            first_record_date = pattern_data[0]["date"]
+            month, day = int(first_record_date[5:7]), int(first_record_date[8:10])
+
+            date_label = date_label or f"{month:02d}-{day:02d}"
+            years_window = years_window or range(years[0], years[-1] + 1)
+
+            # A new query takes over the open plot window and its figure; later years of the same query only update
+            # the line. If the user closed the plot, or a newer query took it over, the update is dropped
+            plot = view.get("plot") if view is not None else None
+            if plot is None:
+                plot = self.plots.pattern_plot("pattern", f"{pattern} Weather Pattern Plot")
+                plot.reset(pattern, city, date_label, years_window, owner=view)
+                if view is not None:
+                    view["plot"] = plot
+            elif plot.closed or plot.owner is not view:
+                return
+            plot.update(years, avg_values)
 
-        # Convert to Fahrenheit if the pattern is a temperature
-        if pattern in ["TMAX", "TMIN", "TAVG"]:
-            avg_values = [((value * 9 / 5) + 32) for value in avg_values]  # Convert Celsius to Fahrenheit
+        except Exception as e:
+            print(f"Error while plotting data: {e}")
+            messagebox.showerror("Plotting Error", f"An error occurred while plotting: {e}")
 
-        # Plotting with improved data handling
+    # ============= City Comparison ============= #
+    def city_comparison(self):
+        '''The purpose of this function is to create the window for comparing the historical weather of one date
+        across many cities, typed one per line or loaded from a CSV file, as a table or as a plot with a line per city.
+        :param values: self = current instance of Weather wrangler class
+        :return: none
+        '''
+        compare_frame = Toplevel(self.root, bg="#ADD8E6")  # Light blue background
+        compare_frame.title("Compare Cities")
+        compare_frame.geometry("900x880")
+
+        Label(compare_frame, text="Enter Cities (one per line):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        self.batch_cities_text = Text(compare_frame, height=5, width=40, font=("Arial", 12))
+        self.batch_cities_text.pack(pady=5)
+        self.styled_button(compare_frame, "Load Cities from CSV", self.load_batch_csv)
+
+        Label(compare_frame, text="Enter Date (MM-DD):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        self.batch_date_entry = Entry(compare_frame, font=("Arial", 12))
+        self.batch_date_entry.pack(pady=5)
+
+        Label(compare_frame, text="Enter Years (YYYY-YYYY):", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        self.batch_years_entry = Entry(compare_frame, font=("Arial", 12))
+        self.batch_years_entry.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.batch_years_entry.pack(pady=5)
+
+        Label(compare_frame, text="Pattern to Plot:", font=("Arial", 12, "bold"), bg="#ADD8E6").pack(pady=5)
+        self.batch_pattern_combobox = Combobox(compare_frame, values=list(weather_core.PATTERN_CODES),
+                                               font=("Arial", 12))
+        self.batch_pattern_combobox.pack(pady=5)
+
+        self.styled_button(compare_frame, "Compare Cities", self.start_batch_comparison)
+        self.styled_button(compare_frame, "Plot Pattern for All Cities", self.start_batch_plot)
+        self.styled_button(compare_frame, "Cancel", self.cancel_batch)
+
+        # One row per city, filled in as each city finishes
+        self.batch_table = ttk.Treeview(compare_frame, columns=batch.TABLE_COLUMNS, show="headings", height=8)
+        for column in batch.TABLE_COLUMNS:
+            self.batch_table.heading(column, text=batch.COLUMN_TITLES[column])
+            self.batch_table.column(column, width=120, anchor="center")
+        self.batch_table.pack(pady=10, padx=10, fill="both", expand=True)
+
+    def load_batch_csv(self):
+        '''The purpose of this function is to fill the city list from a CSV file chosen by the user.
+        :param values: self = current instance of Weather wrangler class
+        :return: none
+        '''
+        path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
         try:
-            fig, ax = plt.subplots(figsize=(10, 6))
+            cities = batch.read_cities(path)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("File Error", f"Unable to read the file: {e}")
+            return
+        self.batch_cities_text.delete("1.0", END)
+        self.batch_cities_text.insert("1.0", "\n".join(cities))
 
-            # Plot average values for each year
-            ax.plot(years, avg_values, marker="o", linestyle="-", color='blue')
+    def read_batch_inputs(self):
+        '''The purpose of this function is to check the city list and date of the comparison window.
+        :param values: self = current instance of Weather wrangler class
+        :return: tuple of the list of cities, month, day and range of years, or None if an input is invalid
+        '''
+        cities = batch.parse_cities(self.batch_cities_text.get("1.0", END))
+        if not cities:
+            messagebox.showerror("Invalid Cities", "Please enter at least one city.")
+            return None
+        try:
+            month, day = weather_core.parse_month_day(self.batch_date_entry.get().strip())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Date", f"Error: {ve}")
+            return None
+        try:
+            years = weather_core.parse_year_window(self.batch_years_entry.get())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Years", f"Error: {ve}")
+            return None
+        return cities, month, day, years
 
-            # Set x-axis ticks to be the years
-            ax.set_xticks(years)
-            ax.set_xticklabels(years, rotation=45)
+    def start_batch_comparison(self):
+        '''The purpose of this function is to start the comparison table on the worker pool. Each city is added to
+        the table as soon as it is done.
+        :param values: self = current instance of Weather wrangler class
+        :return: none
+        '''
+        inputs = self.read_batch_inputs()
+        if inputs is None:
+            return
+        cities, month, day, years = inputs
+
+        self.batch_query += 1
+        query = self.batch_query
+        self.batch_table.delete(*self.batch_table.get_children())
+        # The cities are fetched on batch's own pool, so the task's cancel token is handed to it to stop them
+        on_row = lambda row: self.root.after(0, lambda: self.add_batch_row(row, query))
+        self.scheduler.submit(lambda: batch.compare_cities(cities, month, day, batch.BATCH_WORKERS, on_row, years[0],
+                                                           years[-1], cancel=current_token()), channel="batch")
+
+    def add_batch_row(self, row, query):
+        # Rows of a comparison that was cancelled or replaced are dropped
+        if query != self.batch_query or not self.batch_table.winfo_exists():
+            return
+        self.batch_table.insert("", END, values=[row.get(column, "") for column in batch.TABLE_COLUMNS])
 
-            # Set title with the weather pattern and city
-            city = self.city_entry_pattern.get().strip()
+    def start_batch_plot(self):
+        '''The purpose of this function is to start the multi-city plot of the selected pattern on the worker pool.
+        :param values: self = current instance of Weather wrangler class
+        :return: none
+        '''
+        pattern = weather_core.PATTERN_CODES.get(self.batch_pattern_combobox.get().strip())
+        if not pattern:
+            messagebox.showerror("Invalid Pattern", "Please select a weather pattern to plot.")
+            return
+        inputs = self.read_batch_inputs()
+        if inputs is None:
+            return
+        cities, month, day, years = inputs
+
+        self.scheduler.submit(lambda: batch.compare_patterns(cities, month, day, pattern, batch.BATCH_WORKERS, years[0],
+                                                             years[-1], cancel=current_token()),
+                              channel="batch_plot",
+                              on_done=lambda series: self.plot_batch_comparison(series, pattern, month, day))
+
+    def cancel_batch(self):
+        self.batch_query += 1
+        self.scheduler.cancel("batch")
+        self.scheduler.cancel("batch_plot")
+
+    def plot_batch_comparison(self, series, pattern, month, day):
+        '''The purpose of this function is to show the yearly series of every city in one plot.
+        :param values: self = current instance of Weather wrangler class, series = dictionary of city name to years
+        and averages, pattern = string of NOAA pattern code, month = integer of month, day = integer of day
+        :return: none
+        '''
+        if not series:
+            messagebox.showerror("Data Error", f"No records found for pattern '{pattern}'.")
+            return
+        plot_window = self.plots.figure_window("batch", f"{pattern} City Comparison")
+        plot_window.redraw(batch.draw_comparison, series, pattern, month, day)
 
-            # Dynamically set y-axis label based on pattern
-            pattern_labels = {
-                "TMAX": "Maximum Temperature (°F)",
-                "TMIN": "Minimum Temperature (°F)",
-                "PRCP": "Precipitation (mm)",
-                "SNOW": "Snowfall (mm)",
-                "TAVG": "Average Temperature (°F)",
-            }
-            ax.set_title(f"{pattern_labels.get(pattern)} in {city.capitalize()}", fontsize=15)
-            ax.set_xlabel("Year", fontsize=12)
-            ax.set_ylabel(pattern_labels.get(pattern, "Value"), fontsize=12)
-
-            ax.grid(True, linestyle='--', alpha=0.7)
-
-            # Add text annotation with specific date
-            if pattern_data:
-                first_record_date = datetime.datetime.fromisoformat(pattern_data[0]["date"].replace('Z', '+00:00'))
-                plt.text(0.05, 0.95, f"Data for {first_record_date.month:02d}-{first_record_date.day:02d}",
-                         transform=ax.transAxes, verticalalignment='top')
-
-            # Tight layout to prevent cutting off labels
-            plt.tight_layout()
-
-            # Display plot in the GUI
-            plot_window = Toplevel(self.root, bg="#ADD8E6")
-            plot_window.title(f"{pattern} Weather Pattern Plot")
-            plot_window.geometry("800x600")
-
-            canvas = FigureCanvasTkAgg(fig, master=plot_window)
-            canvas.get_tk_widget().pack(fill=BOTH, expand=True)
-            canvas.draw()
 
-        except Exception as e:
-            print(f"Error while plotting data: {e}")
-            messagebox.showerror("Plotting Error", f"An error occurred while plotting: {e}")
+def warm_up_imports():
+    weather_core.warm_up()
+    import matplotlib.backends.backend_tkagg
 
 
 # Run App
-try:
-    root = Tk()
-    app = WeatherWranglerApp(root)
-    root.mainloop()
-except Exception as e:
-    print(f"An error occurred: {e}")
+if __name__ == "__main__":
+    try:
+        root = Tk()
+        app = WeatherWranglerApp(root)
+        root.mainloop()
+    except Exception as e:
+        print(f"An error occurred: {e}")
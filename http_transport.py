@@ -0,0 +1,89 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import tracing
+
+
+# Connect and read timeouts in seconds, so a stalled API never hangs a worker thread forever
+DEFAULT_TIMEOUT = (5, 30)
+
+# Enough pooled connections for every concurrent NOAA request of a token
+POOL_SIZE = 10
+
+# Retry server errors with exponential backoff (0.5s, 1s, 2s, ...). A 429 is left to rate_limit, which holds the key
+# back and queues the request again instead of retrying past the quota
+RETRY_SETTINGS = dict(
+    total=4,
+    backoff_factor=0.5,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session():
+    '''The purpose of this function is to build a session with a sized keep-alive connection pool, gzip and the
+    retry policy.
+    :param values: none
+    :return: requests.Session
+    '''
+    # requests is only imported by the first request, so starting the app does not wait for it
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=Retry(**RETRY_SETTINGS))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return session
+
+
+def session_for(url):
+    '''The purpose of this function is to get the shared session for the host of a url, so every request to the same
+    API reuses the already open TCP and TLS connections.
+    :param values: url = string of request url
+    :return: requests.Session for the host
+    '''
+    parts = urlsplit(url)
+    host = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = create_session()
+        return _sessions[host]
+
+
+def http_get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''The purpose of this function is to send a GET request through the pooled session of its host.
+    :param values: url = string of request url, timeout = connect and read timeouts, kwargs = any other arguments
+    accepted by requests.get
+    :return: requests.Response
+    '''
+    if not tracing.enabled():
+        return session_for(url).get(url, timeout=timeout, **kwargs)
+
+    # Timed per endpoint without the query, so every NOAA data request shares one histogram
+    parts = urlsplit(url)
+    endpoint = parts.netloc + parts.path
+    start = time.perf_counter()
+    try:
+        response = session_for(url).get(url, timeout=timeout, **kwargs)
+    except Exception:
+        tracing.count("http_requests_total", endpoint=endpoint, status="error")
+        raise
+    tracing.observe("http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+    tracing.count("http_requests_total", endpoint=endpoint, status=response.status_code)
+    return response
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,203 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+from data_paths import data_path
+from noaa_records import records_from_json, records_to_json
+
+
+# Past years never change, but a year that is still in progress can still receive late records
+IN_PROGRESS_TTL_SECONDS = 6 * 60 * 60
+
+# Late records of December keep arriving for weeks, so the previous year counts as in progress until this month and day
+PREVIOUS_YEAR_GRACE_END = (3, 1)
+
+# Coordinates are rounded so tiny differences from the geocoder still share a cache entry
+COORD_DECIMALS = 4
+
+
+def normalize_data_types(data_types):
+    '''The purpose of this function is to turn a datatype list into a stable key so "TMIN,TMAX" and "TMAX,TMIN"
+    share the same cache entry.
+    :param values: data_types = string of comma separated datatype ids or iterable of datatype ids
+    :return: string of sorted, comma separated datatype ids
+    '''
+    if isinstance(data_types, str):
+        data_types = data_types.split(",")
+    return ",".join(sorted(set(code.strip() for code in data_types if code.strip())))
+
+
+def first_year_in_progress(today=None):
+    '''The purpose of this function is to find the earliest year that can still get new records.
+    :param values: today = date used as the current day (defaults to today)
+    :return: integer of the previous year until the end of February, and of the current year after that
+    '''
+    today = today or datetime.date.today()
+    if (today.month, today.day) < PREVIOUS_YEAR_GRACE_END:
+        return today.year - 1
+    return today.year
+
+
+def year_in_progress(year, today=None):
+    '''The purpose of this function is to decide whether a year can still get new records.
+    :param values: year = integer year, today = date used as the current day (defaults to today)
+    :return: True if the year is the current year or later, or the previous year until the end of February
+    '''
+    return year >= first_year_in_progress(today)
+
+
+class NoaaDayCache:
+    def __init__(self, path=None, in_progress_ttl=IN_PROGRESS_TTL_SECONDS):
+        '''The purpose of this function is to open (or create) the SQLite file that keeps NOAA day records keyed by
+        location, station set, date and datatype set.
+        :param values: self = current instance of NoaaDayCache, path = string of SQLite file path,
+        in_progress_ttl = integer of seconds that records of an unfinished year stay valid
+        :return: none
+        '''
+        self.path = path or data_path("cache", "noaa_days.sqlite3")
+        self.in_progress_ttl = in_progress_ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS day_records ("
+            " lat REAL NOT NULL, lon REAL NOT NULL, stations TEXT NOT NULL, date TEXT NOT NULL,"
+            " datatypes TEXT NOT NULL, results TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (lat, lon, stations, date, datatypes))"
+        )
+        # Queries by station are kept per station, so a later query with an overlapping station set or a wider
+        # year window only downloads the station days it does not have yet
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS station_day_records ("
+            " station TEXT NOT NULL, date TEXT NOT NULL, datatypes TEXT NOT NULL, results TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL, PRIMARY KEY (station, date, datatypes))"
+        )
+        self.connection.commit()
+
+    def _key(self, lat, lon, date, data_types, station_ids):
+        return round(float(lat), COORD_DECIMALS), round(float(lon), COORD_DECIMALS), \
+            ",".join(sorted(station_ids or [])), date, normalize_data_types(data_types)
+
+    def get(self, lat, lon, date, data_types, station_ids=None):
+        '''The purpose of this function is to read the cached records for one day, ignoring entries of an unfinished
+        year that are older than the TTL.
+        :param values: self = current instance of NoaaDayCache, lat = float of latitude, lon = float of longitude,
+        date = string of date in YYYY-MM-DD format, data_types = datatype ids, station_ids = list of station ids the
+        query targeted (None for a query by coordinates)
+        :return: list of weather data dictionaries, or None on a miss
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT results, fetched_at FROM day_records"
+                " WHERE lat = ? AND lon = ? AND stations = ? AND date = ? AND datatypes = ?",
+                self._key(lat, lon, date, data_types, station_ids)
+            ).fetchone()
+        if row is None:
+            return None
+
+        results, fetched_at = row
+        if year_in_progress(int(date[:4])) and time.time() - fetched_at > self.in_progress_ttl:
+            return None
+        return records_from_json(results)
+
+    def put(self, lat, lon, date, data_types, results, station_ids=None):
+        '''The purpose of this function is to store the records for one day.
+        :param values: self = current instance of NoaaDayCache, lat = float of latitude, lon = float of longitude,
+        date = string of date in YYYY-MM-DD format, data_types = datatype ids, results = list of weather data
+        dictionaries, station_ids = list of station ids the query targeted (None for a query by coordinates)
+        :return: none
+        '''
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO day_records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._key(lat, lon, date, data_types, station_ids) + (records_to_json(results), time.time())
+            )
+            self.connection.commit()
+
+    def get_stations(self, date, data_types, station_ids):
+        '''The purpose of this function is to read the cached records of one day for each of a set of stations,
+        ignoring entries of an unfinished year that are older than the TTL. A station day cached for more datatypes
+        than asked for also answers, with its records narrowed to the requested ones, so a TMAX plot after a
+        TMAX,TMIN,PRCP,SNOW prediction needs no download.
+        :param values: self = current instance of NoaaDayCache, date = string of date in YYYY-MM-DD format,
+        data_types = datatype ids, station_ids = list of station ids
+        :return: dictionary of station id to list of weather data dictionaries, holding only the stations found
+        '''
+        data_types = normalize_data_types(data_types)
+        wanted = set(data_types.split(","))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT station, datatypes, results, fetched_at FROM station_day_records"
+                f" WHERE date = ? AND station IN ({','.join('?' * len(station_ids))})",
+                [date] + list(station_ids)
+            ).fetchall()
+
+        expired = year_in_progress(int(date[:4]))
+        found = {}
+        # An exact match is read before a wider one, so the common case skips the filtering
+        for station, cached_types, results, fetched_at in sorted(rows, key=lambda row: row[1] != data_types):
+            if station in found or not wanted <= set(cached_types.split(",")):
+                continue
+            if expired and time.time() - fetched_at > self.in_progress_ttl:
+                continue
+            records = records_from_json(results)
+            if cached_types != data_types:
+                records = [record for record in records if record["datatype"] in wanted]
+            found[station] = records
+        return found
+
+    def put_stations(self, date, data_types, station_ids, results):
+        '''The purpose of this function is to store the records of one day split by station. Stations without any
+        record are stored empty, so they are not asked for again.
+        :param values: self = current instance of NoaaDayCache, date = string of date in YYYY-MM-DD format,
+        data_types = datatype ids, station_ids = list of station ids the query targeted, results = list of weather
+        data dictionaries of that day
+        :return: none
+        '''
+        by_station = {station: [] for station in station_ids}
+        for record in results:
+            by_station.setdefault(record["station"], []).append(record)
+        data_types = normalize_data_types(data_types)
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO station_day_records VALUES (?, ?, ?, ?, ?)",
+                [(station, date, data_types, records_to_json(records), now)
+                 for station, records in by_station.items()]
+            )
+            self.connection.commit()
+
+    def invalidate_in_progress(self):
+        '''The purpose of this function is to drop every cached day of a year that is still in progress, so the next
+        query downloads it again.
+        :param values: self = current instance of NoaaDayCache
+        :return: integer of rows removed
+        '''
+        first_open_day = f"{first_year_in_progress()}-01-01"
+        with self.lock:
+            cursor = self.connection.execute("DELETE FROM day_records WHERE date >= ?", (first_open_day,))
+            removed = cursor.rowcount
+            cursor = self.connection.execute("DELETE FROM station_day_records WHERE date >= ?", (first_open_day,))
+            self.connection.commit()
+        return removed + cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    '''The purpose of this function is to open the shared cache file once for the whole app.
+    :param values: none
+    :return: NoaaDayCache stored in the data folder
+    '''
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = NoaaDayCache()
+        return _default_cache
@@ -0,0 +1,319 @@
+import datetime
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from http_transport import http_get
+from noaa_cache import default_cache
+from noaa_records import decode_page
+from rate_limit import key_pool, send_within_quota, NOAA_QUOTA, NOAA_REQUESTS_PER_SECOND
+
+
+# NOAA CDO API, which WEATHER_WRANGLER_NOAA_API can point at another server, like a local stub
+NOAA_API_ENV = "WEATHER_WRANGLER_NOAA_API"
+NOAA_API_BASE = os.environ.get(NOAA_API_ENV, "https://www.ncei.noaa.gov/cdo-web/api/v2").rstrip("/")
+NOAA_DATA_ENDPOINT = f"{NOAA_API_BASE}/data"
+
+# Largest page the CDO API returns
+PAGE_LIMIT = 1000
+
+# The CDO API limits daily data requests to a one year date range
+MAX_SPAN_DAYS = 366
+ONE_DAY = datetime.timedelta(days=1)
+
+# Never have more requests in flight for one token than the quota allows per second
+MAX_CONCURRENT_REQUESTS = NOAA_REQUESTS_PER_SECOND
+
+_token_slots = {}
+_token_slots_lock = threading.Lock()
+
+
+def token_tuple(token):
+    # A single token or several used round-robin, whose quotas add up
+    return (token,) if isinstance(token, str) else tuple(token)
+
+
+def _slots_for(token):
+    '''The purpose of this function is to get the semaphore that bounds the number of in-flight requests for a token,
+    shared by every caller so two windows fetching at once still respect the limit.
+    :param values: token = string of NOAA API token, or list or tuple of tokens used round-robin
+    :return: BoundedSemaphore for the token
+    '''
+    tokens = token_tuple(token)
+    with _token_slots_lock:
+        if tokens not in _token_slots:
+            _token_slots[tokens] = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS * len(tokens))
+        return _token_slots[tokens]
+
+
+def plan_date_spans(dates):
+    '''The purpose of this function is to plan the fewest CDO requests that cover a set of days. Consecutive days
+    are merged into one startdate/enddate range, and ranges are split so none is longer than the one year the CDO
+    API allows for daily data. Days that are not next to each other stay in separate requests, since bridging
+    them would download every day in between.
+    :param values: dates = iterable of datetime.date
+    :return: list of (start date, end date) tuples in date order
+    '''
+    spans = []
+    for date in sorted(set(dates)):
+        if spans:
+            start, end = spans[-1]
+            if date - end == ONE_DAY and (date - start).days < MAX_SPAN_DAYS:
+                spans[-1] = (start, date)
+                continue
+        spans.append((date, date))
+    return spans
+
+
+def request_page(endpoint, token, params):
+    '''The purpose of this function is to send one CDO request, waiting for a free slot and for room in the
+    per-second and daily quota of the token first. With several tokens the requests go round-robin.
+    :param values: endpoint = string of NOAA data endpoint, token = string of NOAA API token, or list or tuple of
+    tokens, params = dictionary of query parameters
+    :return: tuple of the page of result dictionaries and the total result count, or None on error
+    '''
+    with _slots_for(token):
+        response = send_within_quota(key_pool(token_tuple(token), NOAA_QUOTA),
+                                     lambda key: http_get(endpoint, headers={"token": key}, params=params))
+    if response is None:
+        return None
+
+    if response.status_code != 200:
+        print(f"Error: {response.status_code} - {response.text}")
+        return None
+    # The API answers an empty object when there is no data at all
+    data = decode_page(response.content)
+    count = data.get("metadata", {}).get("resultset", {}).get("count", 0)
+    return data.get("results", []), count
+
+
+def fetch_span(lat, lon, span, token, data_types, endpoint, station_ids=None, cancelled=None):
+    '''The purpose of this function is to download every page of one date range, following the offset and count
+    in metadata.resultset so dense areas are not cut off at the page limit. Each page is turned into columns as soon
+    as it is decoded.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, span = tuple of start and end
+    date, token = string of NOAA API token, data_types = string of comma separated NOAA datatype ids, endpoint =
+    string of NOAA data endpoint, station_ids = list of GHCND station ids to query instead of the coordinates,
+    cancelled = function returning True once the remaining pages are no longer wanted
+    :return: aggregation.RecordColumns of every record in the range, or None if a page failed or was cancelled
+    '''
+    from aggregation import RecordColumns
+
+    start, end = span
+    params = {
+        "datasetid": "GHCND",  # Global Historical Climatology Network Daily
+        "datatypeid": data_types,
+        "startdate": start.isoformat(),
+        "enddate": end.isoformat(),
+        "limit": PAGE_LIMIT,  # Maximum results per page
+        "units": "metric",
+    }
+    if station_ids:
+        # Asking the nearest stations directly keeps far away stations out of the averages
+        params["stationid"] = station_ids
+    else:
+        params["latitude"] = lat
+        params["longitude"] = lon
+
+    pages = []
+    offset = 1  # CDO offsets start at 1
+    while True:
+        if cancelled is not None and cancelled():
+            return None
+        page = request_page(endpoint, token, dict(params, offset=offset))
+        if page is None:
+            return None
+        results, count = page
+        pages.append(RecordColumns.from_records(results))
+        offset += PAGE_LIMIT
+        if not results or offset > count:
+            records = RecordColumns.concat(pages)
+            tracing.count("noaa_records_total", len(records), source="api")
+            return records
+
+
+def iter_noaa_spans(lat, lon, dates, token, data_types, endpoint=NOAA_DATA_ENDPOINT, cache=None, station_ids=None,
+                    cancel=None):
+    '''The purpose of this function is to stream the NOAA records for a set of days one date range at a time. Days
+    already on disk come first from the cache; the rest are planned into date ranges that are downloaded on a
+    bounded thread pool, and each range is yielded as soon as all of its pages have arrived so the caller can show
+    partial results while the download goes on. Queries by station are cached per station, so only the stations a
+    day is missing are requested. Setting cancel, or closing the generator, stops the requests that have not been
+    sent yet.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, dates = iterable of
+    datetime.date, token = string of NOAA API token, data_types = string of comma separated NOAA datatype ids,
+    endpoint = string of NOAA data endpoint, cache = NoaaDayCache to use (defaults to the shared cache),
+    station_ids = list of GHCND station ids to query instead of the coordinates, cancel = threading.Event that
+    aborts the remaining requests when set
+    :return: generator of (start date, end date) spans and their aggregation.RecordColumns
+    '''
+    from aggregation import RecordColumns
+
+    cache = cache or default_cache()
+    station_ids = sorted(station_ids) if station_ids else None
+
+    # Days whose stations are partly cached keep those records, and are grouped by the stations they still need so
+    # each request only asks for what is missing
+    partial = {}
+    missing = {}
+    for date in sorted(set(dates)):
+        if station_ids:
+            found = cache.get_stations(date.isoformat(), data_types, station_ids)
+            cached = [record for station in station_ids for record in found.get(station, [])]
+            needed = tuple(station for station in station_ids if station not in found)
+            complete = not needed
+        else:
+            cached = cache.get(lat, lon, date.isoformat(), data_types)
+            needed = None
+            complete = cached is not None
+        tracing.cache_lookup("noaa_days", complete)
+        if complete:
+            yield (date, date), RecordColumns.from_records(cached)
+        else:
+            partial[date] = cached or []
+            missing.setdefault(needed, []).append(date)
+
+    spans = [(span, needed) for needed, group in missing.items() for span in plan_date_spans(group)]
+    if not spans:
+        return
+
+    finished = queue.Queue()
+    stop = threading.Event()
+
+    def cancelled():
+        return stop.is_set() or (cancel is not None and cancel.is_set())
+
+    def download(span, needed):
+        records = None
+        try:
+            records = fetch_span(lat, lon, span, token, data_types, endpoint, needed, cancelled)
+            if records is not None:
+                store_span(cache, lat, lon, span, data_types, records, needed)
+        finally:
+            finished.put((span, records))
+
+    pool = ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS * len(token_tuple(token)), len(spans)))
+    try:
+        for span, needed in spans:
+            pool.submit(download, span, needed)
+        for _ in spans:
+            span, records = finished.get()
+            if cancelled():
+                return
+            cached = RecordColumns.from_records([record for date in span_dates(span) for record in partial[date]])
+            # A range that failed is reported with only its cached part and is not stored, so it is asked for again
+            # next time
+            yield span, cached if records is None else RecordColumns.concat([cached, records])
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def store_span(cache, lat, lon, span, data_types, records, station_ids=None):
+    '''The purpose of this function is to split a downloaded date range back into days for the cache, storing an
+    empty list for days without records so they are not asked for again.
+    :param values: cache = NoaaDayCache, lat = float of latitude, lon = float of longitude, span = tuple of start
+    and end date, data_types = datatype ids, records = aggregation.RecordColumns of the range,
+    station_ids = list of station ids the range was queried for, stored per station (None for a query by
+    coordinates)
+    :return: none
+    '''
+    by_day = {}
+    for record in records.to_dicts():
+        by_day.setdefault(record["date"][:10], []).append(record)
+    for day in span_dates(span):
+        if station_ids:
+            cache.put_stations(day.isoformat(), data_types, station_ids, by_day.get(day.isoformat(), []))
+        else:
+            cache.put(lat, lon, day.isoformat(), data_types, by_day.get(day.isoformat(), []))
+
+
+def span_dates(span):
+    start, end = span
+    return [start + ONE_DAY * offset for offset in range((end - start).days + 1)]
+
+
+def iter_noaa_years(lat, lon, month, day, token, years, data_types="TMAX,TMIN,PRCP,SNOW",
+                    endpoint=NOAA_DATA_ENDPOINT, cache=None, station_ids=None, cancel=None):
+    '''The purpose of this function is to stream the NOAA records for the same month and day across several years,
+    one year at a time in the order they finish. When a local GHCND archive has been built it is used instead of
+    the web API.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, token = string of NOAA API token, years = iterable of integer years,
+    data_types = string of comma separated NOAA datatype ids, endpoint = string of NOAA data endpoint,
+    cache = NoaaDayCache to use (defaults to the shared cache), station_ids = list of GHCND station ids to query
+    instead of the coordinates, cancel = threading.Event that aborts the remaining requests when set
+    :return: generator of integer years and their aggregation.RecordColumns
+    '''
+    dates = []
+    for year in years:
+        # Skip days that do not exist in that year, like 02-29 outside leap years
+        try:
+            dates.append(datetime.date(year, month, day))
+        except ValueError:
+            continue
+
+    # A locally ingested GHCND archive answers without any network call; it needs NumPy, so it is imported here
+    from ghcnd_archive import load_archive
+    archive = load_archive()
+    if archive is not None:
+        results = archive.fetch_years(lat, lon, month, day, [date.year for date in dates], data_types)
+        tracing.count("noaa_records_total", len(results), source="archive")
+        result_years = results.years()
+        for date in dates:
+            yield date.year, results.select(result_years == date.year)
+        return
+
+    # The same day in different years is never consecutive, so every range is exactly one year
+    for (start, _), records in iter_noaa_spans(lat, lon, dates, token, data_types, endpoint, cache, station_ids,
+                                               cancel):
+        yield start.year, records
+
+
+def iter_noaa_range(lat, lon, date_range, token, years, data_types="TMAX,TMIN,PRCP,SNOW",
+                    endpoint=NOAA_DATA_ENDPOINT, cache=None, station_ids=None, cancel=None):
+    '''The purpose of this function is to stream the NOAA records of a range of days, like 12-20 to 01-05 or a
+    whole season, across several years. The days of one year's range are consecutive, so they are planned into a
+    single startdate/enddate request instead of one request per day, and the number of calls grows with the years
+    and the pages of records rather than with the length of the range. A local GHCND archive answers with one slice
+    per station instead.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, date_range =
+    date_ranges.DateRange, token = string of NOAA API token, years = iterable of integer years the ranges end in,
+    data_types = string of comma separated NOAA datatype ids, endpoint = string of NOAA data endpoint,
+    cache = NoaaDayCache to use (defaults to the shared cache), station_ids = list of GHCND station ids to query
+    instead of the coordinates, cancel = threading.Event that aborts the remaining requests when set
+    :return: generator of aggregation.RecordColumns, in the order they finish
+    '''
+    from ghcnd_archive import load_archive
+    archive = load_archive()
+    if archive is not None:
+        results = archive.fetch_range(lat, lon, date_range, years, data_types)
+        tracing.count("noaa_records_total", len(results), source="archive")
+        yield results
+        return
+
+    dates = [date for year in years for date in date_range.dates(year)]
+    for _, records in iter_noaa_spans(lat, lon, dates, token, data_types, endpoint, cache, station_ids, cancel):
+        yield records
+
+
+def fetch_noaa_years(lat, lon, month, day, token, years, data_types="TMAX,TMIN,PRCP,SNOW",
+                     endpoint=NOAA_DATA_ENDPOINT, cache=None, station_ids=None, cancel=None):
+    '''The purpose of this function is to get the NOAA records for the same month and day across several years.
+    The years are streamed by iter_noaa_years and merged back in year order.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, token = string of NOAA API token, years = iterable of integer years,
+    data_types = string of comma separated NOAA datatype ids, endpoint = string of NOAA data endpoint,
+    cache = NoaaDayCache to use (defaults to the shared cache), station_ids = list of GHCND station ids to query
+    instead of the coordinates, cancel = threading.Event that aborts the remaining requests when set, leaving the
+    result incomplete
+    :return: aggregation.RecordColumns of the records ordered by year
+    '''
+    from aggregation import RecordColumns
+
+    parts = [records for _, records in iter_noaa_years(lat, lon, month, day, token, years, data_types, endpoint,
+                                                       cache, station_ids, cancel)]
+    # Years arrive in whatever order the pool finishes them; a stable sort keeps each day's record order
+    return RecordColumns.concat(parts).sorted_by_date()
@@ -0,0 +1,191 @@
+'''Which NOAA datatypes exist near a location, read from the CDO /stations and /datatypes metadata endpoints.
+
+The answers are kept in a small SQLite file next to the day cache. Station lists and their datatypes change rarely,
+so entries stay valid for METADATA_TTL_SECONDS, and asking again for the same place needs no request at all. The
+pattern view uses it to suggest other datatypes when the one asked for has no records near a city, and the service
+answers /datatypes with it.
+'''
+import json
+import math
+import sqlite3
+import threading
+import time
+
+import tracing
+from data_paths import data_path
+from noaa_client import request_page, NOAA_API_BASE, PAGE_LIMIT
+from stations import to_unit_vector, chord_to_km, MAX_STATION_DISTANCE_KM, NEAREST_STATION_COUNT
+
+
+NOAA_STATIONS_ENDPOINT = f"{NOAA_API_BASE}/stations"
+NOAA_DATATYPES_ENDPOINT = f"{NOAA_API_BASE}/datatypes"
+
+# Station lists and the datatypes of a station change over months, not days
+METADATA_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Coordinates are rounded so nearby queries of the same city share the station search
+COORD_DECIMALS = 2
+
+KM_PER_DEGREE = 111.2
+
+
+def search_extent(lat, lon, radius_km=MAX_STATION_DISTANCE_KM):
+    '''The purpose of this function is to build the CDO extent box around a location.
+    :param values: lat = float of latitude, lon = float of longitude, radius_km = float of search radius in km
+    :return: string of south, west, north and east edges
+    '''
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = min(180.0, lat_delta / max(math.cos(math.radians(lat)), 0.01))
+    return ",".join(f"{edge:.4f}" for edge in (max(-90.0, lat - lat_delta), lon - lon_delta,
+                                               min(90.0, lat + lat_delta), lon + lon_delta))
+
+
+def overlaps_years(entry, years):
+    '''The purpose of this function is to check whether a station or datatype has data in a window of years.
+    :param values: entry = dictionary with mindate and maxdate in YYYY-MM-DD format, years = range of years (None
+    accepts every entry)
+    :return: True if the entry's dates overlap the years
+    '''
+    if years is None or not entry.get("mindate") or not entry.get("maxdate"):
+        return True
+    return int(entry["mindate"][:4]) <= years[-1] and int(entry["maxdate"][:4]) >= years[0]
+
+
+class NoaaMetadataCache:
+    def __init__(self, path=None, ttl=METADATA_TTL_SECONDS):
+        '''The purpose of this function is to open (or create) the SQLite file that keeps CDO metadata answers keyed by
+        endpoint and query.
+        :param values: self = current instance of NoaaMetadataCache, path = string of SQLite file path, ttl = integer
+        of seconds an answer stays valid
+        :return: none
+        '''
+        self.path = path or data_path("cache", "noaa_metadata.sqlite3")
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " endpoint TEXT NOT NULL, query TEXT NOT NULL, results TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (endpoint, query))"
+        )
+        self.connection.commit()
+
+    def get(self, endpoint, query):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT results, fetched_at FROM metadata WHERE endpoint = ? AND query = ?", (endpoint, query)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, endpoint, query, results):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata (endpoint, query, results, fetched_at) VALUES (?, ?, ?, ?)",
+                (endpoint, query, json.dumps(results), time.time())
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+_default_metadata_cache = None
+_default_metadata_cache_lock = threading.Lock()
+
+
+def default_metadata_cache():
+    global _default_metadata_cache
+    with _default_metadata_cache_lock:
+        if _default_metadata_cache is None:
+            _default_metadata_cache = NoaaMetadataCache()
+        return _default_metadata_cache
+
+
+def cached_metadata(endpoint, query, params, token, cache=None):
+    '''The purpose of this function is to answer a CDO metadata query from the cache, asking NOAA only on a miss.
+    :param values: endpoint = string of CDO metadata endpoint, query = string identifying the query in the cache,
+    params = dictionary of query parameters, token = string of NOAA API token, cache = NoaaMetadataCache (defaults to
+    the shared one)
+    :return: list of metadata dictionaries, or None if a request failed
+    '''
+    cache = cache or default_metadata_cache()
+    results = cache.get(endpoint, query)
+    tracing.cache_lookup("noaa_metadata", results is not None)
+    if results is not None:
+        return results
+
+    # Every page is read, following the offset and count like the data requests, so a dense area with more stations
+    # than one page holds is not cut off
+    results = []
+    offset = 1  # CDO offsets start at 1
+    while True:
+        page = request_page(endpoint, token, dict(params, limit=PAGE_LIMIT, offset=offset))
+        if page is None:
+            return None
+        page_results, count = page
+        results.extend(page_results)
+        offset += PAGE_LIMIT
+        if not page_results or offset > count:
+            break
+    cache.put(endpoint, query, results)
+    return results
+
+
+def nearby_stations(lat, lon, token, years=None, cache=None):
+    '''The purpose of this function is to list the GHCND stations around a location, nearest first.
+    :param values: lat = float of latitude, lon = float of longitude, token = string of NOAA API token, years = range
+    of years the stations must have data in (None for any), cache = NoaaMetadataCache
+    :return: list of station dictionaries with an added distance_km, or None if the request failed
+    '''
+    lat, lon = round(float(lat), COORD_DECIMALS), round(float(lon), COORD_DECIMALS)
+    stations = cached_metadata(NOAA_STATIONS_ENDPOINT, f"{lat},{lon}",
+                               {"datasetid": "GHCND", "extent": search_extent(lat, lon)}, token, cache)
+    if stations is None:
+        return None
+
+    center = to_unit_vector(lat, lon)
+    nearby = []
+    for station in stations:
+        if not overlaps_years(station, years):
+            continue
+        point = to_unit_vector(station["latitude"], station["longitude"])
+        distance_km = chord_to_km(math.dist(center, point))
+        if distance_km <= MAX_STATION_DISTANCE_KM:
+            nearby.append(dict(station, distance_km=distance_km))
+    nearby.sort(key=lambda station: station["distance_km"])
+    return nearby
+
+
+def station_data_types(station_id, token, cache=None):
+    '''The purpose of this function is to list the GHCND datatypes a station has recorded.
+    :param values: station_id = string of GHCND station id, token = string of NOAA API token, cache =
+    NoaaMetadataCache
+    :return: list of datatype dictionaries with id, name, mindate and maxdate, or None if the request failed
+    '''
+    return cached_metadata(NOAA_DATATYPES_ENDPOINT, station_id, {"datasetid": "GHCND", "stationid": station_id},
+                           token, cache)
+
+
+def available_data_types(lat, lon, token, years=None, k=NEAREST_STATION_COUNT, cache=None):
+    '''The purpose of this function is to find which datatypes the nearest stations of a location recorded in a
+    window of years, using only the station metadata.
+    :param values: lat = float of latitude, lon = float of longitude, token = string of NOAA API token, years = range
+    of years (None for any), k = integer of how many of the nearest stations to look at, cache = NoaaMetadataCache
+    :return: dictionary of datatype id to its name, or None if the metadata could not be fetched
+    '''
+    stations = nearby_stations(lat, lon, token, years, cache)
+    if stations is None:
+        return None
+
+    available = {}
+    for station in stations[:k]:
+        data_types = station_data_types(station["id"], token, cache)
+        if data_types is None:
+            return None
+        for data_type in data_types:
+            if overlaps_years(data_type, years):
+                available[data_type["id"]] = data_type.get("name", data_type["id"])
+    return available
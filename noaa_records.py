@@ -0,0 +1,80 @@
+'''Decoding of NOAA CDO answers, and the NoaaRecord view of one record.
+
+Pages and cached days are decoded into plain dictionaries, with orjson when it is installed (pip install orjson) and
+the standard json module otherwise, and turned into aggregation.RecordColumns straight away, so the dictionaries of a
+page never outlive it. A NoaaRecord is what indexing or looping over the columns gives: the five fields of a CDO
+record (date, datatype, station, attributes, value) in __slots__, read like the dictionaries (record["value"],
+record.get("station"), dict(record)). Measure the decode with
+    python -m benchmarks.bench_record_memory
+'''
+import json
+import sys
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+FIELDS = ("date", "datatype", "station", "attributes", "value")
+_FIELD_SET = frozenset(FIELDS)
+
+
+class NoaaRecord(Mapping):
+    __slots__ = FIELDS
+
+    def __init__(self, date, datatype, station, attributes, value):
+        '''The purpose of this function is to hold one NOAA weather value with its strings interned.
+        :param values: self = current instance of NoaaRecord, date = string of date in YYYY-MM-DDT00:00:00 format,
+        datatype = string of datatype id, station = string of GHCND station id, attributes = string of CDO
+        measurement flags, value = number of the value in metric units
+        :return: none
+        '''
+        self.date = sys.intern(date)
+        self.datatype = sys.intern(datatype)
+        self.station = sys.intern(station)
+        self.attributes = sys.intern(attributes)
+        self.value = value
+
+    def __getitem__(self, key):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"NoaaRecord({', '.join(f'{field}={getattr(self, field)!r}' for field in FIELDS)})"
+
+
+def decode_page(content):
+    '''The purpose of this function is to decode a CDO answer.
+    :param values: content = bytes or string of the JSON answer
+    :return: dictionary of the answer, whose "results" (if any) is a list of record or metadata dictionaries
+    '''
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def records_from_json(content):
+    '''The purpose of this function is to decode a JSON list of CDO records, as stored by the day cache.
+    :param values: content = bytes or string of a JSON list of record objects
+    :return: list of weather data dictionaries
+    '''
+    return decode_page(content)
+
+
+def records_to_json(records):
+    '''The purpose of this function is to encode records in the CDO JSON format the day cache has always stored.
+    :param values: records = list of weather data dictionaries
+    :return: string of a JSON list of record objects
+    '''
+    if orjson is not None:
+        return orjson.dumps(records).decode("utf-8")
+    return json.dumps(records, separators=(",", ":"))
@@ -0,0 +1,51 @@
+import os
+
+from http_transport import http_get
+from rate_limit import key_pool, send_within_quota, OWM_QUOTA
+from ttl_cache import TTLCache
+
+
+# OpenWeatherMap API, which WEATHER_WRANGLER_OPENWEATHER_API can point at another server, like a local stub
+OPENWEATHER_API_ENV = "WEATHER_WRANGLER_OPENWEATHER_API"
+OPENWEATHER_API_BASE = os.environ.get(OPENWEATHER_API_ENV, "https://api.openweathermap.org/data/2.5").rstrip("/")
+OPENWEATHER_ENDPOINT = f"{OPENWEATHER_API_BASE}/weather"
+
+# Current conditions change slowly, so a lookup stays good for ten minutes
+CURRENT_WEATHER_TTL_SECONDS = 10 * 60
+
+# Shared by every window and worker thread in the app
+current_weather_cache = TTLCache(maxsize=256, ttl=CURRENT_WEATHER_TTL_SECONDS, name="current_weather")
+
+
+def normalize_city(city):
+    '''The purpose of this function is to turn the city the user typed into a cache key, so "  New  York" and
+    "new york" share one entry.
+    :param values: city = string of city name
+    :return: string of lower case city name with single spaces
+    '''
+    return " ".join(city.lower().split())
+
+
+def fetch_current_weather(city, api_key, cache=current_weather_cache, endpoint=OPENWEATHER_ENDPOINT):
+    '''The purpose of this function is to get the current weather of a city from OpenWeatherMap, reusing a recent
+    answer for the same city instead of calling the API again.
+    :param values: city = string of city name, api_key = string of OpenWeatherMap API key, cache = TTLCache holding
+    recent answers, endpoint = string of OpenWeatherMap endpoint
+    :return: dictionary containing weather data from API, or None on error
+    '''
+    key = normalize_city(city)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = send_within_quota(key_pool(api_key, OWM_QUOTA), lambda key: http_get(
+        endpoint, params={"q": city, "appid": key, "units": "metric"}))
+    if response is None:
+        return None
+    if response.status_code == 200:
+        weather_data = response.json()
+        cache.put(key, weather_data)
+        return weather_data
+    else:
+        print(f"Error: {response.status_code} - {response.text}")
+        return None
@@ -0,0 +1,164 @@
+'''Plot windows that are reused between queries instead of opening a new figure for every plot.
+
+Windows are kept under a key, like "pattern" or "batch". Asking for a key again brings back its open window and
+Figure; when the user closes a window its figure is cleared and released. A pattern plot keeps a single line and
+updates its data in place, redrawing only the line (blitting) while the axes still fit the values, so streaming in
+more years does not redraw the whole figure.
+
+Only the object-oriented matplotlib API is used, never pyplot, and matplotlib is imported when the first plot window
+opens rather than at app start.
+'''
+from tkinter import Toplevel, BOTH
+
+import weather_core
+
+
+# Room left above and below the values when the y-axis has to grow, as a share of their spread
+Y_MARGIN = 0.1
+
+
+class FigureWindow:
+    def __init__(self, root, title, on_close=None, bg=None):
+        '''The purpose of this function is to open a window holding one Figure on a Tk canvas.
+        :param values: self = current instance of FigureWindow, root = Tk root window, title = string of window
+        title, on_close = function called with this window once it is closed, bg = string of background colour
+        :return: none
+        '''
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.window = Toplevel(root) if bg is None else Toplevel(root, bg=bg)
+        self.window.title(title)
+        self.window.geometry("800x600")
+        self.figure = Figure(figsize=(10, 6))
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        self.canvas.get_tk_widget().pack(fill=BOTH, expand=True)
+        self.on_close = on_close
+        self.closed = False
+        self.owner = None
+        self.window.bind("<Destroy>", self._on_destroy, add="+")
+
+    def show(self, title):
+        self.window.title(title)
+        self.window.deiconify()
+        self.window.lift()
+
+    def redraw(self, draw, *args):
+        '''The purpose of this function is to draw new content on the window's existing Figure.
+        :param values: self = current instance of FigureWindow, draw = function drawing on a Figure, like
+        batch.draw_comparison, args = its arguments after the figure
+        :return: none
+        '''
+        draw(self.figure, *args)
+        self.canvas.draw_idle()
+
+    def _on_destroy(self, event):
+        # Every child widget sends <Destroy> as well; the figure is released once, for the window itself
+        if event.widget is not self.window or self.closed:
+            return
+        self.closed = True
+        self.figure.clear()
+        if self.on_close is not None:
+            self.on_close(self)
+
+
+class PatternPlot(FigureWindow):
+    def __init__(self, root, title, on_close=None, bg=None):
+        super().__init__(root, title, on_close, bg)
+        self.ax = None
+        self.line = None
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    def reset(self, pattern, city, date_label, years, owner=None):
+        '''The purpose of this function is to set the plot up for a new query. The x-axis covers the whole history
+        window at once, so years that arrive later only add points to the line.
+        :param values: self = current instance of PatternPlot, pattern = string of NOAA pattern code, city = string of
+        city name, date_label = string of the MM-DD or range of days, years = range of years of the query, owner =
+        object identifying the query, so updates of a replaced query can be told apart
+        :return: none
+        '''
+        self.owner = owner
+        self.figure.clear()
+        self.ax = self.figure.add_subplot()
+        # The line is animated: full draws leave it out and it is drawn on top of the saved background instead
+        self.line, = self.ax.plot([], [], marker="o", linestyle="-", color='blue', animated=True)
+        weather_core.style_pattern_axes(self.ax, years, pattern, city, date_label)
+        self.ax.set_xlim(years[0] - 0.5, years[-1] + 0.5)
+        self.y_limits = None
+        self.background = None
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+
+    def update(self, years, values):
+        '''The purpose of this function is to show new values on the line. Only the line is redrawn while the values
+        fit the y-axis; the whole figure is redrawn when the axis has to grow.
+        :param values: self = current instance of PatternPlot, years = list of years, values = list of averages
+        :return: none
+        '''
+        self.line.set_data(years, values)
+        if values and not self._fits(values):
+            self._grow_y(values)
+            self.background = None
+        if self.background is None:
+            # _on_draw draws the line once the figure is redrawn
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def _fits(self, values):
+        return self.y_limits is not None and self.y_limits[0] <= min(values) and max(values) <= self.y_limits[1]
+
+    def _grow_y(self, values):
+        low, high = min(values), max(values)
+        if self.y_limits is not None:
+            low, high = min(low, self.y_limits[0]), max(high, self.y_limits[1])
+        margin = (high - low) * Y_MARGIN or 1.0
+        self.y_limits = (low - margin, high + margin)
+        self.ax.set_ylim(*self.y_limits)
+        self.figure.tight_layout()
+
+    def _on_draw(self, event):
+        if self.ax is None:
+            return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+
+class PlotManager:
+    def __init__(self, root, bg=None):
+        '''The purpose of this function is to keep track of the open plot windows of the app.
+        :param values: self = current instance of PlotManager, root = Tk root window, bg = string of background
+        colour of new windows
+        :return: none
+        '''
+        self.root = root
+        self.bg = bg
+        self.windows = {}
+
+    def pattern_plot(self, key, title):
+        return self._window(key, title, PatternPlot)
+
+    def figure_window(self, key, title):
+        return self._window(key, title, FigureWindow)
+
+    def _window(self, key, title, kind):
+        # The open window of a key is reused with its figure; a closed one is replaced by a new window
+        window = self.windows.get(key)
+        if window is None or window.closed:
+            window = kind(self.root, title, self._release, self.bg)
+            self.windows[key] = window
+        else:
+            window.show(title)
+        return window
+
+    def _release(self, window):
+        for key, open_window in list(self.windows.items()):
+            if open_window is window:
+                del self.windows[key]
+
+    def close_all(self):
+        for window in list(self.windows.values()):
+            window.window.destroy()
@@ -0,0 +1,267 @@
+'''Request quotas of the APIs, shared by every thread that uses the same keys.
+
+Each key gets the windows of its API's quota (NOAA CDO: 5 requests per second and 10,000 per day per token;
+OpenWeatherMap free plan: 60 per minute) and a daily budget that is saved to disk, so restarting the app does not
+forget what was already spent today. A caller that would go over the quota waits in line for the next free slot
+instead of getting a 429. With several keys for one API the requests go round-robin to whichever key is free first.
+'''
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import tracing
+from data_paths import data_path
+
+
+# NOAA CDO allows 5 requests per second for each token
+NOAA_REQUESTS_PER_SECOND = 5
+NOAA_REQUESTS_PER_DAY = 10000
+
+# OpenWeatherMap's free plan allows 60 calls per minute for each key
+OWM_REQUESTS_PER_MINUTE = 60
+
+# Every window is held this much longer than the quota, so a request that takes a little longer to reach the API
+# than the one before it is not counted in the previous window (the benchmarks saw 429s at the exact window edge)
+WINDOW_MARGIN_SECONDS = 0.05
+
+# Times a request that was answered 429 anyway is queued again before the 429 is returned
+MAX_THROTTLED_RETRIES = 3
+
+# Wait used when a 429 does not say how long to wait
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+
+class Quota:
+    def __init__(self, name, windows, per_day=None):
+        '''The purpose of this function is to describe the request limits an API applies to each key.
+        :param values: self = current instance of Quota, name = string of API name, windows = list of tuples of
+        requests allowed and window length in seconds, per_day = integer of requests allowed per day (None for no
+        daily limit)
+        :return: none
+        '''
+        self.name = name
+        self.windows = windows
+        self.per_day = per_day
+
+
+NOAA_QUOTA = Quota("noaa", [(NOAA_REQUESTS_PER_SECOND, 1.0)], NOAA_REQUESTS_PER_DAY)
+OWM_QUOTA = Quota("openweathermap", [(OWM_REQUESTS_PER_MINUTE, 60.0)])
+
+
+class RateLimiter:
+    def __init__(self, rate, per=1.0, margin=0.0):
+        '''The purpose of this function is to set up a sliding window limiter that allows at most "rate" calls
+        in any "per" second window.
+        :param values: self = current instance of RateLimiter, rate = integer of calls allowed per window,
+        per = float of window length in seconds, margin = float of seconds the window is held longer than "per"
+        :return: none
+        '''
+        self.rate = rate
+        self.per = per + margin
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def wait_time(self, now):
+        # Read under the caller's lock; forget calls that have left the window
+        while self.calls and now - self.calls[0] >= self.per:
+            self.calls.popleft()
+        if len(self.calls) < self.rate:
+            return 0.0
+        return self.per - (now - self.calls[0])
+
+    def record(self, now):
+        self.calls.append(now)
+
+    def acquire(self):
+        '''The purpose of this function is to block the calling thread until another call fits inside the window.
+        :param values: self = current instance of RateLimiter
+        :return: none
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.wait_time(now)
+                if wait <= 0:
+                    self.record(now)
+                    return
+            time.sleep(wait)
+
+
+def utc_day():
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+class BudgetStore:
+    def __init__(self, path=None):
+        '''The purpose of this function is to open the file that keeps how many requests each key made today. Keys
+        are stored as a hash, never in plain text.
+        :param values: self = current instance of BudgetStore, path = string of JSON file path
+        :return: none
+        '''
+        self.path = path or data_path("cache", "api_budgets.json")
+        self.lock = threading.Lock()
+        self.used = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as budget_file:
+                    self.used = json.load(budget_file)
+            except (OSError, ValueError) as e:
+                print(f"Error: unable to read the request budgets, starting from zero: {e}")
+
+    @staticmethod
+    def _key_id(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def _today(self, key):
+        # Read under the lock; a new day starts with nothing used
+        entry = self.used.get(self._key_id(key))
+        if entry is None or entry["day"] != utc_day():
+            return 0
+        return entry["used"]
+
+    def remaining(self, key, per_day):
+        with self.lock:
+            return per_day - self._today(key)
+
+    def spend(self, key):
+        '''The purpose of this function is to count one request of a key and save the counts.
+        :param values: self = current instance of BudgetStore, key = string of API key
+        :return: integer of requests the key made today
+        '''
+        with self.lock:
+            used = self._today(key) + 1
+            self.used[self._key_id(key)] = {"day": utc_day(), "used": used}
+            # Written to a temporary file first so a crash never leaves half a file behind
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as budget_file:
+                json.dump(self.used, budget_file)
+            os.replace(temporary_path, self.path)
+            return used
+
+
+class KeyLimiter:
+    def __init__(self, key, quota, margin=WINDOW_MARGIN_SECONDS):
+        self.key = key
+        self.windows = [RateLimiter(rate, per, margin) for rate, per in quota.windows]
+        self.paused_until = 0.0
+
+    def wait_time(self, now):
+        return max([self.paused_until - now] + [window.wait_time(now) for window in self.windows])
+
+    def record(self, now):
+        for window in self.windows:
+            window.record(now)
+
+
+class KeyPool:
+    def __init__(self, keys, quota, budgets=None):
+        '''The purpose of this function is to share the quota of one or more keys of an API between every caller.
+        :param values: self = current instance of KeyPool, keys = list of API keys, quota = Quota of the API,
+        budgets = BudgetStore keeping the daily counts (defaults to the shared one)
+        :return: none
+        '''
+        self.quota = quota
+        self.budgets = budgets
+        self.limiters = [KeyLimiter(key, quota) for key in keys]
+        self.next_index = 0
+        self.lock = threading.Lock()
+        # Waiting callers are served one at a time in the order they arrive
+        self.line = threading.Lock()
+
+    def _budget_left(self, limiter):
+        return self.quota.per_day is None or self.budgets.remaining(limiter.key, self.quota.per_day) > 0
+
+    def acquire(self):
+        '''The purpose of this function is to wait for the next request slot of any key of the pool. Keys are tried
+        round-robin, so several keys add up their quotas.
+        :param values: self = current instance of KeyPool
+        :return: string of the key to send the request with, or None if every key has used up its daily budget
+        '''
+        start = time.monotonic()
+        with self.line:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    usable = [index for index in range(len(self.limiters))
+                              if self._budget_left(self.limiters[index])]
+                    if not usable:
+                        return None
+                    # Start after the key used last, and take the first one that is free now or soonest
+                    usable.sort(key=lambda index: (index - self.next_index) % len(self.limiters))
+                    index = min(usable, key=lambda index: max(0.0, self.limiters[index].wait_time(now)))
+                    limiter = self.limiters[index]
+                    wait = limiter.wait_time(now)
+                    if wait <= 0:
+                        limiter.record(now)
+                        self.next_index = index + 1
+                        break
+                time.sleep(wait)
+
+        if self.quota.per_day is not None:
+            self.budgets.spend(limiter.key)
+        tracing.observe("rate_limit_wait_seconds", time.monotonic() - start, api=self.quota.name)
+        return limiter.key
+
+    def throttled(self, key, retry_after):
+        '''The purpose of this function is to hold a key back after the API answered 429 for it.
+        :param values: self = current instance of KeyPool, key = string of API key, retry_after = float of seconds
+        to wait
+        :return: none
+        '''
+        tracing.count("api_throttled_total", api=self.quota.name)
+        with self.lock:
+            for limiter in self.limiters:
+                if limiter.key == key:
+                    limiter.paused_until = max(limiter.paused_until, time.monotonic() + retry_after)
+
+
+def retry_after_seconds(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS)))
+    except ValueError:
+        # An HTTP date instead of seconds
+        return DEFAULT_RETRY_AFTER_SECONDS
+
+
+def send_within_quota(pool, send, retries=MAX_THROTTLED_RETRIES):
+    '''The purpose of this function is to send a request once its key has a free slot. A 429 holds the key back
+    for the time the API asks and queues the request again, so callers get the answer rather than the error.
+    :param values: pool = KeyPool of the API, send = function sending the request with a key and returning the
+    requests.Response, retries = integer of times a 429 is queued again
+    :return: requests.Response, or None if every key has used up its daily budget
+    '''
+    for attempt in range(retries + 1):
+        key = pool.acquire()
+        if key is None:
+            print(f"Error: the daily {pool.quota.name} request budget of every key is used up")
+            return None
+        response = send(key)
+        if response.status_code != 429 or attempt == retries:
+            return response
+        pool.throttled(key, retry_after_seconds(response))
+    return response
+
+
+_budgets = None
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def key_pool(keys, quota=NOAA_QUOTA):
+    '''The purpose of this function is to share a single pool between every thread that uses the same keys, since
+    the quota is counted per key and not per request.
+    :param values: keys = string of API key, or list or tuple of keys used round-robin, quota = Quota of the API
+    :return: KeyPool for the keys
+    '''
+    global _budgets
+    keys = (keys,) if isinstance(keys, str) else tuple(keys)
+    with _pools_lock:
+        if (keys, quota.name) not in _pools:
+            if _budgets is None and quota.per_day is not None:
+                _budgets = BudgetStore()
+            _pools[(keys, quota.name)] = KeyPool(keys, quota, _budgets)
+        return _pools[(keys, quota.name)]
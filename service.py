@@ -0,0 +1,286 @@
+'''Headless HTTP service exposing the Weather Wrangler data layer as JSON, without Tkinter.
+
+Run from the project folder:
+    python service.py --port 8080
+
+Endpoints:
+    GET /weather?city=London
+    GET /historical?city=London&date=12-25
+    GET /pattern?city=London&date=12-25&pattern=TMAX         (add &format=png for the rendered plot)
+    GET /batch?cities=London;Paris&date=12-25                 (add &pattern=TMAX for the yearly series of each city)
+    GET /datatypes?city=London                                (datatypes the nearest stations recorded)
+    GET /metrics                                              (add &format=json; needs WEATHER_WRANGLER_TRACE=1)
+
+The history endpoints take an optional &start_year=1994&end_year=2023 window. /historical and /pattern also take a
+range of days as the date, like date=12-20..01-05, date=December or date=winter; /historical then answers with the
+aggregate of the range and the stats of each day.
+
+The fetch and aggregation code is blocking, so each request runs it on a shared thread pool while the event loop
+keeps accepting other users.
+'''
+import argparse
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import batch
+import tracing
+import weather_core
+
+
+# Worker threads shared by every request; NOAA concurrency is bounded separately per token
+WORKER_THREADS = 32
+
+# Largest city list one /batch request may ask for
+MAX_BATCH_CITIES = 100
+
+
+def json_error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+def http_error(error_class, message):
+    # Raised errors carry the same JSON body as returned ones
+    return error_class(text=json.dumps({"error": message}), content_type="application/json")
+
+
+async def run_blocking(request, function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app["executor"], function, *args)
+
+
+def required(request, name):
+    value = request.query.get(name, "").strip()
+    if not value:
+        raise http_error(web.HTTPBadRequest, f"Missing query parameter '{name}'")
+    return value
+
+
+def history_window(request):
+    try:
+        years = weather_core.history_years(request.query.get("start_year") or None,
+                                           request.query.get("end_year") or None)
+    except ValueError as ve:
+        raise http_error(web.HTTPBadRequest, str(ve))
+    return years[0], years[-1]
+
+
+async def current_weather(request):
+    '''The purpose of this function is to answer GET /weather with the current conditions of a city.
+    :param values: request = aiohttp request
+    :return: JSON response
+    '''
+    city = required(request, "city")
+    weather_data = await run_blocking(request, weather_core.fetch_openweather_data, city)
+    if not weather_data:
+        return json_error(404, "Unable to fetch weather data. Please check the city name.")
+    return web.json_response(weather_core.current_weather_summary(weather_data))
+
+
+async def resolve_history_query(request):
+    city = required(request, "city")
+    try:
+        date_range = weather_core.parse_date_range(required(request, "date"))
+    except ValueError as ve:
+        raise http_error(web.HTTPBadRequest, str(ve))
+    start_year, end_year = history_window(request)
+
+    location = await run_blocking(request, weather_core.lookup_location_id, city)
+    if not location:
+        raise http_error(web.HTTPNotFound, weather_core.location_not_found_message(city))
+    lat, lon = location
+    return city, date_range, lat, lon, start_year, end_year
+
+
+async def fetch_history(request, data_types):
+    city, date_range, lat, lon, start_year, end_year = await resolve_history_query(request)
+    if date_range.single_day:
+        month, day = date_range.start
+        data = await run_blocking(request, weather_core.fetch_noaa_historical_data, lat, lon, month, day, data_types,
+                                  start_year, end_year)
+    else:
+        data = await run_blocking(request, weather_core.fetch_noaa_range_data, lat, lon, date_range, data_types,
+                                  start_year, end_year)
+    return city, date_range, data
+
+
+async def historical_prediction(request):
+    '''The purpose of this function is to answer GET /historical with the historical averages for a city and MM-DD
+    or range of days, from the precomputed climatology when it covers the requested years.
+    :param values: request = aiohttp request
+    :return: JSON response
+    '''
+    city, date_range, lat, lon, start_year, end_year = await resolve_history_query(request)
+    if date_range.single_day:
+        month, day = date_range.start
+        prediction = await run_blocking(request, weather_core.historical_prediction, lat, lon, month, day,
+                                        start_year, end_year)
+    else:
+        prediction = await run_blocking(request, weather_core.range_prediction, lat, lon, date_range, start_year,
+                                        end_year)
+    if prediction is None:
+        return json_error(404, "No historical data available for the selected date.")
+    return web.json_response(dict(prediction, city=city, date=date_range.label(), start_year=start_year,
+                                  end_year=end_year))
+
+
+async def weather_pattern(request):
+    '''The purpose of this function is to answer GET /pattern with the yearly series of one pattern, as JSON or as
+    a PNG plot.
+    :param values: request = aiohttp request
+    :return: JSON or PNG response
+    '''
+    pattern = required(request, "pattern").upper()
+    if pattern not in weather_core.PATTERN_LABELS:
+        return json_error(400, f"Pattern '{pattern}' is not available.")
+    city, date_range, data = await fetch_history(request, pattern)
+    if date_range.single_day:
+        years, values = await run_blocking(request, weather_core.weather_pattern_series, data, pattern)
+    else:
+        years, values = await run_blocking(request, weather_core.range_pattern_series, data, pattern, date_range)
+    if not years:
+        return json_error(404, f"No records found for pattern '{pattern}'.")
+
+    if request.query.get("format") == "png":
+        png = await run_blocking(request, render_png, years, values, pattern, city, date_range)
+        return web.Response(body=png, content_type="image/png")
+    return web.json_response({"city": city, "date": date_range.label(), "pattern": pattern,
+                              "label": weather_core.PATTERN_LABELS[pattern], "years": years, "values": values})
+
+
+async def available_types(request):
+    '''The purpose of this function is to answer GET /datatypes with the datatypes recorded near a city over the
+    history window, from the NOAA station metadata without downloading weather data.
+    :param values: request = aiohttp request
+    :return: JSON response
+    '''
+    city = required(request, "city")
+    start_year, end_year = history_window(request)
+    location = await run_blocking(request, weather_core.lookup_location_id, city)
+    if not location:
+        return json_error(404, weather_core.location_not_found_message(city))
+    if not weather_core.noaa_token_configured():
+        return json_error(503, f"The NOAA station metadata needs a NOAA token. Set {weather_core.NOAA_TOKEN_ENV}.")
+    available = await run_blocking(request, weather_core.available_pattern_types, *location, start_year, end_year)
+    if available is None:
+        return json_error(502, "Unable to fetch the NOAA station metadata.")
+    return web.json_response({"city": city, "start_year": start_year, "end_year": end_year,
+                              "datatypes": available})
+
+
+async def batch_comparison(request):
+    '''The purpose of this function is to answer GET /batch with the historical prediction of many cities for one
+    date, or with the yearly series of one pattern for each of them.
+    :param values: request = aiohttp request
+    :return: JSON or PNG response
+    '''
+    cities = batch.parse_cities(required(request, "cities"))
+    if len(cities) > MAX_BATCH_CITIES:
+        raise http_error(web.HTTPBadRequest, f"At most {MAX_BATCH_CITIES} cities can be compared at once")
+    try:
+        month, day = weather_core.parse_month_day(required(request, "date"))
+    except ValueError as ve:
+        raise http_error(web.HTTPBadRequest, str(ve))
+    date = f"{month:02d}-{day:02d}"
+    start_year, end_year = history_window(request)
+
+    pattern = request.query.get("pattern", "").strip().upper()
+    if not pattern:
+        rows = await run_blocking(request, batch.compare_cities, cities, month, day, batch.BATCH_WORKERS, None,
+                                  start_year, end_year)
+        return web.json_response({"date": date, "start_year": start_year, "end_year": end_year, "rows": rows})
+
+    if pattern not in weather_core.PATTERN_LABELS:
+        return json_error(400, f"Pattern '{pattern}' is not available.")
+    series = await run_blocking(request, batch.compare_patterns, cities, month, day, pattern, batch.BATCH_WORKERS,
+                                start_year, end_year)
+    if request.query.get("format") == "png":
+        png = await run_blocking(request, render_comparison_png, series, pattern, month, day)
+        return web.Response(body=png, content_type="image/png")
+    return web.json_response({"date": date, "pattern": pattern, "label": weather_core.PATTERN_LABELS[pattern],
+                              "series": {city: {"years": years, "values": values}
+                                         for city, (years, values) in series.items()}})
+
+
+def render_png(years, values, pattern, city, date_range):
+    month, day = date_range.start
+    return render_figure_png(weather_core.weather_pattern_figure(years, values, pattern, city, month, day,
+                                                                 date_range.label()))
+
+
+def render_comparison_png(series, pattern, month, day):
+    return render_figure_png(batch.comparison_figure(series, pattern, month, day))
+
+
+def render_figure_png(fig):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(buffer)
+    return buffer.getvalue()
+
+
+@web.middleware
+async def time_requests(request, handler):
+    # Requests interleave on the event loop, so they are timed directly rather than as nested spans
+    if not tracing.enabled():
+        return await handler(request)
+    route = request.match_info.route.resource.canonical if request.match_info.route.resource else "unmatched"
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as error:
+        status = error.status
+        raise
+    finally:
+        tracing.observe("service_request_seconds", time.perf_counter() - start, route=route)
+        tracing.count("service_requests_total", route=route, status=status)
+
+
+async def metrics(request):
+    '''The purpose of this function is to answer GET /metrics with the traced timings, HTTP latencies and cache hit
+    ratios, in the Prometheus text format or as JSON.
+    :param values: request = aiohttp request
+    :return: text or JSON response
+    '''
+    if not tracing.enabled():
+        return json_error(404, f"Tracing is off. Set {tracing.TRACE_ENV}=1 to collect metrics.")
+    if request.query.get("format") == "json":
+        return web.json_response(tracing.snapshot())
+    return web.Response(text=tracing.prometheus_text(), content_type="text/plain")
+
+
+async def close_executor(app):
+    app["executor"].shutdown(wait=False)
+
+
+def create_app(worker_threads=WORKER_THREADS):
+    '''The purpose of this function is to build the aiohttp application with its routes and worker pool.
+    :param values: worker_threads = integer of threads running the blocking fetch and aggregation code
+    :return: aiohttp web.Application
+    '''
+    app = web.Application(middlewares=[time_requests])
+    app["executor"] = ThreadPoolExecutor(max_workers=worker_threads)
+    app.router.add_get("/weather", current_weather)
+    app.router.add_get("/historical", historical_prediction)
+    app.router.add_get("/pattern", weather_pattern)
+    app.router.add_get("/batch", batch_comparison)
+    app.router.add_get("/datatypes", available_types)
+    app.router.add_get("/metrics", metrics)
+    app.on_cleanup.append(close_executor)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Weather Wrangler HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
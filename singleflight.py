@@ -0,0 +1,59 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        '''The purpose of this function is to set up a table of calls that are running right now, so concurrent
+        callers asking for the same key can wait for one call instead of each making their own.
+        :param values: self = current instance of SingleFlight
+        :return: none
+        '''
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, function, *args, **kwargs):
+        '''The purpose of this function is to run function once for every group of concurrent callers with the same
+        key. The first caller runs it and the others wait and get the same result (or the same exception). The
+        result object is shared between the callers, so they must not change it.
+        :param values: self = current instance of SingleFlight, key = hashable key describing the request,
+        function = function to run, args and kwargs = arguments for the function
+        :return: the result of the function
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = function(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self.lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self.calls)}
@@ -0,0 +1,312 @@
+'''GHCND station inventory with a k-d tree for nearest-station lookups.
+
+The station list (ghcnd-stations.txt) and element inventory (ghcnd-inventory.txt) are downloaded once into the data
+folder. Station positions are stored as points on the unit sphere, so straight-line distance in the tree orders
+stations the same way as distance along the earth.
+
+The download is about 45 MB, so it never runs on a user's query: build the index ahead of time with
+    python stations.py build
+or let the app load it on a background thread, querying by coordinates until it is ready. A failed download is not
+tried again for RETRY_AFTER_FAILURE_SECONDS.
+'''
+import heapq
+import math
+import os
+import pickle
+import sys
+import threading
+import time
+
+from data_paths import data_path
+from http_transport import http_get
+
+
+# Folder of the GHCND files, which WEATHER_WRANGLER_GHCND_FILES can point at another server, like a local stub
+GHCND_FILES_ENV = "WEATHER_WRANGLER_GHCND_FILES"
+GHCND_FILES_BASE = os.environ.get(GHCND_FILES_ENV, "https://www.ncei.noaa.gov/pub/data/ghcn/daily").rstrip("/")
+STATIONS_URL = f"{GHCND_FILES_BASE}/ghcnd-stations.txt"
+INVENTORY_URL = f"{GHCND_FILES_BASE}/ghcnd-inventory.txt"
+
+EARTH_RADIUS_KM = 6371.0
+
+# Stations further away than this are not close enough to describe the city's weather
+MAX_STATION_DISTANCE_KM = 50
+
+# How many stations a query is sent to
+NEAREST_STATION_COUNT = 3
+
+# After the station files fail to download or parse, queries go by coordinates for this long before trying again
+RETRY_AFTER_FAILURE_SECONDS = 15 * 60
+
+
+def to_unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(distance_km):
+    return 2 * math.sin(min(math.pi / 2, distance_km / (2 * EARTH_RADIUS_KM)))
+
+
+def parse_stations(path):
+    '''The purpose of this function is to read the fixed width ghcnd-stations.txt file.
+    :param values: path = string of station list path
+    :return: list of tuples of station id, latitude, longitude and name
+    '''
+    stations = []
+    with open(path, encoding="utf-8", errors="replace") as station_file:
+        for line in station_file:
+            if len(line) < 30:
+                continue
+            stations.append((line[0:11], float(line[12:20]), float(line[21:30]), line[41:71].strip()))
+    return stations
+
+
+def parse_inventory(path):
+    '''The purpose of this function is to read the fixed width ghcnd-inventory.txt file, which lists the years each
+    station has data for each element.
+    :param values: path = string of inventory path
+    :return: dictionary of station id to a dictionary of element to (first year, last year)
+    '''
+    inventory = {}
+    with open(path, encoding="utf-8", errors="replace") as inventory_file:
+        for line in inventory_file:
+            if len(line) < 45:
+                continue
+            inventory.setdefault(line[0:11], {})[line[31:35]] = (int(line[36:40]), int(line[41:45]))
+    return inventory
+
+
+class StationIndex:
+    def __init__(self, stations, inventory):
+        '''The purpose of this function is to build the k-d tree over the station positions.
+        :param values: self = current instance of StationIndex, stations = list of tuples from parse_stations,
+        inventory = dictionary from parse_inventory
+        :return: none
+        '''
+        self.stations = stations
+        self.inventory = inventory
+        self.points = [to_unit_vector(lat, lon) for _, lat, lon, _ in stations]
+        # The tree is kept in flat lists: the station of each node, its split axis and its children
+        self.node_station = []
+        self.node_axis = []
+        self.left = []
+        self.right = []
+        self.root = self._build(list(range(len(stations))), 0)
+
+    def _build(self, members, depth):
+        if not members:
+            return -1
+        axis = depth % 3
+        members.sort(key=lambda index: self.points[index][axis])
+        middle = len(members) // 2
+        node = len(self.node_station)
+        self.node_station.append(members[middle])
+        self.node_axis.append(axis)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.left[node] = self._build(members[:middle], depth + 1)
+        self.right[node] = self._build(members[middle + 1:], depth + 1)
+        return node
+
+    def covers(self, station_index, data_types, years):
+        '''The purpose of this function is to check that a station has every requested element for the whole range
+        of requested years.
+        :param values: self = current instance of StationIndex, station_index = integer position of station,
+        data_types = iterable of element codes, years = iterable of integer years (or None for any year)
+        :return: True if the station covers the request
+        '''
+        elements = self.inventory.get(self.stations[station_index][0], {})
+        first_year, last_year = (min(years), max(years)) if years else (None, None)
+        for data_type in data_types:
+            if data_type not in elements:
+                return False
+            first, last = elements[data_type]
+            if first_year is not None and (first > first_year or last < last_year):
+                return False
+        return True
+
+    def nearest(self, lat, lon, k=NEAREST_STATION_COUNT, accept=None, max_distance_km=MAX_STATION_DISTANCE_KM):
+        '''The purpose of this function is to find the k closest stations that pass a filter.
+        :param values: self = current instance of StationIndex, lat = float of latitude, lon = float of longitude,
+        k = integer of stations wanted, accept = function taking a station position and returning True to keep it,
+        max_distance_km = float of the largest distance allowed
+        :return: list of tuples of station id, distance in km and station name, closest first
+        '''
+        target = to_unit_vector(lat, lon)
+        # Max-heap of the best k so far, stored as negative squared distances
+        best = []
+        # Nothing beyond the largest distance is kept, so the search never goes further than it
+        max_squared = km_to_chord(max_distance_km) ** 2
+
+        def bound():
+            return -best[0][0] if len(best) == k else max_squared
+
+        def search(node):
+            if node == -1:
+                return
+            station = self.node_station[node]
+            point = self.points[station]
+            squared = sum((target[axis] - point[axis]) ** 2 for axis in range(3))
+            # The filter can be slow, so it only runs for stations close enough to be kept
+            if squared <= bound() and (accept is None or accept(station)):
+                if len(best) < k:
+                    heapq.heappush(best, (-squared, station))
+                else:
+                    heapq.heapreplace(best, (-squared, station))
+
+            axis = self.node_axis[node]
+            difference = target[axis] - point[axis]
+            near, far = (self.left[node], self.right[node]) if difference < 0 else (self.right[node], self.left[node])
+            search(near)
+            if difference * difference <= bound():
+                search(far)
+
+        search(self.root)
+        found = []
+        for negative_squared, station in sorted(best, reverse=True):
+            station_id, _, _, name = self.stations[station]
+            found.append((station_id, chord_to_km(math.sqrt(-negative_squared)), name))
+        return found
+
+    def nearest_covering(self, lat, lon, data_types, years=None, k=NEAREST_STATION_COUNT):
+        '''The purpose of this function is to find the closest stations with data for the requested elements and
+        years. When no nearby station has all of them, stations with any of them are used instead.
+        :param values: self = current instance of StationIndex, lat = float of latitude, lon = float of longitude,
+        data_types = iterable of element codes, years = iterable of integer years, k = integer of stations wanted
+        :return: list of tuples of station id, distance in km and station name
+        '''
+        data_types = list(data_types)
+        years = list(years) if years else None
+        stations = self.nearest(lat, lon, k, lambda station: self.covers(station, data_types, years))
+        if not stations:
+            stations = self.nearest(lat, lon, k, lambda station: any(
+                self.covers(station, [data_type], years) for data_type in data_types))
+        return stations
+
+
+def download_station_file(url):
+    '''The purpose of this function is to download one of the GHCND station files if it is not on disk yet.
+    :param values: url = string of STATIONS_URL or INVENTORY_URL
+    :return: string of the file's path in the data folder
+    '''
+    path = data_path("ghcnd", url.rsplit("/", 1)[1])
+    if not os.path.exists(path):
+        response = http_get(url)
+        response.raise_for_status()
+        with open(path, "wb") as output:
+            output.write(response.content)
+    return path
+
+
+def download_station_files():
+    '''The purpose of this function is to download the station list and inventory if they are not on disk yet.
+    :param values: none
+    :return: tuple of station list path and inventory path
+    '''
+    return download_station_file(STATIONS_URL), download_station_file(INVENTORY_URL)
+
+
+def build_station_index():
+    '''The purpose of this function is to download the station files if needed and build the index. The built tree
+    is pickled next to the source files so later starts skip the parsing and building.
+    :param values: none
+    :return: StationIndex
+    '''
+    stations_path, inventory_path = download_station_files()
+    pickle_path = data_path("ghcnd", "station_index.pickle")
+    newest_source = max(os.path.getmtime(stations_path), os.path.getmtime(inventory_path))
+    if os.path.exists(pickle_path) and os.path.getmtime(pickle_path) >= newest_source:
+        with open(pickle_path, "rb") as pickle_file:
+            return pickle.load(pickle_file)
+
+    index = StationIndex(parse_stations(stations_path), parse_inventory(inventory_path))
+    # Written to a temporary file first so a crash never leaves half a pickle behind
+    temporary_path = pickle_path + ".tmp"
+    with open(temporary_path, "wb") as pickle_file:
+        pickle.dump(index, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, pickle_path)
+    return index
+
+
+_index = None
+_index_failed_at = None
+_index_lock = threading.Lock()
+_index_thread = None
+_index_thread_lock = threading.Lock()
+
+
+def load_station_index():
+    '''The purpose of this function is to load the station index once for the whole app, waiting for the download
+    and build if needed. A failure is remembered, so the download is not tried again on every query.
+    :param values: none
+    :return: StationIndex, or None if the station files could not be downloaded or read
+    '''
+    global _index, _index_failed_at
+    with _index_lock:
+        if _index is not None:
+            return _index
+        if _index_failed_at is not None and time.monotonic() - _index_failed_at < RETRY_AFTER_FAILURE_SECONDS:
+            return None
+        try:
+            _index = build_station_index()
+        except Exception as e:
+            print(f"Error: unable to get the GHCND station inventory: {e}")
+            _index_failed_at = time.monotonic()
+            return None
+        _index_failed_at = None
+        return _index
+
+
+def start_loading_station_index():
+    '''The purpose of this function is to load the station index on a background thread, unless it is loaded or
+    loading already.
+    :param values: none
+    :return: none
+    '''
+    global _index_thread
+    with _index_thread_lock:
+        if _index is None and (_index_thread is None or not _index_thread.is_alive()):
+            _index_thread = threading.Thread(target=load_station_index, name="station-index", daemon=True)
+            _index_thread.start()
+
+
+def station_index():
+    '''The purpose of this function is to get the station index without waiting for it. The first call starts
+    loading it in the background.
+    :param values: none
+    :return: StationIndex, or None while it is loading or after it failed
+    '''
+    if _index is None:
+        start_loading_station_index()
+    return _index
+
+
+def nearest_station_ids(lat, lon, data_types, years=None, k=NEAREST_STATION_COUNT):
+    '''The purpose of this function is to turn coordinates into the GHCND station ids a CDO query should target.
+    Until the station index is ready the query goes by coordinates, so the first query never waits for it.
+    :param values: lat = float of latitude, lon = float of longitude, data_types = string of comma separated
+    element codes, years = iterable of integer years, k = integer of stations wanted
+    :return: list of CDO station ids (like "GHCND:USW00094728"), or None to query by coordinates instead
+    '''
+    index = station_index()
+    if index is None:
+        return None
+    stations = index.nearest_covering(lat, lon, data_types.split(","), years, k)
+    if not stations:
+        return None
+    return [f"GHCND:{station_id}" for station_id, _, _ in stations]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "build":
+        print("Usage: python stations.py build")
+        sys.exit(1)
+    index = load_station_index()
+    if index is None:
+        sys.exit(1)
+    print(f"Indexed {len(index.stations)} stations in {data_path('ghcnd')}")
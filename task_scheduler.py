@@ -0,0 +1,197 @@
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_QUERY = 10
+PRIORITY_BACKGROUND = 20
+
+# Number of recent tasks the latency metrics are computed over
+LATENCY_WINDOW = 200
+
+_local = threading.local()
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def is_set(self):
+        # Lets a token be passed wherever a threading.Event is checked for cancellation
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise TaskCancelled()
+
+
+def current_token():
+    '''The purpose of this function is to get the cancel token of the task running on this thread, so code called
+    by a task can stop early without the token being passed down through every function.
+    :param values: none
+    :return: CancelToken, or None outside of a scheduled task
+    '''
+    return getattr(_local, "token", None)
+
+
+def check_cancelled():
+    '''The purpose of this function is to stop the running task if a newer task replaced it.
+    :param values: none
+    :return: none, but raises TaskCancelled when the task was cancelled
+    '''
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+class _Task:
+    def __init__(self, function, args, token, on_done, on_error):
+        self.function = function
+        self.args = args
+        self.token = token
+        self.on_done = on_done
+        self.on_error = on_error
+        self.submitted_at = time.monotonic()
+
+
+class TaskScheduler:
+    def __init__(self, root=None, max_workers=4, max_queue=32):
+        '''The purpose of this function is to start a fixed pool of worker threads fed by a bounded priority queue.
+        :param values: self = current instance of TaskScheduler, root = Tk root used to post results back to the GUI
+        thread (None to call callbacks on the worker), max_workers = integer of worker threads, max_queue = integer
+        of tasks allowed to wait before new ones are refused
+        :return: none
+        '''
+        self.root = root
+        self.queue = queue.PriorityQueue(maxsize=max_queue)
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.running = 0
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self.wait_times = deque(maxlen=LATENCY_WINDOW)
+        self.run_times = deque(maxlen=LATENCY_WINDOW)
+
+        for number in range(max_workers):
+            threading.Thread(target=self._work, name=f"scheduler-worker-{number}", daemon=True).start()
+
+    def submit(self, function, *args, priority=PRIORITY_QUERY, channel=None, on_done=None, on_error=None):
+        '''The purpose of this function is to queue a task. A task submitted on a channel cancels the task that was
+        submitted on the same channel before it, so a newer query replaces an older one.
+        :param values: self = current instance of TaskScheduler, function = function to run on a worker, args =
+        arguments for the function, priority = integer where lower runs first, channel = string naming the kind of
+        query, on_done = function called on the GUI thread with the result, on_error = function called on the GUI
+        thread with the exception
+        :return: CancelToken of the task, or None if the queue is full
+        '''
+        token = CancelToken()
+        task = _Task(function, args, token, on_done, on_error)
+        try:
+            self.queue.put_nowait((priority, next(self.order), task))
+        except queue.Full:
+            with self.lock:
+                self.counts["rejected"] += 1
+            print("Error: Too many requests are waiting. Please try again in a moment.")
+            return None
+
+        with self.lock:
+            self.counts["submitted"] += 1
+            if channel is not None:
+                previous = self.channels.get(channel)
+                if previous is not None:
+                    previous.cancel()
+                self.channels[channel] = token
+        return token
+
+    def cancel(self, channel):
+        '''The purpose of this function is to cancel the latest task of a channel, like when the user presses a
+        cancel button.
+        :param values: self = current instance of TaskScheduler, channel = string naming the kind of query
+        :return: none
+        '''
+        with self.lock:
+            token = self.channels.pop(channel, None)
+        if token is not None:
+            token.cancel()
+
+    def post(self, callback, *args):
+        '''The purpose of this function is to run a callback on the Tk thread with root.after.
+        :param values: self = current instance of TaskScheduler, callback = function to call, args = its arguments
+        :return: none
+        '''
+        if self.root is None:
+            callback(*args)
+        else:
+            self.root.after(0, lambda: callback(*args))
+
+    def _work(self):
+        while True:
+            _, _, task = self.queue.get()
+            started = time.monotonic()
+            with self.lock:
+                self.wait_times.append(started - task.submitted_at)
+                self.running += 1
+
+            outcome = "completed"
+            _local.token = task.token
+            try:
+                task.token.raise_if_cancelled()
+                result = task.function(*task.args)
+                task.token.raise_if_cancelled()
+                if task.on_done is not None:
+                    self.post(task.on_done, result)
+            except TaskCancelled:
+                outcome = "cancelled"
+            except Exception as e:
+                outcome = "failed"
+                if task.on_error is not None:
+                    self.post(task.on_error, e)
+                else:
+                    print(f"An error occurred: {e}")
+            finally:
+                _local.token = None
+                with self.lock:
+                    self.running -= 1
+                    self.counts[outcome] += 1
+                    self.run_times.append(time.monotonic() - started)
+                self.queue.task_done()
+
+    def metrics(self):
+        '''The purpose of this function is to report how loaded the scheduler is and how long tasks take.
+        :param values: self = current instance of TaskScheduler
+        :return: dictionary of queue depth, running tasks, task counts and wait/run latencies in seconds
+        '''
+        with self.lock:
+            return dict(
+                self.counts,
+                queue_depth=self.queue.qsize(),
+                running=self.running,
+                wait_seconds=latency_summary(self.wait_times),
+                run_seconds=latency_summary(self.run_times),
+            )
+
+
+def latency_summary(samples):
+    if not samples:
+        return {"mean": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
@@ -0,0 +1,303 @@
+'''Timing spans and counters for the fetch, aggregate and plot pipeline, off unless WEATHER_WRANGLER_TRACE is set.
+
+    WEATHER_WRANGLER_TRACE=1                   keep the metrics in memory (GET /metrics of the service shows them)
+    WEATHER_WRANGLER_TRACE=trace.jsonl         also append every finished span to that file as a JSON line, and the
+                                               final metrics when the app exits
+
+Every span adds its duration to the stage_seconds histogram of its name, HTTP requests are timed per endpoint in
+http_request_seconds, and caches count their hits and misses in cache_lookups_total. snapshot() returns the metrics
+as a dictionary, prometheus_text() in the Prometheus text format, and export_jsonl() writes them as JSON lines.
+
+While tracing is off, span() hands back one shared do-nothing context and count() and observe() return at once, so
+the instrumented code costs a flag check.
+'''
+import atexit
+import json
+import os
+import threading
+import time
+
+
+TRACE_ENV = "WEATHER_WRANGLER_TRACE"
+
+METRIC_PREFIX = "weather_wrangler_"
+
+# Upper bounds of the latency histogram buckets in seconds, from a cache read to a slow paged NOAA download
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        '''The purpose of this function is to set up the thread-safe store of counters and latency histograms.
+        :param values: self = current instance of Metrics, buckets = tuple of histogram bucket upper bounds in
+        seconds
+        :return: none
+        '''
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # One count per bucket, then the sum and count of every observation
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def cache_hit_ratios(self):
+        # Read under the caller's lock
+        lookups = {}
+        for (name, labels), value in self.counters.items():
+            if name != "cache_lookups_total":
+                continue
+            labels = dict(labels)
+            hits, total = lookups.get(labels["cache"], (0, 0))
+            lookups[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+        return {cache: hits / total for cache, (hits, total) in lookups.items() if total}
+
+    def snapshot(self):
+        '''The purpose of this function is to copy the metrics into plain dictionaries.
+        :param values: self = current instance of Metrics
+        :return: dictionary with lists of counters and histograms and the hit ratio of every cache
+        '''
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = []
+            for (name, labels), (counts, total, count) in sorted(self.histograms.items()):
+                cumulative, buckets = 0, {}
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    buckets[str(bound)] = cumulative
+                histograms.append({"name": name, "labels": dict(labels), "buckets": buckets, "sum": total,
+                                   "count": count})
+            return {"counters": counters, "histograms": histograms, "cache_hit_ratios": self.cache_hit_ratios()}
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class _Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.file_lock = threading.Lock()
+        self.local = threading.local()
+
+
+metrics = Metrics()
+_tracer = _Tracer()
+
+
+def enable(path=None):
+    '''The purpose of this function is to turn tracing on, as setting WEATHER_WRANGLER_TRACE before start does.
+    :param values: path = string of JSON lines file that finished spans are appended to (None keeps them in memory)
+    :return: none
+    '''
+    _tracer.path = path
+    _tracer.enabled = True
+
+
+def disable():
+    _tracer.enabled = False
+
+
+def enabled():
+    return _tracer.enabled
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def count(name, value=1, **labels):
+    if _tracer.enabled:
+        metrics.count(name, value, _label_key(labels))
+
+
+def observe(name, seconds, **labels):
+    if _tracer.enabled:
+        metrics.observe(name, seconds, _label_key(labels))
+
+
+def cache_lookup(cache, hit):
+    if _tracer.enabled:
+        metrics.count("cache_lookups_total", 1, _label_key({"cache": cache, "result": "hit" if hit else "miss"}))
+
+
+class _Span:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = getattr(_tracer.local, "stack", None)
+        if stack is None:
+            stack = _tracer.local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **attributes):
+        # Attributes learned inside the span, like the number of records, are written with it
+        self.attributes.update(attributes)
+
+    def __exit__(self, error_type, error, traceback):
+        seconds = time.perf_counter() - self.start
+        _tracer.local.stack.pop()
+        metrics.observe("stage_seconds", seconds, (("stage", self.name),))
+        if error_type is not None:
+            metrics.count("stage_errors_total", 1, (("stage", self.name),))
+        if _tracer.path:
+            _write_line(dict(self.attributes, type="span", name=self.name, parent=self.parent,
+                             start=self.wall_start, duration_ms=round(seconds * 1000, 3),
+                             thread=threading.current_thread().name, error=error_type.__name__ if error_type else None))
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def set(self, **attributes):
+        pass
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **attributes):
+    '''The purpose of this function is to time one stage of the pipeline, used as "with tracing.span("geocode"):".
+    :param values: name = string of stage name, attributes = values written with the span to the JSON lines file
+    :return: context manager whose set() adds attributes while the stage runs
+    '''
+    if not _tracer.enabled:
+        return _NULL_SPAN
+    return _Span(name, attributes)
+
+
+def traced(name):
+    '''The purpose of this function is to time every call of a function as a span.
+    :param values: name = string of stage name
+    :return: decorator
+    '''
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return function(*args, **kwargs)
+            with _Span(name, {}):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorate
+
+
+def _write_line(entry):
+    line = json.dumps(entry)
+    with _tracer.file_lock:
+        with open(_tracer.path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line + "\n")
+
+
+def snapshot():
+    return metrics.snapshot()
+
+
+def export_jsonl(path):
+    '''The purpose of this function is to append the current metrics to a file, one JSON line per series.
+    :param values: path = string of JSON lines file
+    :return: integer of lines written
+    '''
+    current = snapshot()
+    taken_at = time.time()
+    lines = [dict(counter, type="counter", time=taken_at) for counter in current["counters"]]
+    lines += [dict(histogram, type="histogram", time=taken_at) for histogram in current["histograms"]]
+    lines += [{"type": "cache_hit_ratio", "cache": cache, "value": ratio, "time": taken_at}
+              for cache, ratio in current["cache_hit_ratios"].items()]
+    with open(path, "a", encoding="utf-8") as trace_file:
+        for line in lines:
+            trace_file.write(json.dumps(line) + "\n")
+    return len(lines)
+
+
+def _prometheus_labels(labels, extra=None):
+    labels = dict(labels, **(extra or {}))
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def prometheus_text():
+    '''The purpose of this function is to render the metrics in the Prometheus text exposition format.
+    :param values: none
+    :return: string of the metrics
+    '''
+    current = snapshot()
+    lines = []
+    typed = set()
+    for counter in current["counters"]:
+        name = METRIC_PREFIX + counter["name"]
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_prometheus_labels(counter['labels'])} {counter['value']}")
+
+    for histogram in current["histograms"]:
+        name = METRIC_PREFIX + histogram["name"]
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        for bound, bucket_count in histogram["buckets"].items():
+            lines.append(f"{name}_bucket{_prometheus_labels(histogram['labels'], {'le': bound})} {bucket_count}")
+        lines.append(f"{name}_bucket{_prometheus_labels(histogram['labels'], {'le': '+Inf'})} {histogram['count']}")
+        lines.append(f"{name}_sum{_prometheus_labels(histogram['labels'])} {histogram['sum']}")
+        lines.append(f"{name}_count{_prometheus_labels(histogram['labels'])} {histogram['count']}")
+
+    if current["cache_hit_ratios"]:
+        lines.append(f"# TYPE {METRIC_PREFIX}cache_hit_ratio gauge")
+        for cache, ratio in sorted(current["cache_hit_ratios"].items()):
+            lines.append(f"{METRIC_PREFIX}cache_hit_ratio{_prometheus_labels({'cache': cache})} {ratio}")
+    return "\n".join(lines) + "\n"
+
+
+def _export_at_exit():
+    if _tracer.enabled and _tracer.path:
+        export_jsonl(_tracer.path)
+
+
+def configure_from_env():
+    '''The purpose of this function is to turn tracing on when WEATHER_WRANGLER_TRACE asks for it.
+    :param values: none
+    :return: none
+    '''
+    setting = os.environ.get(TRACE_ENV, "").strip()
+    if setting.lower() in ("", "0", "false", "off"):
+        return
+    enable(None if setting.lower() in ("1", "true", "on") else setting)
+
+
+configure_from_env()
+atexit.register(_export_at_exit)
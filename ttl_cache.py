@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+
+
+class TTLCache:
+    def __init__(self, maxsize=256, ttl=600, name="ttl"):
+        '''The purpose of this function is to set up a thread-safe, size-bounded LRU cache whose entries expire after
+        a fixed number of seconds.
+        :param values: self = current instance of TTLCache, maxsize = integer of entries kept before the least
+        recently used one is dropped, ttl = float of seconds an entry stays valid, name = string naming the cache in
+        the traced hit ratios
+        :return: none
+        '''
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''The purpose of this function is to return a cached value and mark it as recently used.
+        :param values: self = current instance of TTLCache, key = hashable cache key
+        :return: the cached value, or None if it is missing or expired
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if time.monotonic() < expires_at:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    tracing.cache_lookup(self.name, True)
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            tracing.cache_lookup(self.name, False)
+            return None
+
+    def put(self, key, value):
+        '''The purpose of this function is to store a value, dropping the least recently used entry when full.
+        :param values: self = current instance of TTLCache, key = hashable cache key, value = value to store
+        :return: none
+        '''
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        '''The purpose of this function is to report how well the cache is doing.
+        :param values: self = current instance of TTLCache
+        :return: dictionary with hits, misses, hit ratio and current size
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+            }
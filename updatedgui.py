@@ -1,20 +1,22 @@
-import threading
 from tkinter.ttk import Combobox
 
-import numpy as np
-import requests
+import os
 from tkinter import *
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from api import API_KEY1, API_KEY2
-from PIL import Image, ImageTk
+from tkinter import ttk, messagebox, filedialog
+import batch
+import tracing
+import weather_core
+from animation import Animator, DriftAnimation, load_scaled_image
+from plot_manager import PlotManager
+from task_scheduler import TaskScheduler, check_cancelled, current_token, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 
+# Delay before matplotlib and NumPy are imported in the background
+WARM_UP_DELAY_MS = 500
+
+CLOUD_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "newcloud.png")
+CLOUD_MAX_WIDTH = 200
+CLOUD_SPEED = 100  # pixels per second
 
-# API keys for OpenWeatherMap and NOAA
-OPENWEATHER_API_KEY = API_KEY1
-NOAA_API_TOKEN = API_KEY2
 
 class WeatherWranglerApp:
     def __init__(self, root):
@@ -22,9 +24,25 @@ class WeatherWranglerApp:
         self.root.title("Weather Wrangler App")
         self.root.geometry("800x600")
 
+        # Every fetch runs on one bounded worker pool and posts its results back with root.after
+        self.scheduler = TaskScheduler(root)
+
+        # Query number of the city comparison on screen, so rows of a replaced comparison are dropped
+        self.batch_query = 0
+
+        # Shared animation timer with an FPS cap
+        self.animator = Animator(root)
+
+        # Reusable plot windows
+        self.plots = PlotManager(root)
+
         # Main Menu
         self.create_main_menu()
 
+        # Plotting and NumPy load on a worker once the menu is up, so the window is not held back by them
+        self.root.after(WARM_UP_DELAY_MS,
+                        lambda: self.scheduler.submit(warm_up_imports, priority=PRIORITY_BACKGROUND))
+
 
     def create_main_menu(self):
         menu_frame = Frame(self.root, bg="#87CEEB", bd=5, relief="solid")
@@ -34,22 +52,13 @@ class WeatherWranglerApp:
         self.canvas = Canvas(menu_frame, width=800, height=300, bg="#87CEEB", bd=0, highlightthickness=0)
         self.canvas.pack(fill="both", expand=True)
 
-        # Load and add the cloud image
-        cloud_image = Image.open(r"C:\Users\mvvsg\PycharmProjects\CapstoneProject\newcloud.png")
-        self.cloud_image = ImageTk.PhotoImage(cloud_image)
-        self.cloud = self.canvas.create_image(-100, 50, image=self.cloud_image, anchor="nw")
-
-        # Animate the cloud
-        def animate_cloud():
-            current_x = self.canvas.coords(self.cloud)[0]
-            if current_x < 800:
-                new_x = current_x + 2
-                self.canvas.coords(self.cloud, new_x, 50)
-            else:
-                self.canvas.coords(self.cloud, -100, 50)
-            self.canvas.after(20, animate_cloud)
+        # Load and add the cloud image, shrunk once up front
+        self.cloud_image = load_scaled_image(CLOUD_IMAGE_PATH, CLOUD_MAX_WIDTH)
+        if self.cloud_image is not None:
+            self.cloud = self.canvas.create_image(-100, 50, image=self.cloud_image, anchor="nw")
 
-        animate_cloud()
+            # Animate the cloud
+            self.animator.add(DriftAnimation(self.canvas, self.cloud, CLOUD_SPEED, -100, 800, 50))
 
         Label(menu_frame, text="Welcome to the Weather Wrangler App!", font=("Arial", 16, 'bold'),
               bg="#87CEEB").pack(pady=10)
@@ -69,6 +78,7 @@ class WeatherWranglerApp:
         create_button("1. Find Current Weather", self.current_weather)
         create_button("2. Historical Weather Predictions", self.weather_probabilities)
         create_button("3. Weather Pattern Visualization", self.weather_pattern_visualization)
+        create_button("4. Compare Cities", self.city_comparison)
 
     '''
     def create_main_menu(self):
@@ -96,57 +106,59 @@ class WeatherWranglerApp:
 
     def display_weather(self):
         city = self.city_entry.get()
-        weather_data = self.fetch_openweather_data(city)
+        self.scheduler.submit(self.fetch_openweather_data, city, priority=PRIORITY_INTERACTIVE, channel="current",
+                              on_done=self.show_current_weather)
+
+    def show_current_weather(self, weather_data):
         if weather_data:
-            city_name = weather_data['name']
-            temperature = weather_data['main']['temp']
-            description = weather_data['weather'][0]['description']
-            humidity = weather_data['main']['humidity']
-            weather_summary = (
-                f"\nWeather Summary:\n"
-                f"City: {city_name}\n"
-                f"Temperature: {round((temperature * 9 / 5) + 32)}°F\n"
-                f"Description: {description.capitalize()}\n"
-                f"Humidity: {humidity}%"
-            )
-            self.show_weather_summary(weather_summary)
+            summary = weather_core.current_weather_summary(weather_data)
+            self.show_weather_summary(weather_core.format_current_weather(summary))
         else:
             print("Error: Unable to fetch weather data. Please check the city name or try again.")
 
     def fetch_openweather_data(self, city):
-        api_url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(api_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
+        return weather_core.fetch_openweather_data(city)
+
+    def show_weather_summary(self, summary, view=None):
+        # A summary that is still loading updates its window instead of opening another one
+        if view is not None and "label" in view:
+            if view["label"].winfo_exists():
+                view["label"].config(text=summary)
+            return
 
-    def show_weather_summary(self, summary):
         summary_window = Toplevel(self.root)
         summary_window.title("Weather Summary")
         summary_window.geometry("400x300")
-        Label(summary_window, text=summary, font=("Arial", 12)).pack(pady=10)
+        summary_label = Label(summary_window, text=summary, font=("Arial", 12))
+        summary_label.pack(pady=10)
+        if view is not None:
+            view["label"] = summary_label
 
     # ============= Historical Weather Predictions (NOAA API) ============= #
     def weather_probabilities(self):
         prob_frame = Toplevel(self.root,  bg="#000080")
         prob_frame.title("Historical Weather Predictions")
-        prob_frame.geometry("600x400")
+        prob_frame.geometry("600x500")
 
         Label(prob_frame, text="Enter City Name:").pack(pady=5)
         self.region_entry = Entry(prob_frame)
         self.region_entry.pack(pady=5)
 
-        Label(prob_frame, text="Enter Date (MM-DD):").pack(pady=5)
+        Label(prob_frame, text="Enter Date (MM-DD, MM-DD to MM-DD, month or season):").pack(pady=5)
         self.date_entry = Entry(prob_frame)
         self.date_entry.pack(pady=5)
 
+        Label(prob_frame, text="Enter Years (YYYY-YYYY):").pack(pady=5)
+        self.years_entry = Entry(prob_frame)
+        self.years_entry.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.years_entry.pack(pady=5)
+
         Button(prob_frame, text="Show Historical Weather Predictions", command=self.start_thread).pack(pady=10)
+        Button(prob_frame, text="Cancel", command=lambda: self.scheduler.cancel("historical")).pack(pady=10)
 
     def start_thread(self):
-        # Start a new thread for fetching NOAA data to avoid blocking the GUI
-        threading.Thread(target=self.display_weather_probabilities, daemon=True).start()
+        # Queue the NOAA fetch on the worker pool to avoid blocking the GUI; a newer query cancels this one
+        self.scheduler.submit(self.display_weather_probabilities, channel="historical")
 
     def display_weather_probabilities(self):
         city = self.region_entry.get()
@@ -154,12 +166,8 @@ class WeatherWranglerApp:
 
         # Improved date parsing with error handling
         try:
-            if len(date) != 5 or date[2] != '-':
-                raise ValueError("Date must be in MM-DD format")
-            month, day = map(int, date.split('-'))
-
-            if month < 1 or month > 12 or day < 1 or day > 31:
-                raise ValueError("Invalid month or day value.")
+            date_range = weather_core.parse_date_range(date)
+            years = weather_core.parse_year_window(self.years_entry.get())
         except ValueError as ve:
             print(f"Error: {ve}")
             return
@@ -167,156 +175,165 @@ class WeatherWranglerApp:
         # Lookup latitude and longitude for the given city
         location = self.lookup_location_id(city)
         if not location:
-            print("Error: Unable to find location for the given city. Please check the city name or try again.")
+            print(f"Error: {weather_core.location_not_found_message(city)}")
             return
 
         lat, lon = location
 
-        # Start a thread to fetch NOAA historical data
-        threading.Thread(target=self.fetch_and_process_historical_data, args=(lat, lon, city, month, day),
-                         daemon=True).start()
-
-    def lookup_location_id(self, city):
-        # Use OpenWeatherMap to get latitude and longitude of the city
-        weather_data = self.fetch_openweather_data(city)
-        if not weather_data:
-            return None
+        # Ranges of days, like 12-20 to 01-05 or a season, are fetched a year's range per request
+        if not date_range.single_day:
+            self.fetch_and_process_range_data(lat, lon, city, date_range, years)
+            return
+        month, day = date_range.start
 
-        lat = weather_data['coord']['lat']
-        lon = weather_data['coord']['lon']
+        # A precomputed climatology answers at once, without any download or aggregation
+        prediction = weather_core.climatology_prediction(lat, lon, month, day, years[0], years[-1])
+        if prediction is not None:
+            prediction_summary = weather_core.format_historical_prediction(city, month, day, prediction, years=years)
+            self.root.after(0, lambda: self.show_weather_summary(prediction_summary))
+            return
 
-        return lat, lon
+        # Fetch NOAA historical data on this worker, unless a newer query has already replaced this one
+        check_cancelled()
+        self.fetch_and_process_historical_data(lat, lon, city, month, day, years)
 
-    def fetch_and_process_historical_data(self, lat, lon, city, month, day):
-        # Fetch NOAA historical data
-        data = self.fetch_noaa_historical_data(lat, lon, month, day)
-        if data:
-            self.process_historical_data(data, city, month, day)
-        else:
+    def lookup_location_id(self, city):
+        return weather_core.lookup_location_id(city)
+
+    @tracing.traced("gui.fetch_and_process_historical_data")
+    def fetch_and_process_historical_data(self, lat, lon, city, month, day, years=None):
+        # Stream NOAA historical data a year at a time and refresh one summary window as each year arrives
+        data = []
+        summary_view = {}
+        years_loaded = 0
+        for _, records in self.stream_noaa_historical_data(lat, lon, month, day, years):
+            check_cancelled()
+            years_loaded += 1
+            # Each year comes as columns; adding them gives new columns, so earlier summaries keep their data
+            data = data + records
+            if data:
+                self.process_historical_data(data, city, month, day, summary_view, years_loaded, years)
+        if not data:
             print("No data available or error fetching data.")
 
     def fetch_noaa_historical_data(self, lat, lon, month, day):
-        # NOAA API endpoint
-        endpoint = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
-        headers = {"token": NOAA_API_TOKEN}
-
-        # Retrieve data for multiple years (e.g., last 10 years)
-        start_year = 2014
-        end_year = 2023
-        results = []
-
-        for year in range(start_year, end_year + 1):
-            startdate = f"{year}-{month:02d}-{day:02d}"
-            enddate = f"{year}-{month:02d}-{day:02d}"
-
-            params = {
-                "datasetid": "GHCND",  # Global Historical Climatology Network Daily
-                "datatypeid": "TMAX,TMIN,PRCP,SNOW",  # Collect relevant data types
-                "startdate": startdate,
-                "enddate": enddate,
-                "limit": 1000,  # Maximum results
-                "units": "metric",
-                "latitude": lat,
-                "longitude": lon,
-            }
-
-            response = requests.get(endpoint, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if "results" in data:
-                    results.extend(data["results"])
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-
-        return results
-
-    def process_historical_data(self, data, city, month, day):
+        return weather_core.fetch_noaa_historical_data(lat, lon, month, day)
+
+    def stream_noaa_historical_data(self, lat, lon, month, day, years=None,
+                                    data_types=weather_core.HISTORICAL_DATA_TYPES):
+        years = years or weather_core.history_years()
+        return weather_core.stream_noaa_historical_data(lat, lon, month, day, data_types,
+                                                        cancel=current_token(), start_year=years[0],
+                                                        end_year=years[-1])
+
+    def stream_noaa_range_data(self, lat, lon, date_range, years=None, data_types=weather_core.HISTORICAL_DATA_TYPES):
+        years = years or weather_core.history_years()
+        return weather_core.stream_noaa_range_data(lat, lon, date_range, data_types,
+                                                   cancel=current_token(), start_year=years[0], end_year=years[-1])
+
+    @tracing.traced("gui.fetch_and_process_range_data")
+    def fetch_and_process_range_data(self, lat, lon, city, date_range, years):
+        # Refresh one summary window as each batch of years arrives, then show the stats of every day
+        summary_view = {}
+        prediction = weather_core.climatology_range_prediction(lat, lon, date_range, years[0], years[-1])
+        if prediction is None:
+            data = []
+            for records in self.stream_noaa_range_data(lat, lon, date_range, years):
+                check_cancelled()
+                data = data + records
+                if data:
+                    partial = weather_core.summarize_range_data(data, date_range)
+                    partial_summary = weather_core.format_range_prediction(city, date_range, partial, years, True)
+                    self.root.after(0, lambda summary=partial_summary: self.show_weather_summary(summary, summary_view))
+            if not data:
+                print("No historical data available for the selected dates.")
+                return
+            prediction = weather_core.summarize_range_data(data, date_range)
+
+        prediction_summary = weather_core.format_range_prediction(city, date_range, prediction, years)
+        self.root.after(0, lambda: self.show_weather_summary(prediction_summary, summary_view))
+        self.root.after(0, lambda: self.show_range_days(city, date_range, prediction["days"]))
+
+    def show_range_days(self, city, date_range, days):
+        columns = ["date"] + batch.TABLE_COLUMNS[1:-1]
+        days_window = Toplevel(self.root)
+        days_window.title(f"{city} from {date_range.label()}")
+        days_window.geometry("800x500")
+
+        days_table = ttk.Treeview(days_window, columns=columns, show="headings")
+        for column in columns:
+            days_table.heading(column, text=batch.COLUMN_TITLES.get(column, "Date"))
+            days_table.column(column, width=120, anchor="center")
+        for day, prediction in days.items():
+            days_table.insert("", END, values=[day] + [prediction[column] for column in columns[1:]])
+        days_table.pack(pady=10, padx=10, fill="both", expand=True)
+
+    @tracing.traced("gui.process_historical_data")
+    def process_historical_data(self, data, city, month, day, view=None, years_loaded=None, years=None):
         # Initialize counters and sums for each data type
         total_records = len(data)
         if total_records == 0:
             print("No historical data available for the selected date.")
             return
 
-        avg_temp_max = avg_temp_min = total_precipitation = 0
-        count_temp_max = count_temp_min = count_precipitation = count_snow = 0
-        snow_days = 0
-
-        # Loop through the data to aggregate information
-        for record in data:
-            if record["datatype"] == "TMAX":
-                avg_temp_max += record["value"]
-                count_temp_max += 1
-            elif record["datatype"] == "TMIN":
-                avg_temp_min += record["value"]
-                count_temp_min += 1
-            elif record["datatype"] == "PRCP":
-                total_precipitation += record["value"]
-                count_precipitation += 1
-            elif record["datatype"] == "SNOW":
-                count_snow += 1
-                if record["value"] > 0:
-                    snow_days += 1
-
-        # Safely calculate averages if there is data available
-        if count_temp_max > 0:
-            avg_temp_max /= count_temp_max
-        if count_temp_min > 0:
-            avg_temp_min /= count_temp_min
-        if count_precipitation > 0:
-            avg_precipitation = total_precipitation / count_precipitation
-        else:
-            avg_precipitation = 0
-
-        snow_probability = (snow_days / count_snow) * 100 if count_snow > 0 else 0
-
         # Create prediction summary
-        prediction_summary = (
-            f"\nHistorical Weather Prediction for {city} on {month:02d}-{day:02d}:\n"
-            f"Average Maximum Temperature: {round((avg_temp_max * 9 / 5) + 32)}°F\n"
-            f"Average Minimum Temperature: {round((avg_temp_min * 9 / 5) + 32)}°F\n"
-            f"Average Precipitation: {avg_precipitation:.2f} mm\n"
-            f"Probability of Snow: {snow_probability:.2f}%"
-        )
+        prediction = weather_core.summarize_historical_data(data)
+        prediction_summary = weather_core.format_historical_prediction(city, month, day, prediction, years_loaded,
+                                                                       years)
         # Use the main thread to show the weather summary in the GUI
-        self.root.after(0, lambda: self.show_weather_summary(prediction_summary))
+        self.root.after(0, lambda: self.show_weather_summary(prediction_summary, view))
+
+    def show_weather_summary(self, summary, view=None):
+        # A summary that is still loading updates its window instead of opening another one
+        if view is not None and "label" in view:
+            if view["label"].winfo_exists():
+                view["label"].config(text=summary)
+            return
 
-    def show_weather_summary(self, summary):
         summary_window = Toplevel(self.root)
         summary_window.title("Weather Summary")
         summary_window.geometry("400x300")
-        Label(summary_window, text=summary, font=("Arial", 12)).pack(pady=10)
+        summary_label = Label(summary_window, text=summary, font=("Arial", 12))
+        summary_label.pack(pady=10)
+        if view is not None:
+            view["label"] = summary_label
 
     # ============= Weather Pattern Visualization ============= #
 
     def weather_pattern_visualization(self):
         pattern_frame = Toplevel(self.root, bg="#39d7bf")
         pattern_frame.title("Weather Pattern Visualization")
-        pattern_frame.geometry("600x500")
+        pattern_frame.geometry("600x600")
 
         # Dropdown for weather pattern
         Label(pattern_frame, text="Select Weather Pattern:").pack(pady=10)
 
         # Only store the user-friendly names in the combobox
-        self.pattern_combobox = Combobox(pattern_frame, values=[
-            "Max Temperature", "Min Temperature", "Precipitation", "Snowfall", "Average Temperature"
-        ])
+        self.pattern_combobox = Combobox(pattern_frame, values=list(weather_core.PATTERN_CODES))
         self.pattern_combobox.pack(pady=5)
 
         # Date and City entries remain the same
-        Label(pattern_frame, text="Enter Date (MM-DD):").pack(pady=10)
+        Label(pattern_frame, text="Enter Date (MM-DD, MM-DD to MM-DD, month or season):").pack(pady=10)
         self.date_entry_pattern = Entry(pattern_frame)
         self.date_entry_pattern.pack(pady=5)
 
+        Label(pattern_frame, text="Enter Years (YYYY-YYYY):").pack(pady=10)
+        self.years_entry_pattern = Entry(pattern_frame)
+        self.years_entry_pattern.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.years_entry_pattern.pack(pady=5)
+
         Label(pattern_frame, text="Enter City:").pack(pady=10)
         self.city_entry_pattern = Entry(pattern_frame)
         self.city_entry_pattern.pack(pady=5)
 
         Button(pattern_frame, text="Show Weather Pattern", command=self.start_pattern_thread).pack(pady=20)
+        Button(pattern_frame, text="Cancel", command=lambda: self.scheduler.cancel("pattern")).pack(pady=10)
 
     def start_pattern_thread(self):
-        # Start a new thread for fetching NOAA data to avoid blocking the GUI
-        threading.Thread(target=self.fetch_weather_pattern_data, daemon=True).start()
+        # Queue the NOAA fetch on the worker pool to avoid blocking the GUI; a newer query cancels this one
+        self.scheduler.submit(self.fetch_weather_pattern_data, channel="pattern")
 
+    @tracing.traced("gui.fetch_weather_pattern_data")
     def fetch_weather_pattern_data(self):
         date = self.date_entry_pattern.get().strip()
         city = self.city_entry_pattern.get().strip()
@@ -324,17 +341,8 @@ class WeatherWranglerApp:
         # Get the selected pattern name from the combobox
         selected_pattern_name = self.pattern_combobox.get().strip()
 
-        # Map user-friendly names to their respective NOAA pattern codes
-        pattern_map = {
-            "Max Temperature": "TMAX",
-            "Min Temperature": "TMIN",
-            "Precipitation": "PRCP",
-            "Snowfall": "SNOW",
-            "Average Temperature": "TAVG"
-        }
-
         # Get the corresponding pattern code based on the selected name
-        selected_pattern_code = pattern_map.get(selected_pattern_name)
+        selected_pattern_code = weather_core.PATTERN_CODES.get(selected_pattern_name)
 
         # Debugging: Print the selected pattern code
         print(f"Selected pattern from combobox (code): {selected_pattern_code}")
@@ -345,104 +353,86 @@ class WeatherWranglerApp:
 
         # Input validation for date
         try:
-            if len(date) != 5 or date[2] != '-':
-                raise ValueError("Date must be in MM-DD format")
-            month, day = map(int, date.split('-'))
-
-            if month < 1 or month > 12 or day < 1 or day > 31:
-                raise ValueError("Invalid month or day value.")
+            date_range = weather_core.parse_date_range(date)
         except ValueError as ve:
             messagebox.showerror("Invalid Date", f"Error: {ve}")
             return
+        try:
+            years = weather_core.parse_year_window(self.years_entry_pattern.get())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Years", f"Error: {ve}")
+            return
 
         # Fetch data from NOAA API for this city and date
         location = self.lookup_location_id(city)
         if location:
             lat, lon = location
-            data = self.fetch_noaa_historical_data(lat, lon, month, day)
-            if data:
-                # Get all unique data types from the fetched data
-                available_types = list(set(record["datatype"] for record in data))
-
-                # If the specific pattern is not found, show available types
-                if selected_pattern_code not in available_types:
-                    available_types_str = ", ".join(sorted(available_types))
-
-                    # Create a popup to inform the user about available data types
-                    pattern_window = Toplevel(self.root)
-                    pattern_window.title("Available Weather Data Types")
-                    pattern_window.geometry("400x300")
-
-                    label = Label(pattern_window,
-                                  text=f"'{selected_pattern_name}' not found.\n\nAvailable Data Types:\n{available_types_str}",
-                                  justify=LEFT,
-                                  wraplength=350
-                                  )
-                    label.pack(pady=20)
-
-                    # Create a listbox to show available types
-                    listbox = Listbox(pattern_window, width=50)
-                    for data_type in sorted(available_types):
-                        listbox.insert(END, data_type)
-                    listbox.pack(pady=10)
 
-                    # Add a close button
-                    Button(pattern_window, text="Close", command=pattern_window.destroy).pack(pady=10)
-
-                    return
-
-                self.root.after(0, lambda: self.plot_weather_pattern(data, selected_pattern_code))
+            # Stream only the selected datatype in and redraw one plot window whenever a batch adds points
+            data = []
+            plot_view = {}
+            if date_range.single_day:
+                month, day = date_range.start
+                batches = (records for _, records in self.stream_noaa_historical_data(lat, lon, month, day, years,
+                                                                                      selected_pattern_code))
             else:
-                messagebox.showerror("Data Error", "No data available for the selected date and location.")
+                batches = self.stream_noaa_range_data(lat, lon, date_range, years, selected_pattern_code)
+            for records in batches:
+                check_cancelled()
+                data = data + records
+                if records:
+                    # The columns are never changed in place, so the plot can read them while the next batch loads
+                    self.root.after(0, lambda data=data: self.plot_weather_pattern(
+                        data, selected_pattern_code, plot_view, date_range, years))
+
+            if not data:
+                # Only when nothing was found is the station metadata asked which datatypes were recorded here, so
+                # the normal path costs no extra requests and a datatype is never refused before it is fetched
+                available_types = weather_core.available_pattern_types(lat, lon, years[0], years[-1])
+                if available_types and selected_pattern_code not in available_types:
+                    self.root.after(0, lambda: self.show_available_types(selected_pattern_name, available_types))
+                else:
+                    messagebox.showerror("Data Error", "No data available for the selected date and location.")
         else:
-            messagebox.showerror("Location Error", "Unable to find city location. Please check the city name.")
-
-    def fetch_noaa_historical_data(self, lat, lon, month, day):
-        # NOAA API endpoint
-        endpoint = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
-        headers = {"token": NOAA_API_TOKEN}
-
-        # Retrieve data for multiple years (e.g., last 10 years)
-        start_year = 2014
-        end_year = 2023
-        results = []
-
-        # Add ALL available data types
-        data_types = "TMAX,TMIN,PRCP,SNOW,AWND,WSF5,TOBS,WDF5,WESD,TAVG"
-
-        for year in range(start_year, end_year + 1):
-            startdate = f"{year}-{month:02d}-{day:02d}"
-            enddate = f"{year}-{month:02d}-{day:02d}"
-
-            params = {
-                "datasetid": "GHCND",  # Global Historical Climatology Network Daily
-                "datatypeid": data_types,  # Collect all available data types
-                "startdate": startdate,
-                "enddate": enddate,
-                "limit": 1000,  # Maximum results
-                "units": "metric",
-                "latitude": lat,
-                "longitude": lon,
-            }
-
-            response = requests.get(endpoint, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if "results" in data:
-                    results.extend(data["results"])
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-
-        return results
-
-    def plot_weather_pattern(self, data, pattern):
+            messagebox.showerror("Location Error", weather_core.location_not_found_message(city))
+
+    def show_available_types(self, pattern_name, available_types):
+        available_types_str = ", ".join(sorted(available_types))
+
+        # Create a popup to inform the user about available data types
+        pattern_window = Toplevel(self.root)
+        pattern_window.title("Available Weather Data Types")
+        pattern_window.geometry("400x300")
+
+        label = Label(pattern_window,
+                      text=f"'{pattern_name}' not found.\n\nAvailable Data Types:\n{available_types_str}",
+                      justify=LEFT,
+                      wraplength=350
+                      )
+        label.pack(pady=20)
+
+        # Create a listbox to show available types
+        listbox = Listbox(pattern_window, width=50)
+        for data_type in sorted(available_types):
+            listbox.insert(END, f"{data_type} - {available_types[data_type]}")
+        listbox.pack(pady=10)
+
+        # Add a close button
+        Button(pattern_window, text="Close", command=pattern_window.destroy).pack(pady=10)
+
+    def fetch_noaa_historical_data(self, lat, lon, month, day, data_types=weather_core.HISTORICAL_DATA_TYPES):
+        # Only the datatypes the caller shows are downloaded
+        return weather_core.fetch_noaa_historical_data(lat, lon, month, day, data_types)
+
+    @tracing.traced("gui.plot_weather_pattern")
+    def plot_weather_pattern(self, data, pattern, view=None, date_range=None, years_window=None):
         # Check if data is available
         if not data:
             messagebox.showerror("Data Error", "No data available for the selected pattern.")
             return
 
         # Get unique data types from the NOAA dataset
-        available_data_types = set(record["datatype"] for record in data)
+        available_data_types = set(data.datatype_ids())
 
         # If the specified pattern is not in the dataset, show available types
         if pattern not in available_data_types:
@@ -452,87 +442,157 @@ class WeatherWranglerApp:
             return
 
         # Filter data for the selected pattern
-        pattern_data = [record for record in data if record["datatype"] == pattern]
+        pattern_data = data.of_datatype(pattern)
 
         # Ensure there is enough data to plot
         if not pattern_data:
             messagebox.showerror("Data Error", f"No records found for pattern '{pattern}'.")
             return
 
-        # Convert dates and improve data handling
-        import datetime
-        import numpy as np
-
-        # Group values by year
-        year_values = {}
-        for record in pattern_data:
-            date = datetime.datetime.fromisoformat(record["date"].replace('Z', '+00:00'))
-            year = date.year
-            if year not in year_values:
-                year_values[year] = []
-            year_values[year].append(record["value"])
-
-        # Prepare data for plotting
-        years = sorted(year_values.keys())
-        avg_values = [np.mean(year_values[year]) for year in years]
-
-        # Convert to Fahrenheit if the pattern is a temperature
-        if pattern in ["TMAX", "TMIN", "TAVG"]:
-            avg_values = [((value * 9 / 5) + 32) for value in avg_values]  # Convert Celsius to Fahrenheit
+        # Average the values of each year, in °F for temperatures; a range that runs over the new year counts once
+        if date_range is None or date_range.single_day:
+            years, avg_values = weather_core.weather_pattern_series(pattern_data, pattern)
+            date_label = None
+        else:
+            years, avg_values = weather_core.range_pattern_series(pattern_data, pattern, date_range)
+            date_label = date_range.label()
 
         # Plotting with improved data handling
         try:
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            # Plot average values for each year
-            ax.plot(years, avg_values, marker="o", linestyle="-", color='blue')
-
-            # Set x-axis ticks to be the years
-            ax.set_xticks(years)
-            ax.set_xticklabels(years, rotation=45)
-
-            # Set title with the weather pattern and city
+            # Title with the weather pattern and city, annotated with the specific date
             city = self.city_entry_pattern.get().strip()
+            first_record_date = pattern_data[0]["date"]
+            month, day = int(first_record_date[5:7]), int(first_record_date[8:10])
+
+            date_label = date_label or f"{month:02d}-{day:02d}"
+            years_window = years_window or range(years[0], years[-1] + 1)
+
+            # A new query takes over the open plot window and its figure; later years of the same query only update
+            # the line. If the user closed the plot, or a newer query took it over, the update is dropped
+            plot = view.get("plot") if view is not None else None
+            if plot is None:
+                plot = self.plots.pattern_plot("pattern", f"{pattern} Weather Pattern Plot")
+                plot.reset(pattern, city, date_label, years_window, owner=view)
+                if view is not None:
+                    view["plot"] = plot
+            elif plot.closed or plot.owner is not view:
+                return
+            plot.update(years, avg_values)
 
+        except Exception as e:
+            print(f"Error while plotting data: {e}")
+            messagebox.showerror("Plotting Error", f"An error occurred while plotting: {e}")
 
-            # Dynamically set y-axis label based on pattern
-            pattern_labels = {
-                "TMAX": "Maximum Temperature (°F)",
-                "TMIN": "Minimum Temperature (°F)",
-                "PRCP": "Precipitation (mm)",
-                "SNOW": "Snowfall (mm)",
-                "TAVG": "Average Temperature (°F)",
-            }
-            ax.set_title(f"{pattern_labels.get(pattern)} in {city.capitalize()}", fontsize=15)
-            ax.set_xlabel("Year", fontsize=12)
-
-
-            ax.set_xlabel("Year", fontsize=12)
-            ax.set_ylabel(pattern_labels.get(pattern, "Value"), fontsize=12)
+    # ============= City Comparison ============= #
+    def city_comparison(self):
+        compare_frame = Toplevel(self.root, bg="#39d7bf")
+        compare_frame.title("Compare Cities")
+        compare_frame.geometry("900x820")
+
+        Label(compare_frame, text="Enter Cities (one per line):").pack(pady=5)
+        self.batch_cities_text = Text(compare_frame, height=5, width=40)
+        self.batch_cities_text.pack(pady=5)
+        Button(compare_frame, text="Load Cities from CSV", command=self.load_batch_csv).pack(pady=5)
+
+        Label(compare_frame, text="Enter Date (MM-DD):").pack(pady=5)
+        self.batch_date_entry = Entry(compare_frame)
+        self.batch_date_entry.pack(pady=5)
+
+        Label(compare_frame, text="Enter Years (YYYY-YYYY):").pack(pady=5)
+        self.batch_years_entry = Entry(compare_frame)
+        self.batch_years_entry.insert(0, f"{weather_core.HISTORY_START_YEAR}-{weather_core.HISTORY_END_YEAR}")
+        self.batch_years_entry.pack(pady=5)
+
+        Label(compare_frame, text="Pattern to Plot:").pack(pady=5)
+        self.batch_pattern_combobox = Combobox(compare_frame, values=list(weather_core.PATTERN_CODES))
+        self.batch_pattern_combobox.pack(pady=5)
+
+        Button(compare_frame, text="Compare Cities", command=self.start_batch_comparison).pack(pady=5)
+        Button(compare_frame, text="Plot Pattern for All Cities", command=self.start_batch_plot).pack(pady=5)
+        Button(compare_frame, text="Cancel", command=self.cancel_batch).pack(pady=5)
+
+        # One row per city, filled in as each city finishes
+        self.batch_table = ttk.Treeview(compare_frame, columns=batch.TABLE_COLUMNS, show="headings", height=8)
+        for column in batch.TABLE_COLUMNS:
+            self.batch_table.heading(column, text=batch.COLUMN_TITLES[column])
+            self.batch_table.column(column, width=120, anchor="center")
+        self.batch_table.pack(pady=10, padx=10, fill="both", expand=True)
+
+    def load_batch_csv(self):
+        path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            cities = batch.read_cities(path)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("File Error", f"Unable to read the file: {e}")
+            return
+        self.batch_cities_text.delete("1.0", END)
+        self.batch_cities_text.insert("1.0", "\n".join(cities))
 
-            ax.grid(True, linestyle='--', alpha=0.7)
+    def read_batch_inputs(self):
+        cities = batch.parse_cities(self.batch_cities_text.get("1.0", END))
+        if not cities:
+            messagebox.showerror("Invalid Cities", "Please enter at least one city.")
+            return None
+        try:
+            month, day = weather_core.parse_month_day(self.batch_date_entry.get().strip())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Date", f"Error: {ve}")
+            return None
+        try:
+            years = weather_core.parse_year_window(self.batch_years_entry.get())
+        except ValueError as ve:
+            messagebox.showerror("Invalid Years", f"Error: {ve}")
+            return None
+        return cities, month, day, years
 
-            # Add text annotation with specific date
-            if pattern_data:
-                first_record_date = datetime.datetime.fromisoformat(pattern_data[0]["date"].replace('Z', '+00:00'))
-                plt.text(0.05, 0.95, f"Data for {first_record_date.month:02d}-{first_record_date.day:02d}",
-                         transform=ax.transAxes, verticalalignment='top')
+    def start_batch_comparison(self):
+        inputs = self.read_batch_inputs()
+        if inputs is None:
+            return
+        cities, month, day, years = inputs
+
+        self.batch_query += 1
+        query = self.batch_query
+        self.batch_table.delete(*self.batch_table.get_children())
+        # The cities are fetched on batch's own pool, so the task's cancel token is handed to it to stop them
+        on_row = lambda row: self.root.after(0, lambda: self.add_batch_row(row, query))
+        self.scheduler.submit(lambda: batch.compare_cities(cities, month, day, batch.BATCH_WORKERS, on_row, years[0],
+                                                           years[-1], cancel=current_token()), channel="batch")
+
+    def add_batch_row(self, row, query):
+        # Rows of a comparison that was cancelled or replaced are dropped
+        if query != self.batch_query or not self.batch_table.winfo_exists():
+            return
+        self.batch_table.insert("", END, values=[row.get(column, "") for column in batch.TABLE_COLUMNS])
 
-            # Tight layout to prevent cutting off labels
-            plt.tight_layout()
+    def start_batch_plot(self):
+        pattern = weather_core.PATTERN_CODES.get(self.batch_pattern_combobox.get().strip())
+        if not pattern:
+            messagebox.showerror("Invalid Pattern", "Please select a weather pattern to plot.")
+            return
+        inputs = self.read_batch_inputs()
+        if inputs is None:
+            return
+        cities, month, day, years = inputs
 
-            # Display plot in the GUI
-            plot_window = Toplevel(self.root)
-            plot_window.title(f"{pattern} Weather Pattern Plot")
-            plot_window.geometry("800x600")
+        self.scheduler.submit(lambda: batch.compare_patterns(cities, month, day, pattern, batch.BATCH_WORKERS, years[0],
+                                                             years[-1], cancel=current_token()),
+                              channel="batch_plot",
+                              on_done=lambda series: self.plot_batch_comparison(series, pattern, month, day))
 
-            canvas = FigureCanvasTkAgg(fig, master=plot_window)
-            canvas.get_tk_widget().pack(fill=BOTH, expand=True)
-            canvas.draw()
+    def cancel_batch(self):
+        self.batch_query += 1
+        self.scheduler.cancel("batch")
+        self.scheduler.cancel("batch_plot")
 
-        except Exception as e:
-            print(f"Error while plotting data: {e}")
-            messagebox.showerror("Plotting Error", f"An error occurred while plotting: {e}")
+    def plot_batch_comparison(self, series, pattern, month, day):
+        if not series:
+            messagebox.showerror("Data Error", f"No records found for pattern '{pattern}'.")
+            return
+        plot_window = self.plots.figure_window("batch", f"{pattern} City Comparison")
+        plot_window.redraw(batch.draw_comparison, series, pattern, month, day)
 
     def create_main_menu(self):
         menu_frame = Frame(self.root)
@@ -544,12 +604,19 @@ class WeatherWranglerApp:
         Button(menu_frame, text="2. Historical Weather Predictions", command=self.weather_probabilities).pack(pady=5)
         Button(menu_frame, text="3. Weather Pattern Visualization", command=self.weather_pattern_visualization).pack(
             pady=5)
+        Button(menu_frame, text="4. Compare Cities", command=self.city_comparison).pack(pady=5)
+
+
+def warm_up_imports():
+    weather_core.warm_up()
+    import matplotlib.backends.backend_tkagg
 
 
 # Run App
-try:
-    root = Tk()
-    app = WeatherWranglerApp(root)
-    root.mainloop()
-except Exception as e:
-    print(f"An error occurred: {e}")
+if __name__ == "__main__":
+    try:
+        root = Tk()
+        app = WeatherWranglerApp(root)
+        root.mainloop()
+    except Exception as e:
+        print(f"An error occurred: {e}")
@@ -0,0 +1,541 @@
+'''Data and compute layer of the Weather Wrangler App, with no Tkinter dependency.
+
+The GUI windows in gui.py and updatedgui.py and the HTTP service in service.py are all thin clients of these
+functions, so one process can serve many users with the same fetch, cache and aggregation code.
+
+matplotlib and the NumPy modules (aggregation, climatology and the GHCND archive) are imported on first use rather
+than here, so the GUI can show its main menu without waiting for them; warm_up() loads them ahead of time.
+'''
+import os
+
+import tracing
+from date_ranges import parse_date_range, parse_month_day, history_years, HISTORY_START_YEAR, HISTORY_END_YEAR
+from geocoder import resolve_city, suggest_cities
+from noaa_client import fetch_noaa_years, iter_noaa_years, iter_noaa_range
+from noaa_metadata import available_data_types
+from owm_client import fetch_current_weather, normalize_city
+from singleflight import SingleFlight
+from stations import nearest_station_ids, start_loading_station_index
+
+
+# API keys for OpenWeatherMap and NOAA, read when they are first needed from these variables or else from api.py
+# (API_KEY1 and API_KEY2), so the core imports, and answers from the archive, without api.py
+OPENWEATHER_KEY_ENV = "WEATHER_WRANGLER_OPENWEATHER_KEY"
+NOAA_TOKEN_ENV = "WEATHER_WRANGLER_NOAA_TOKEN"
+
+# More NOAA tokens, separated by commas, whose quotas are used round-robin together with the main NOAA token
+NOAA_TOKENS_ENV = "WEATHER_WRANGLER_NOAA_TOKENS"
+
+# Most year ticks a pattern plot labels before it starts skipping years
+MAX_YEAR_TICKS = 20
+
+# Datatypes used by the historical prediction, and every datatype the pattern view can show. The pattern view only
+# downloads the one datatype it plots
+HISTORICAL_DATA_TYPES = "TMAX,TMIN,PRCP,SNOW"
+ALL_DATA_TYPES = "TMAX,TMIN,PRCP,SNOW,AWND,WSF5,TOBS,WDF5,WESD,TAVG"
+
+# Map user-friendly names to their respective NOAA pattern codes
+PATTERN_CODES = {
+    "Max Temperature": "TMAX",
+    "Min Temperature": "TMIN",
+    "Precipitation": "PRCP",
+    "Snowfall": "SNOW",
+    "Average Temperature": "TAVG"
+}
+
+PATTERN_LABELS = {
+    "TMAX": "Maximum Temperature (°F)",
+    "TMIN": "Minimum Temperature (°F)",
+    "PRCP": "Precipitation (mm)",
+    "SNOW": "Snowfall (mm)",
+    "TAVG": "Average Temperature (°F)",
+}
+
+TEMPERATURE_PATTERNS = ["TMAX", "TMIN", "TAVG"]
+
+# Concurrent identical queries (double-clicks, two windows, or several service users) share one in-flight fetch
+openweather_flights = SingleFlight()
+noaa_flights = SingleFlight()
+
+
+def warm_up():
+    '''The purpose of this function is to import the NumPy and matplotlib modules used by predictions and plots
+    before they are first needed, like on a background thread once the app window is showing, and to start loading
+    the station index.
+    :param values: none
+    :return: none
+    '''
+    start_loading_station_index()
+    import aggregation
+    import climatology
+    import ghcnd_archive
+    import matplotlib.figure
+
+
+def api_key(env, name):
+    '''The purpose of this function is to read one API key, from the environment or else from api.py.
+    :param values: env = string of environment variable, name = string of the key's name in api.py
+    :return: string of the key
+    '''
+    key = os.environ.get(env, "").strip()
+    if key:
+        return key
+    try:
+        import api
+    except ImportError:
+        api = None
+    if not getattr(api, name, None):
+        raise RuntimeError(f"No API key found. Set {env} or add {name} to api.py.")
+    return getattr(api, name)
+
+
+def openweather_api_key():
+    return api_key(OPENWEATHER_KEY_ENV, "API_KEY1")
+
+
+def noaa_api_tokens():
+    extra = [token.strip() for token in os.environ.get(NOAA_TOKENS_ENV, "").split(",") if token.strip()]
+    return tuple(dict.fromkeys([api_key(NOAA_TOKEN_ENV, "API_KEY2")] + extra))
+
+
+def noaa_token_configured():
+    try:
+        noaa_api_tokens()
+    except RuntimeError:
+        return False
+    return True
+
+
+def noaa_fetch_tokens():
+    # A built GHCND archive answers without the web API, so a missing NOAA token only matters when there is none
+    from ghcnd_archive import load_archive
+    return () if load_archive() is not None else noaa_api_tokens()
+
+
+def celsius_to_fahrenheit(value):
+    return (value * 9 / 5) + 32
+
+
+def parse_year_window(text):
+    '''The purpose of this function is to read a history window typed as YYYY-YYYY. An empty entry means the
+    default window.
+    :param values: text = string of the window
+    :return: range of integer years
+    '''
+    text = text.strip()
+    if not text:
+        return history_years()
+    parts = text.split("-")
+    if len(parts) != 2:
+        raise ValueError("Years must be in YYYY-YYYY format")
+    return history_years(parts[0].strip(), parts[1].strip())
+
+
+def fetch_openweather_data(city):
+    '''The purpose of this function is to get the current weather of a city from OpenWeatherMap. Recent answers for
+    the same city come from a shared cache.
+    :param values: city = string of city name
+    :return: dictionary containing weather data from API, or None on error
+    '''
+    return openweather_flights.do(normalize_city(city), fetch_current_weather, city, openweather_api_key())
+
+
+def current_weather_summary(weather_data):
+    '''The purpose of this function is to pull the fields the app shows out of an OpenWeatherMap answer.
+    :param values: weather_data = dictionary containing weather data from API
+    :return: dictionary with city, temperature in °F, description and humidity
+    '''
+    return {
+        "city": weather_data['name'],
+        "temperature_f": round(celsius_to_fahrenheit(weather_data['main']['temp'])),
+        "description": weather_data['weather'][0]['description'].capitalize(),
+        "humidity": weather_data['main']['humidity'],
+    }
+
+
+def format_current_weather(summary):
+    return (
+        f"\nWeather Summary:\n"
+        f"City: {summary['city']}\n"
+        f"Temperature: {summary['temperature_f']}°F\n"
+        f"Description: {summary['description']}\n"
+        f"Humidity: {summary['humidity']}%"
+    )
+
+
+@tracing.traced("geocode")
+def lookup_location_id(city):
+    '''The purpose of this function is to look up the latitude and longitude of a city, which the NOAA queries need.
+    The local gazetteer is checked first and the OpenWeatherMap API is only used when the city is not in it.
+    :param values: city = string of city name
+    :return: tuple of latitude and longitude, or None if the city is not found
+    '''
+    location = resolve_city(city)
+    if location:
+        return location
+
+    weather_data = fetch_openweather_data(city)
+    if not weather_data:
+        return None
+    return weather_data['coord']['lat'], weather_data['coord']['lon']
+
+
+def location_not_found_message(city):
+    '''The purpose of this function is to explain that a city was not found, with similar gazetteer names to try.
+    :param values: city = string of city name
+    :return: string of error message
+    '''
+    message = "Unable to find city location. Please check the city name."
+    suggestions = suggest_cities(city)
+    if suggestions:
+        message += f" Did you mean {' or '.join(name.title() for name in suggestions)}?"
+    return message
+
+
+@tracing.traced("noaa_fetch")
+def fetch_noaa_historical_data(lat, lon, month, day, data_types=HISTORICAL_DATA_TYPES, start_year=None,
+                               end_year=None, cancel=None):
+    '''The purpose of this function is to get the NOAA records for one MM-DD over the history window from the
+    nearest stations that have these datatypes. Identical queries already in flight are joined instead of repeated,
+    and station days already in the cache are not downloaded again, so widening the window only fetches the years
+    that were not held before.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, data_types = string of comma separated NOAA datatype ids, start_year = integer of first
+    year, end_year = integer of last year (both default to the standard window), cancel = threading.Event that
+    aborts the remaining requests when set, leaving the records incomplete
+    :return: aggregation.RecordColumns of the records ordered by year
+    '''
+    years = history_years(start_year, end_year)
+    key = (round(lat, 4), round(lon, 4), month, day, data_types, years.start, years.stop)
+
+    def fetch():
+        station_ids = nearest_station_ids(lat, lon, data_types, years)
+
+        # The yearly requests run concurrently, bounded by the NOAA quota, and come back in year order as columns
+        # that every summary of the fetch shares
+        return fetch_noaa_years(lat, lon, month, day, noaa_fetch_tokens(), years, station_ids=station_ids,
+                                data_types=data_types, cancel=cancel)
+
+    # A cancellable fetch can stop part way, so it is not shared with callers that expect every record
+    if cancel is not None:
+        return fetch()
+    return noaa_flights.do(key, fetch)
+
+
+def stream_noaa_historical_data(lat, lon, month, day, data_types=HISTORICAL_DATA_TYPES, cancel=None, start_year=None,
+                                end_year=None):
+    '''The purpose of this function is to get the same records as fetch_noaa_historical_data one year at a time, so
+    a window can show partial results while the rest downloads. Streams are not shared between callers, but years
+    already fetched by anyone come from the cache.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, data_types = string of comma separated NOAA datatype ids, cancel = threading.Event that
+    aborts the remaining requests when set, start_year = integer of first year, end_year = integer of last year
+    :return: generator of integer years and their aggregation.RecordColumns, in the order they arrive
+    '''
+    years = history_years(start_year, end_year)
+    station_ids = nearest_station_ids(lat, lon, data_types, years)
+    yield from iter_noaa_years(lat, lon, month, day, noaa_fetch_tokens(), years, data_types, station_ids=station_ids,
+                               cancel=cancel)
+
+
+@tracing.traced("noaa_fetch_range")
+def fetch_noaa_range_data(lat, lon, date_range, data_types=HISTORICAL_DATA_TYPES, start_year=None, end_year=None):
+    '''The purpose of this function is to get the NOAA records of a range of days, like 12-20 to 01-05 or a season,
+    over the history window. Each year's range is one request (plus its pages) rather than one request per day.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, date_range =
+    date_ranges.DateRange, data_types = string of comma separated NOAA datatype ids, start_year = integer of first
+    year, end_year = integer of last year the ranges end in
+    :return: aggregation.RecordColumns of the records ordered by date
+    '''
+    from aggregation import RecordColumns
+
+    years = history_years(start_year, end_year)
+    key = (round(lat, 4), round(lon, 4), date_range.start, date_range.end, data_types, years.start, years.stop)
+
+    def fetch():
+        batches = list(stream_noaa_range_data(lat, lon, date_range, data_types, None, start_year, end_year))
+        return RecordColumns.concat(batches).sorted_by_date()
+
+    return noaa_flights.do(key, fetch)
+
+
+def stream_noaa_range_data(lat, lon, date_range, data_types=HISTORICAL_DATA_TYPES, cancel=None, start_year=None,
+                           end_year=None):
+    '''The purpose of this function is to get the same records as fetch_noaa_range_data a batch at a time, so a
+    window can show partial results while the rest downloads.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, date_range =
+    date_ranges.DateRange, data_types = string of comma separated NOAA datatype ids, cancel = threading.Event that
+    aborts the remaining requests when set, start_year = integer of first year, end_year = integer of last year
+    :return: generator of aggregation.RecordColumns, in the order they arrive
+    '''
+    years = history_years(start_year, end_year)
+    station_ids = nearest_station_ids(lat, lon, data_types, years)
+    yield from iter_noaa_range(lat, lon, date_range, noaa_fetch_tokens(), years, data_types, station_ids=station_ids,
+                               cancel=cancel)
+
+
+def available_pattern_types(lat, lon, start_year=None, end_year=None):
+    '''The purpose of this function is to find which datatypes the stations near a location recorded over the history
+    window, from the cached NOAA station metadata rather than by downloading weather data. The stations are not the
+    ones a fetch picks from the station index, so the answer is a suggestion, not a check before fetching.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, start_year = integer of first
+    year, end_year = integer of last year
+    :return: dictionary of datatype id to its name, or None if there is no NOAA token or the metadata could not be
+    fetched
+    '''
+    # The station metadata is only on the web API, even when a built archive answers the fetches without a token
+    if not noaa_token_configured():
+        return None
+    return available_data_types(lat, lon, noaa_api_tokens(), history_years(start_year, end_year))
+
+
+@tracing.traced("aggregate")
+def summarize_historical_data(data):
+    '''The purpose of this function is to compute the averages shown by the historical prediction.
+    :param values: data = aggregation.RecordColumns (or list of NOAA weather data dictionaries)
+    :return: dictionary of average temperatures in °F, average precipitation in mm, snow probability in percent and
+    the number of records used
+    '''
+    from aggregation import aggregate_records
+
+    # Aggregate every datatype in one vectorised pass; averages are 0 when a datatype has no records
+    stats = aggregate_records(data)
+    return {
+        "avg_temp_max_f": round(celsius_to_fahrenheit(stats.mean("TMAX"))),
+        "avg_temp_min_f": round(celsius_to_fahrenheit(stats.mean("TMIN"))),
+        "avg_precipitation_mm": round(stats.mean("PRCP"), 2),
+        "snow_probability": round(stats.positive_fraction("SNOW") * 100, 2),
+        "record_count": len(data),
+    }
+
+
+def climatology_values(summary):
+    # Climatology summaries are metric; the prediction shows °F like summarize_historical_data
+    return {
+        "avg_temp_max_f": round(celsius_to_fahrenheit(summary["tmax_mean"])),
+        "avg_temp_min_f": round(celsius_to_fahrenheit(summary["tmin_mean"])),
+        "avg_precipitation_mm": round(summary["prcp_mean"], 2),
+        "snow_probability": round(summary["snow_frequency"] * 100, 2),
+        "record_count": summary["record_count"],
+    }
+
+
+def climatology_prediction(lat, lon, month, day, start_year=None, end_year=None):
+    '''The purpose of this function is to answer a historical prediction from the precomputed climatology, with no
+    network and no aggregation. It is only used when the climatology was built for the same years.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, start_year = integer of first year, end_year = integer of last year
+    :return: dictionary in the format of summarize_historical_data, or None if the climatology cannot answer
+    '''
+    from climatology import load_climatology
+
+    climatology = load_climatology()
+    if climatology is None or climatology.years != history_years(start_year, end_year):
+        return None
+    summary = climatology.summary(lat, lon, month, day)
+    tracing.cache_lookup("climatology", summary is not None)
+    if summary is None:
+        return None
+    return climatology_values(summary)
+
+
+def historical_prediction(lat, lon, month, day, start_year=None, end_year=None, cancel=None):
+    '''The purpose of this function is to get the historical prediction of a place and MM-DD, from the climatology
+    when it can answer and from the NOAA records otherwise.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, month = integer of month,
+    day = integer of day, start_year = integer of first year, end_year = integer of last year, cancel =
+    threading.Event that aborts the remaining requests when set, leaving the prediction incomplete
+    :return: dictionary in the format of summarize_historical_data, or None without any records
+    '''
+    prediction = climatology_prediction(lat, lon, month, day, start_year, end_year)
+    if prediction is not None:
+        return prediction
+    data = fetch_noaa_historical_data(lat, lon, month, day, HISTORICAL_DATA_TYPES, start_year, end_year, cancel)
+    return summarize_historical_data(data) if data else None
+
+
+def format_historical_prediction(city, month, day, prediction, years_loaded=None, years=None):
+    years = years or history_years()
+    summary = (
+        f"\nHistorical Weather Prediction for {city} on {month:02d}-{day:02d}:\n"
+        f"Years: {years[0]}-{years[-1]}\n"
+        f"Average Maximum Temperature: {prediction['avg_temp_max_f']}°F\n"
+        f"Average Minimum Temperature: {prediction['avg_temp_min_f']}°F\n"
+        f"Average Precipitation: {prediction['avg_precipitation_mm']:.2f} mm\n"
+        f"Probability of Snow: {prediction['snow_probability']:.2f}%"
+    )
+    # Partial results say how much of the history window they cover
+    if years_loaded is not None and years_loaded < len(years):
+        summary += f"\n\nLoaded {years_loaded} of {len(years)} years..."
+    return summary
+
+
+@tracing.traced("aggregate_range")
+def summarize_range_data(data, date_range):
+    '''The purpose of this function is to compute the historical prediction of a range of days, for the whole range
+    and for each day of it.
+    :param values: data = aggregation.RecordColumns (or list of NOAA weather data dictionaries), date_range =
+    date_ranges.DateRange
+    :return: dictionary with "aggregate" in the format of summarize_historical_data and "days", a dictionary of
+    MM-DD to the same format for every day that has records, in the order of the range
+    '''
+    from aggregation import as_columns
+
+    # The days are picked out of the same columns instead of being regrouped record by record
+    data = as_columns(data)
+    month_days = data.month_days()
+    present = set(month_days.tolist())
+    days = {}
+    for month, day in date_range.days():
+        if month * 100 + day in present:
+            days[f"{month:02d}-{day:02d}"] = summarize_historical_data(data.select(month_days == month * 100 + day))
+    return {"aggregate": summarize_historical_data(data), "days": days}
+
+
+def climatology_range_prediction(lat, lon, date_range, start_year=None, end_year=None):
+    '''The purpose of this function is to answer a range prediction from the precomputed climatology. A smoothed
+    climatology already mixes in the days around each day, so ranges are only answered from an unsmoothed one.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, date_range =
+    date_ranges.DateRange, start_year = integer of first year, end_year = integer of last year
+    :return: dictionary in the format of summarize_range_data, or None if the climatology cannot answer
+    '''
+    from climatology import load_climatology
+
+    climatology = load_climatology()
+    if climatology is None or climatology.smooth_days or climatology.years != history_years(start_year, end_year):
+        return None
+    aggregate, by_day = climatology.range_summary(lat, lon, date_range)
+    tracing.cache_lookup("climatology", aggregate is not None)
+    if aggregate is None:
+        return None
+    return {
+        "aggregate": climatology_values(aggregate),
+        "days": {f"{month:02d}-{day:02d}": climatology_values(summary) for (month, day), summary in by_day.items()},
+    }
+
+
+def range_prediction(lat, lon, date_range, start_year=None, end_year=None):
+    '''The purpose of this function is to get the historical prediction of a place over a range of days, from the
+    climatology when it can answer and from the NOAA records otherwise.
+    :param values: lat = float of latitude of city, lon = float of longitude of city, date_range =
+    date_ranges.DateRange, start_year = integer of first year, end_year = integer of last year
+    :return: dictionary in the format of summarize_range_data, or None without any records
+    '''
+    prediction = climatology_range_prediction(lat, lon, date_range, start_year, end_year)
+    if prediction is not None:
+        return prediction
+    data = fetch_noaa_range_data(lat, lon, date_range, HISTORICAL_DATA_TYPES, start_year, end_year)
+    return summarize_range_data(data, date_range) if data else None
+
+
+def format_range_prediction(city, date_range, prediction, years=None, loading=False):
+    years = years or history_years()
+    aggregate = prediction["aggregate"]
+    summary = (
+        f"\nHistorical Weather Prediction for {city} from {date_range.label()}:\n"
+        f"Years: {years[0]}-{years[-1]}\n"
+        f"Days with records: {len(prediction['days'])} of {len(date_range.days())}\n"
+        f"Average Maximum Temperature: {aggregate['avg_temp_max_f']}°F\n"
+        f"Average Minimum Temperature: {aggregate['avg_temp_min_f']}°F\n"
+        f"Average Precipitation: {aggregate['avg_precipitation_mm']:.2f} mm\n"
+        f"Probability of Snow: {aggregate['snow_probability']:.2f}%"
+    )
+    if loading:
+        summary += "\n\nLoading more years..."
+    return summary
+
+
+@tracing.traced("pattern_series")
+def weather_pattern_series(data, pattern):
+    '''The purpose of this function is to turn NOAA records into the yearly averages plotted for a pattern, with
+    temperatures in °F.
+    :param values: data = aggregation.RecordColumns (or list of NOAA weather data dictionaries), pattern = string of
+    NOAA pattern code
+    :return: tuple of a list of years and a list of averages
+    '''
+    from aggregation import aggregate_records
+
+    # The other datatypes are grouped apart by the aggregation, so the records need no filtering first
+    years, avg_values = aggregate_records(data).year_means(pattern)
+
+    # Convert to Fahrenheit if the pattern is a temperature
+    if pattern in TEMPERATURE_PATTERNS:
+        avg_values = [celsius_to_fahrenheit(value) for value in avg_values]
+    return years, avg_values
+
+
+@tracing.traced("pattern_series_range")
+def range_pattern_series(data, pattern, date_range):
+    '''The purpose of this function is to turn NOAA records of a range of days into the average of each year's
+    range, so a winter from December to February counts as one point.
+    :param values: data = aggregation.RecordColumns (or list of NOAA weather data dictionaries), pattern = string of
+    NOAA pattern code, date_range = date_ranges.DateRange
+    :return: tuple of a list of years the ranges end in and a list of averages
+    '''
+    from aggregation import as_columns, range_year_means
+
+    years, avg_values = range_year_means(as_columns(data), pattern, date_range)
+
+    if pattern in TEMPERATURE_PATTERNS:
+        avg_values = [celsius_to_fahrenheit(value) for value in avg_values]
+    return years, avg_values
+
+
+def weather_pattern_figure(years, avg_values, pattern, city, month, day, date_label=None):
+    '''The purpose of this function is to draw the yearly averages of a pattern on a matplotlib Figure. It does not
+    use pyplot, so it is safe to call from any thread; the GUI embeds the figure in a window and the service renders
+    it to PNG.
+    :param values: years = list of years, avg_values = list of yearly averages, pattern = string of NOAA pattern
+    code, city = string of city name, month = integer of month, day = integer of day, date_label = string shown
+    instead of MM-DD, like the label of a date range
+    :return: matplotlib Figure
+    '''
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    draw_weather_pattern(fig, years, avg_values, pattern, city, month, day, date_label)
+    return fig
+
+
+@tracing.traced("render_pattern")
+def draw_weather_pattern(fig, years, avg_values, pattern, city, month, day, date_label=None):
+    '''The purpose of this function is to (re)draw the yearly averages of a pattern on an existing Figure, so a
+    plot that is already on screen can be updated as more years arrive.
+    :param values: fig = matplotlib Figure, years = list of years, avg_values = list of yearly averages, pattern =
+    string of NOAA pattern code, city = string of city name, month = integer of month, day = integer of day,
+    date_label = string shown instead of MM-DD, like the label of a date range
+    :return: none
+    '''
+    fig.clear()
+    ax = fig.add_subplot()
+
+    # Plot average values for each year
+    ax.plot(years, avg_values, marker="o", linestyle="-", color='blue')
+    style_pattern_axes(ax, years, pattern, city, date_label or f"{month:02d}-{day:02d}")
+
+    # Tight layout to prevent cutting off labels
+    fig.tight_layout()
+
+
+def style_pattern_axes(ax, years, pattern, city, date_label):
+    '''The purpose of this function is to set the ticks, titles, grid and date note of a pattern plot, so a plot that
+    is drawn once and one whose line is updated in place look the same.
+    :param values: ax = matplotlib Axes, years = list of years to label, pattern = string of NOAA pattern code, city =
+    string of city name, date_label = string of the MM-DD or range of days of the data
+    :return: none
+    '''
+    # Set x-axis ticks to be the years, skipping some on long windows so the labels stay readable
+    step = max(1, (len(years) + MAX_YEAR_TICKS - 1) // MAX_YEAR_TICKS)
+    ticks = list(years)[::step]
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(ticks, rotation=45)
+
+    # Dynamically set title and y-axis label based on pattern
+    ax.set_title(f"{PATTERN_LABELS.get(pattern)} in {city.capitalize()}", fontsize=15)
+    ax.set_xlabel("Year", fontsize=12)
+    ax.set_ylabel(PATTERN_LABELS.get(pattern, "Value"), fontsize=12)
+
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+    # Add text annotation with specific date
+    ax.text(0.05, 0.95, f"Data for {date_label}", transform=ax.transAxes, verticalalignment='top')